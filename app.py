@@ -1,24 +1,38 @@
 #Import libraries and modules
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, send_file
 import threading
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import Select
-from selenium.webdriver.common.keys import Keys
-from selenium.common.exceptions import TimeoutException, StaleElementReferenceException, WebDriverException, NoSuchElementException
 import time
 import os
 import imaplib
 import email
 import re
+import select
 import shutil
+import sqlite3
 import subprocess
+import sys
 from dotenv import load_dotenv
 from typing import Optional
-from groq import Groq
+from dataclasses import dataclass, asdict
+from html.parser import HTMLParser
+from collections import Counter
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import wraps
 import datetime
+import csv
+import base64
+import gzip
+import hashlib
+import heapq
+import io
+import itertools
 import json
+import queue
+import quopri
+import random
+import uuid
 import warnings
 
 # Flask app
@@ -29,6 +43,9 @@ app.secret_key = 'volza_secret_key'
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 app.config['TEMPLATES_AUTO_RELOAD'] = True
 
+# Server-Sent Events responses must not be buffered by proxies
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
 # Add this CORS handler
 @app.after_request
 def after_request(response):
@@ -37,21 +54,322 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
-# Global state (replaces Streamlit session_state)
-state = {
-    'logged_in': False,
-    'username': "",
-    'analysis_complete': False,
-    'chat_history': [],
-    'company_name': "",
-    'product_name': "",
-    'extracted_data': "",
-    'driver': None,
-    'browser_logged_in': False,
-    'wait': None,
-    'status': "",
-    'progress': 0
-}
+class VersionClock:
+    """Monotonic version counter shared by every ObservableState"""
+    
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.version = 0
+    
+    def tick(self) -> int:
+        """Advance the clock (caller holds cond)"""
+        self.version += 1
+        self.cond.notify_all()
+        return self.version
+    
+    def wait_for_change(self, since: int, timeout: float) -> int:
+        """Block until the version moves past `since` (or timeout); return current version"""
+        with self.cond:
+            if self.version <= since:
+                self.cond.wait(timeout=timeout)
+            return self.version
+
+
+status_clock = VersionClock()
+
+
+class ObservableState(dict):
+    """
+    dict that versions every write, so status clients can be pushed only
+    the keys that changed since the last version they saw.
+    All instances share status_clock, so versions are comparable across
+    the app state and every job.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._clock = status_clock
+        self._key_versions = {key: 0 for key in self}
+    
+    @property
+    def version(self) -> int:
+        return self._clock.version
+    
+    def __setitem__(self, key, value):
+        with self._clock.cond:
+            if key in self:
+                current = dict.__getitem__(self, key)
+                if current is value or (type(current) is type(value) and isinstance(value, (str, int, float, bool)) and current == value):
+                    return
+            super().__setitem__(key, value)
+            self._key_versions[key] = self._clock.tick()
+    
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+    
+    def changed_keys(self, since: int, keys) -> list:
+        """Keys (out of `keys`) written after version `since`"""
+        with self._clock.cond:
+            return [key for key in keys if self._key_versions.get(key, 0) > since]
+    
+    def wait_for_change(self, since: int, timeout: float) -> int:
+        return self._clock.wait_for_change(since, timeout)
+
+
+def initial_state() -> dict:
+    return {
+        'logged_in': False,
+        'username': "",
+        'browser_logged_in': False,
+        'current_job': None,
+    }
+
+
+# Global app state (replaces Streamlit session_state); per-analysis data lives in Job
+state = ObservableState(initial_state())
+
+# Keys pushed to the dashboard; report_streaming is derived from report_channel
+APP_STATUS_FIELDS = ('browser_logged_in', 'username')
+JOB_STATUS_FIELDS = ('job_id', 'status', 'progress', 'analysis_complete', 'company_name', 'product_name',
+                     'extracted_data', 'report_channel')
+
+# Distinguishes status versions across restarts (ETags / cursors)
+STATUS_BOOT_ID = hashlib.sha1(str(time.time()).encode()).hexdigest()[:8]
+
+def new_job_fields(job_id: Optional[str], product_name: str) -> dict:
+    return {
+        'job_id': job_id,
+        'status': "",
+        'progress': 0,
+        'analysis_complete': False,
+        'company_name': "",
+        'product_name': product_name,
+        'extracted_data': "",
+        'shipments': [],
+        'report_channel': None,
+        'chat_history': [],
+        'timings': {},
+        'readiness': [],
+        'trace': [],
+        'created_at': datetime.datetime.now().isoformat(),
+    }
+
+
+class Job(ObservableState):
+    """One analysis: its own status, progress, timings, result and chat thread"""
+    
+    def __init__(self, job_id: str, product_name: str):
+        super().__init__(new_job_fields(job_id, product_name))
+    
+    @property
+    def id(self) -> str:
+        return self['job_id']
+    
+    def set_timing(self, name: str, value):
+        timings = dict(self['timings'])
+        timings[name] = value
+        self['timings'] = timings
+    
+    def add_span(self, record: dict):
+        self['trace'] = self['trace'] + [record]
+    
+    def trace_report(self) -> dict:
+        """JSON trace: every span in start order plus total seconds per stage"""
+        totals = {}
+        for record in self['trace']:
+            totals[record['stage']] = round(totals.get(record['stage'], 0) + record['duration_s'], 3)
+        return {
+            'job_id': self['job_id'],
+            'company_name': self['company_name'],
+            'product_name': self['product_name'],
+            'created_at': self['created_at'],
+            'timings': self['timings'],
+            'stage_totals_s': totals,
+            'spans': sorted(self['trace'], key=lambda r: r['offset_s']),
+        }
+    
+    def summary(self) -> dict:
+        return {
+            'job_id': self['job_id'],
+            'status': self['status'],
+            'progress': self['progress'],
+            'analysis_complete': self['analysis_complete'],
+            'company_name': self['company_name'],
+            'product_name': self['product_name'],
+            'created_at': self['created_at'],
+            'timings': self['timings'],
+            'readiness': self['readiness'],
+        }
+
+
+class JobRegistry:
+    """Thread-safe registry of analysis jobs (oldest finished jobs are evicted)"""
+    
+    def __init__(self, max_jobs: int = 200):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def create(self, product_name: str) -> Job:
+        job = Job(uuid.uuid4().hex[:12], product_name)
+        with self._lock:
+            self._jobs[job.id] = job
+            if len(self._jobs) > self.max_jobs:
+                for job_id, old in list(self._jobs.items()):
+                    if len(self._jobs) <= self.max_jobs:
+                        break
+                    if old['analysis_complete'] or old['status'].startswith("❌"):
+                        del self._jobs[job_id]
+        return job
+    
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def list(self) -> list:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.summary() for job in reversed(jobs)]
+    
+    def clear(self):
+        with self._lock:
+            self._jobs.clear()
+
+
+job_registry = JobRegistry()
+
+
+def current_job() -> Optional[Job]:
+    """Job shown on the dashboard (the most recently started analysis)"""
+    return job_registry.get(state['current_job'])
+
+
+# ==================== STAGE TRACING & METRICS ====================
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with a single label"""
+    
+    def __init__(self, name: str, help_text: str, label: str, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, label_value: str, value: float):
+        with self._lock:
+            series = self._series.setdefault(label_value, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+    
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{self.label}="{label_value}",le="+Inf"}} {series["count"]}')
+                lines.append(f'{self.name}_sum{{{self.label}="{label_value}"}} {series["sum"]:.6f}')
+                lines.append(f'{self.name}_count{{{self.label}="{label_value}"}} {series["count"]}')
+        return lines
+
+
+class LabeledCounter:
+    """Prometheus-style counter with a single label"""
+    
+    def __init__(self, name: str, help_text: str, label: str):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self._values = Counter()
+        self._lock = threading.Lock()
+    
+    def inc(self, label_value: str, amount: int = 1):
+        with self._lock:
+            self._values[label_value] += amount
+    
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_value, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value}')
+        return lines
+
+
+stage_seconds = Histogram('volza_stage_duration_seconds', 'Time spent in each analysis stage.', 'stage', STAGE_BUCKETS)
+stage_errors = LabeledCounter('volza_stage_errors_total', 'Analysis stages that raised an exception.', 'stage')
+
+# The job whose stages are being traced on this thread (pool workers and batch LLM workers bind one)
+_trace = threading.local()
+
+
+@contextmanager
+def trace_job(job: Optional[Job]):
+    """Attribute spans recorded on this thread to job"""
+    previous = getattr(_trace, 'job', None)
+    _trace.job = job
+    try:
+        yield job
+    finally:
+        _trace.job = previous
+
+
+def record_span(stage: str, duration: float, started: Optional[float] = None, ok: bool = True, **attrs):
+    """Observe a finished stage and append it to the bound job's trace"""
+    stage_seconds.observe(stage, duration)
+    if not ok:
+        stage_errors.inc(stage)
+    
+    job = getattr(_trace, 'job', None)
+    if job is None:
+        return
+    started = started if started is not None else time.time() - duration
+    created = datetime.datetime.fromisoformat(job['created_at']).timestamp()
+    record = {
+        'stage': stage,
+        'start': datetime.datetime.fromtimestamp(started).isoformat(),
+        'offset_s': round(started - created, 3),
+        'duration_s': round(duration, 3),
+        'ok': ok,
+    }
+    record.update(attrs)
+    job.add_span(record)
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    """Time a block as one stage; the yielded dict can carry extra attributes"""
+    started = time.time()
+    clock = time.perf_counter()
+    ok = True
+    try:
+        yield attrs
+    except Exception:
+        ok = False
+        raise
+    finally:
+        record_span(stage, time.perf_counter() - clock, started=started, ok=ok, **attrs)
+
+
+def traced(stage: str):
+    """Decorator form of span()"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
 
 # Suppress warnings
 warnings.filterwarnings('ignore')
@@ -68,6 +386,7 @@ APP_PASSWORD = os.getenv("APP_PASSWORD")
 EMAIL = os.getenv("EMAIL")
 IMAP_SERVER = os.getenv("IMAP_SERVER", "imap.gmail.com")
 IMAP_PORT = os.getenv("IMAP_PORT", 993)
+IMAP_SSL = os.getenv("IMAP_SSL", "1") != "0"  # plain IMAP only for local test servers
 OTP_SENDER_EMAIL = os.getenv("OTP_SENDER_EMAIL", "noreply@volza.com")
 OTP_SUBJECT_KEYWORD = os.getenv("OTP_SUBJECT_KEYWORD", "Your OTP for Secure Login")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -82,27 +401,158 @@ if missing_creds:
     print(f"🚨 Missing credentials in .env: {', '.join(missing_creds)}")
     raise ValueError("Missing credentials")
 
-# Initialize Groq client
-client = Groq(api_key=GROQ_API_KEY)
+# ==================== LAZY HEAVY IMPORTS ====================
+# Selenium, the Groq SDK (httpx/pydantic) and requests account for most of the
+# cold start, so they load on first use instead of at import. bench/importtime.py
+# guards the budget; /healthz reports what has been loaded so far.
+PROCESS_STARTED = time.time()
+_import_lock = threading.Lock()
+client = None  # Groq client - created by get_groq_client()
+
+
+def get_groq_client():
+    """Create the Groq client on the first LLM call"""
+    global client
+    if client is None:
+        with _import_lock:
+            if client is None:
+                started = time.perf_counter()
+                from groq import Groq
+                client = Groq(api_key=GROQ_API_KEY)
+                print(f"📦 Groq SDK loaded in {time.perf_counter() - started:.2f}s")
+    return client
+
+
+def load_selenium():
+    """
+    Import selenium on first browser use and publish the names the automation
+    code refers to (By, EC, WebDriverWait, ...) as module globals.
+    """
+    if 'By' in globals():
+        return
+    with _import_lock:
+        if 'By' in globals():
+            return
+        started = time.perf_counter()
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait, Select
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.common.keys import Keys
+        from selenium.common.exceptions import TimeoutException, StaleElementReferenceException
+        globals().update(By=By, WebDriverWait=WebDriverWait, Select=Select, EC=EC, Keys=Keys,
+                         TimeoutException=TimeoutException,
+                         StaleElementReferenceException=StaleElementReferenceException)
+        print(f"📦 Selenium loaded in {time.perf_counter() - started:.2f}s")
 
 # ==================== CONFIGURATION ====================
-HISTORY_FILE = "company_analyses.json"
+HISTORY_FILE = "company_analyses.json"  # legacy, migrated into HISTORY_DB on first use
+HISTORY_DB = "company_analyses.db"
+HISTORY_MATCH_THRESHOLD = float(os.getenv("HISTORY_MATCH_THRESHOLD", 0.85))  # trigram similarity to suggest a history entry
 DATA_FILE = "data.txt"
+SHIPMENTS_FILE = "shipments.json"
 EXTRACTED_DATA_FILE = "extracted_data.txt"
+CAPTURE_DIR = "captures"  # append-only JSONL per capture, written page by page
+CAPTURE_ARCHIVE_DIR = "capture_archive"  # gzip blobs named by SHA-256, indexed in HISTORY_DB
+CAPTURE_ARCHIVE_LEVEL = int(os.getenv("CAPTURE_ARCHIVE_LEVEL", 6))
 # 🚀 FASTER MODEL
 LLAMA4_MODEL = "moonshotai/kimi-k2-instruct-0905"
 
+# ⚡ LLM RESPONSE CACHE
+LLM_CACHE_DIR = "llm_cache"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))
+LLM_CACHE_MAX_ITEMS = int(os.getenv("LLM_CACHE_MAX_ITEMS", 256))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 50 * 1024 * 1024))
+
+# 🚦 GROQ SCHEDULER (shared request/token budgets; defaults suit the free tier)
+GROQ_RPM = int(os.getenv("GROQ_RPM", 30))
+GROQ_TPM = int(os.getenv("GROQ_TPM", 10000))
+GROQ_MAX_CONCURRENCY = max(1, int(os.getenv("GROQ_MAX_CONCURRENCY", 4)))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", 4))
+
+# 🧩 MAP-REDUCE EXTRACTION (page-text fallback when no table rows were captured)
+EXTRACTION_CHUNK_TOKENS = int(os.getenv("EXTRACTION_CHUNK_TOKENS", 3000))
+EXTRACTION_OUTPUT_TOKENS = int(os.getenv("EXTRACTION_OUTPUT_TOKENS", 4000))
+EXTRACTION_MAX_PARALLEL = max(1, int(os.getenv("EXTRACTION_MAX_PARALLEL", 4)))
+CHARS_PER_TOKEN = 4  # rough estimate for English/number-heavy page text
+
+# 📄 MULTI-PAGE RESULT CRAWL (1 page = old first-page-only capture)
+CRAWL_MAX_PAGES = max(1, int(os.getenv("CRAWL_MAX_PAGES", 50)))
+CRAWL_MAX_ROWS = max(1, int(os.getenv("CRAWL_MAX_ROWS", 10000)))
+CRAWL_PAGE_TIMEOUT = float(os.getenv("CRAWL_PAGE_TIMEOUT", 20))
+
+# 🔁 INCREMENTAL RE-ANALYSIS (companies already in history only search from their last analysis)
+FULL_SEARCH_START_DATE = "01/01/2019"
+INCREMENTAL_SEARCH = os.getenv("INCREMENTAL_SEARCH", "1") != "0"
+INCREMENTAL_OVERLAP_DAYS = int(os.getenv("INCREMENTAL_OVERLAP_DAYS", 30))  # Volza publishes shipments with a lag
+
+# 🔎 RAW CAPTURE RETRIEVAL FOR CHAT (needs sentence-transformers + chromadb; skipped if missing)
+VECTOR_INDEX_DIR = "vector_index"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 8))
+RETRIEVAL_ENABLED = os.getenv("RETRIEVAL_ENABLED", "1") != "0"
+
+# 🚀 BROWSER POOL (one logged-in Chrome per slot, separate profiles)
+BROWSER_POOL_SIZE = max(1, int(os.getenv("BROWSER_POOL_SIZE", 1)))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 10))
+
+# 🧭 CHROME / CHROMEDRIVER
+# Chrome's new headless mode for batch sessions only - interactive analyses need a window to type the company into
+CHROME_HEADLESS = os.getenv("CHROME_HEADLESS", "0").lower() in ("1", "true", "yes", "new")
+CHROME_BINARY = os.getenv("CHROME_BINARY", "")  # skip auto-detection
+IMPLICIT_WAIT = 15  # seconds find_element waits for a missing element; see no_implicit_wait()
+CHROMEDRIVER_CACHE_DIR = os.getenv("CHROMEDRIVER_CACHE_DIR") or os.path.join(
+    os.getenv("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache"), "volza_chromedriver"
+)
+
+# 📦 BATCH PIPELINE
+BATCH_LLM_WORKERS = max(1, int(os.getenv("BATCH_LLM_WORKERS", 2)))
+BATCH_LLM_QUEUE_SIZE = int(os.getenv("BATCH_LLM_QUEUE_SIZE", 4))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 1000))
+BATCH_RESULTS_DIR = "batch_results"
+VOLZA_SESSION_DIR = "volza_sessions"
+VOLZA_BASE_URL = os.getenv("VOLZA_BASE_URL", "https://app.volza.com").rstrip("/")  # bench/e2e.py points this at a local fake
+
+# 🔌 SEARCH TRANSPORT: "browser" scrapes the rendered table, "http" calls the search API with the browser's cookies
+VOLZA_TRANSPORT = os.getenv("VOLZA_TRANSPORT", "browser").lower()
+VOLZA_API_BASE = os.getenv("VOLZA_API_BASE", VOLZA_BASE_URL)
+VOLZA_SEARCH_PATH = os.getenv("VOLZA_SEARCH_PATH", "/api/search/global")
+VOLZA_AUTH_STORAGE_KEY = os.getenv("VOLZA_AUTH_STORAGE_KEY", "")  # localStorage key holding a bearer token, if any
+VOLZA_API_PAGE_SIZE = int(os.getenv("VOLZA_API_PAGE_SIZE", 100))
+VOLZA_API_MAX_PAGES = int(os.getenv("VOLZA_API_MAX_PAGES", 10))
+VOLZA_API_POOL_SIZE = int(os.getenv("VOLZA_API_POOL_SIZE", 10))
+
+# 📧 OTP WATCHER (persistent IMAP connection, IDLE push)
+OTP_WAIT_TIMEOUT = float(os.getenv("OTP_WAIT_TIMEOUT", 45))
+OTP_IDLE_SLICE = 15  # re-check between IDLE rounds in case a push was missed
+
+# ⏱️ PAGE READINESS (replaces fixed sleeps)
+READINESS_QUIET_MS = int(os.getenv("READINESS_QUIET_MS", 250))
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", 10))
+
 print(f"✅ Credentials loaded: {VALID_USERNAME[:4]}****")
 
 # ==================== AUTO-UPDATE CHROMEDRIVER FUNCTION ====================
-def get_chrome_version():
-    """Detect installed Chrome version on Windows"""
+# uc.Chrome() without a driver path downloads and patches a fresh chromedriver on
+# every launch. Patched binaries are kept per Chrome major version instead, so only
+# the first launch after a Chrome update pays for the download.
+CHROME_CANDIDATES = {
+    'linux': ("google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome"),
+    'darwin': ("/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+               "/Applications/Chromium.app/Contents/MacOS/Chromium",
+               os.path.expanduser("~/Applications/Google Chrome.app/Contents/MacOS/Google Chrome")),
+}
+_chrome_version = None
+_driver_cache_lock = threading.Lock()
+
+
+def _windows_chrome_version() -> Optional[str]:
     try:
         import winreg
         key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, r"Software\Google\Chrome\BLBeacon")
         version, _ = winreg.QueryValueEx(key, "version")
         winreg.CloseKey(key)
-        return version.split('.')[0]
+        return version
     except:
         pass
     
@@ -112,41 +562,122 @@ def get_chrome_version():
             capture_output=True, text=True
         )
         if result.returncode == 0:
-            version = result.stdout.strip().split()[-1]
-            return version.split('.')[0]
+            return result.stdout.strip().split()[-1]
     except:
         pass
-    
     return None
 
-def clear_uc_cache():
-    """Clear undetected_chromedriver cache to force fresh driver download"""
-    cache_paths = [
-        os.path.join(os.path.expanduser("~"), "AppData", "Roaming", "undetected_chromedriver"),
-        os.path.join(os.path.expanduser("~"), ".local", "share", "undetected_chromedriver"),
-        os.path.join(os.path.expanduser("~"), "appdata", "roaming", "undetected_chromedriver"),
-    ]
+
+def _binary_chrome_version(binary: str) -> Optional[str]:
+    """Version of a Chrome binary; macOS app bundles are read from Info.plist without launching"""
+    if ".app/Contents/MacOS/" in binary:
+        import plistlib
+        try:
+            with open(binary.split("/Contents/MacOS/")[0] + "/Contents/Info.plist", "rb") as f:
+                return plistlib.load(f).get("CFBundleShortVersionString")
+        except (OSError, plistlib.InvalidFileException):
+            pass
+    try:
+        result = subprocess.run([binary, "--version"], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    match = re.search(r'(\d+\.\d+\.\d+\.\d+)', result.stdout)
+    return match.group(1) if result.returncode == 0 and match else None
+
+
+def get_chrome_version(refresh: bool = False):
+    """Detect the installed Chrome major version (Windows registry, Linux PATH, macOS app bundle)"""
+    global _chrome_version
+    if _chrome_version is not None and not refresh:
+        return _chrome_version
     
-    for cache_path in cache_paths:
-        if os.path.exists(cache_path):
-            try:
-                shutil.rmtree(cache_path)
-                print(f"✅ Cleared UC cache: {cache_path}")
-            except Exception as e:
-                print(f"⚠️ Could not clear cache {cache_path}: {e}")
+    version = None
+    if CHROME_BINARY:
+        version = _binary_chrome_version(CHROME_BINARY)
+    elif os.name == 'nt':
+        version = _windows_chrome_version()
+    else:
+        platform = 'darwin' if sys.platform == 'darwin' else 'linux'
+        for candidate in CHROME_CANDIDATES[platform]:
+            binary = candidate if os.path.isabs(candidate) else shutil.which(candidate)
+            if binary and os.path.exists(binary):
+                version = _binary_chrome_version(binary)
+                if version:
+                    break
+    
+    _chrome_version = version.split('.')[0] if version else None
+    return _chrome_version
+
+
+def cached_driver_path(major: str) -> str:
+    suffix = ".exe" if os.name == 'nt' else ""
+    return os.path.join(CHROMEDRIVER_CACHE_DIR, f"chromedriver-{major}{suffix}")
+
+
+def store_patched_driver(source: str, major: str) -> Optional[str]:
+    """Copy a patched chromedriver into the cache (atomically, so parallel launches never see half a file)"""
+    target = cached_driver_path(major)
+    try:
+        os.makedirs(CHROMEDRIVER_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        shutil.copy2(source, tmp_path)
+        os.chmod(tmp_path, 0o755)
+        os.replace(tmp_path, target)
+        return target
+    except OSError as e:
+        print(f"⚠️ Could not cache ChromeDriver {major}: {e}")
+        return None
+
+
+def resolve_chromedriver(major: Optional[str]) -> tuple:
+    """(driver path or None, 'cached' | 'patched' | 'auto') - downloads and patches at most once per major"""
+    if not major:
+        return None, 'auto'
+    path = cached_driver_path(major)
+    if os.path.exists(path):
+        return path, 'cached'
+    
+    import undetected_chromedriver as uc
+    with _driver_cache_lock:
+        if os.path.exists(path):
+            return path, 'cached'
+        print(f"⬇️ Downloading and patching ChromeDriver {major} (once per Chrome version)...")
+        patcher = uc.Patcher(version_main=int(major))
+        patcher.auto()
+        cached = store_patched_driver(patcher.executable_path, major)
+        return (cached, 'patched') if cached else (patcher.executable_path, 'patched')
+
+
+def invalidate_driver_cache(major: Optional[str]):
+    """Drop only the cached driver for this Chrome version (e.g. after Chrome updated underneath us)"""
+    if not major:
+        return
+    try:
+        os.remove(cached_driver_path(major))
+        print(f"🗑️ Removed cached ChromeDriver {major}")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"⚠️ Could not remove cached ChromeDriver {major}: {e}")
+
 
-def get_uc_driver_with_auto_update(chrome_options=None, max_retries=2):
+def get_uc_driver_with_auto_update(chrome_options=None, max_retries=2, user_data_dir=None, info: Optional[dict] = None,
+                                   headless: bool = False):
     """
     Get undetected_chromedriver with automatic version handling.
-    🚀 OPTIMIZED: Persistent profile + No images
+    🚀 OPTIMIZED: Persistent profile + No images + cached patched driver per Chrome version
+    info (optional dict) receives chrome_version, driver source and resolve/launch seconds.
     """
+    global _chrome_version
+    load_selenium()
     import undetected_chromedriver as uc
     
     if chrome_options is None:
         chrome_options = uc.ChromeOptions()
     
     # 🚀 PERSISTENT PROFILE (saves login forever)
-    user_data_dir = os.path.join(os.getcwd(), "chrome_profile")
+    if user_data_dir is None:
+        user_data_dir = os.path.join(os.getcwd(), "chrome_profile")
     chrome_options.add_argument(f"--user-data-dir={user_data_dir}")
     chrome_options.add_argument("--profile-directory=Default")
     
@@ -159,20 +690,37 @@ def get_uc_driver_with_auto_update(chrome_options=None, max_retries=2):
     
     chrome_options.add_argument("--disable-blink-features=AutomationControlled")
     
-    chrome_version = get_chrome_version()
-    print(f"🔍 Detected Chrome version: {chrome_version}")
+    info = {} if info is None else info
     
     for attempt in range(max_retries):
+        started = time.perf_counter()
+        chrome_version = get_chrome_version(refresh=attempt > 0)
+        print(f"🔍 Detected Chrome version: {chrome_version}")
         try:
-            if chrome_version:
-                driver = uc.Chrome(
-                    options=chrome_options,
-                    version_main=int(chrome_version)
-                )
-            else:
-                driver = uc.Chrome(options=chrome_options)
+            driver_path, source = resolve_chromedriver(chrome_version)
+            resolved = time.perf_counter()
+            
+            driver = uc.Chrome(
+                options=chrome_options,
+                driver_executable_path=driver_path,
+                browser_executable_path=CHROME_BINARY or None,
+                version_main=int(chrome_version) if chrome_version else None,
+                headless=headless,
+            )
+            launched = time.perf_counter()
             
-            print(f"✅ ChromeDriver initialized successfully!")
+            if source == 'auto':
+                # Version detection failed - learn it from the browser and cache uc's driver for the next launch
+                major = str(driver.capabilities.get('browserVersion', '')).split('.')[0]
+                if major.isdigit() and getattr(driver, 'patcher', None) is not None:
+                    _chrome_version = major
+                    store_patched_driver(driver.patcher.executable_path, major)
+            
+            info.update(chrome_version=chrome_version, driver=source, headless=headless,
+                        resolve_s=round(resolved - started, 3), launch_s=round(launched - resolved, 3))
+            print(f"✅ ChromeDriver initialized in {launched - started:.1f}s "
+                  f"(driver {source} {resolved - started:.1f}s, Chrome launch {launched - resolved:.1f}s"
+                  f"{', headless' if headless else ''})")
             return driver
             
         except Exception as e:
@@ -180,13 +728,11 @@ def get_uc_driver_with_auto_update(chrome_options=None, max_retries=2):
             
             if "version" in error_msg or "chromedriver" in error_msg or "session not created" in error_msg:
                 print(f"⚠️ Attempt {attempt + 1}: ChromeDriver version mismatch detected")
-                print(f"🔄 Clearing cache and retrying...")
-                clear_uc_cache()
-                time.sleep(2)
-                
                 if attempt == max_retries - 1:
                     print(f"❌ Failed after {max_retries} attempts: {e}")
                     raise
+                print(f"🔄 Re-detecting Chrome and re-patching the driver for this version only...")
+                invalidate_driver_cache(chrome_version)
             else:
                 raise
     
@@ -207,56 +753,495 @@ def scream_message(message):
             pass
 
 
-def load_history():
-    """Load analysis history from JSON"""
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+# ==================== HISTORY STORE (SQLite) ====================
+def normalize_company_key(company_name: str) -> str:
+    """History key: lower-case with collapsed whitespace"""
+    return " ".join((company_name or "").lower().split())
 
 
-def save_history(history):
-    """Save analysis history to JSON"""
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(history, f, indent=2, ensure_ascii=False)
+# Trailing tokens that do not tell companies apart ("ABC Chemicals Pvt. Ltd." == "abc chemicals").
+# Words that can be part of the name ("International") and two-letter forms that double as
+# initials or words ("AS", "AB") are left out: a canonical match decides company identity.
+LEGAL_SUFFIXES = {
+    'pvt', 'private', 'ltd', 'limited', 'llp', 'llc', 'inc', 'incorporated', 'corp', 'corporation',
+    'co', 'company', 'plc', 'pte', 'pty', 'gmbh', 'srl', 'spa', 'sdn', 'bhd', 'jsc', 'ooo',
+}
 
 
-def save_company_analysis(company_name: str, product_name: str, extracted_data: str):
-    """Save company analysis to history"""
-    history = load_history()
+def canonical_company_name(company_name: str) -> str:
+    """Fuzzy-match form: lower-case, no punctuation, no M/s prefix or legal suffixes"""
+    text = (company_name or "").lower().replace("&", " and ")
+    tokens = re.sub(r'[\W_]+', ' ', text).split()
+    if tokens[:2] == ['m', 's']:
+        tokens = tokens[2:]
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens.pop()
+    if len(tokens) > 1 and tokens[-1] == 'and':  # "... & Co" leaves a dangling "and"
+        tokens.pop()
+    return " ".join(tokens)
+
+
+class CompanyNameIndex:
+    """
+    In-memory trigram index over the canonical names of analysed companies.
+    Lookups only score entries sharing a trigram with the query, so ranking
+    stays in the millisecond range with tens of thousands of names.
+    """
     
-    history[company_name.lower()] = {
-        "company_name": company_name,
-        "product_searched": product_name,
-        "analysis_date": datetime.datetime.now().isoformat(),
-        "extracted_data": extracted_data
-    }
+    def __init__(self):
+        self._entries = {}   # company_key -> entry dict
+        self._postings = {}  # trigram -> set of company_keys
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def trigrams(canonical: str) -> set:
+        padded = f"  {canonical} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def add(self, company_key: str, company_name: str, product_searched: str, analysis_date: str):
+        canonical = canonical_company_name(company_name)
+        grams = self.trigrams(canonical)
+        with self._lock:
+            old = self._entries.get(company_key)
+            if old is not None:
+                for gram in old['grams']:
+                    self._postings[gram].discard(company_key)
+            self._entries[company_key] = {
+                'company_name': company_name, 'product_searched': product_searched,
+                'analysis_date': analysis_date, 'canonical': canonical, 'grams': grams,
+            }
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(company_key)
+    
+    def exact(self, query: str) -> Optional[str]:
+        """Most recently analysed company with the same canonical name as query, if any"""
+        canonical = canonical_company_name(query)
+        gram = min(self.trigrams(canonical))  # identical names share every trigram
+        with self._lock:
+            matches = [
+                (entry['analysis_date'], entry['company_name'])
+                for entry in (self._entries[key] for key in self._postings.get(gram, ()))
+                if entry['canonical'] == canonical
+            ]
+        return max(matches)[1] if matches else None
+    
+    def search(self, query: str, limit: int = 10, min_score: float = 0.3) -> list:
+        """
+        Best matches as dicts with a 0-1 score: 1.0 for the same canonical name, otherwise
+        the mean of trigram Jaccard similarity and the share of the query's trigrams matched
+        (so partial names like "kemya" still rank)
+        """
+        canonical = canonical_company_name(query)
+        grams = self.trigrams(canonical)
+        with self._lock:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+            scored = []
+            for company_key, overlap in shared.items():
+                entry = self._entries[company_key]
+                if entry['canonical'] == canonical:
+                    score = 1.0
+                else:
+                    score = (overlap / (len(grams) + len(entry['grams']) - overlap) + overlap / len(grams)) / 2
+                if score >= min_score:
+                    scored.append((score, entry['analysis_date'], company_key))
+            best = heapq.nlargest(limit, scored)
+            return [
+                {'company_name': self._entries[key]['company_name'],
+                 'product_searched': self._entries[key]['product_searched'],
+                 'analysis_date': date, 'score': round(score, 3)}
+                for score, date, key in best
+            ]
+
+
+class HistoryStore:
+    """
+    Analysis history in SQLite (WAL mode), indexed on normalised company
+    name, product and analysis date. One row per company, like the old
+    JSON file keyed by company_name.lower().
+    """
+    
+    def __init__(self, db_path: str, legacy_json_path: Optional[str] = None):
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._opened = False  # schema created and legacy JSON migrated
+        self._open_lock = threading.Lock()
+        self._names = None  # CompanyNameIndex, built on first lookup
+        self._names_lock = threading.Lock()
+    
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._open()
+        return conn
+    
+    def _open(self):
+        """Create the schema and migrate the legacy JSON on first use, so importing app creates no DB"""
+        with self._open_lock:
+            if self._opened:
+                return
+            self._init_schema()
+            if self.legacy_json_path:
+                self.migrate_json(self.legacy_json_path)
+            self._opened = True
+    
+    def _init_schema(self):
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    company_key TEXT NOT NULL UNIQUE,
+                    company_name TEXT NOT NULL,
+                    product_searched TEXT NOT NULL DEFAULT '',
+                    product_key TEXT NOT NULL DEFAULT '',
+                    analysis_date TEXT NOT NULL,
+                    extracted_data TEXT NOT NULL DEFAULT ''
+                );
+                CREATE INDEX IF NOT EXISTS idx_analyses_product ON analyses(product_key);
+                CREATE INDEX IF NOT EXISTS idx_analyses_date ON analyses(analysis_date);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                CREATE TABLE IF NOT EXISTS shipments (
+                    company_key TEXT NOT NULL,
+                    row_key TEXT NOT NULL,
+                    shipment_date TEXT,
+                    shipper TEXT NOT NULL DEFAULT '',
+                    consignee TEXT NOT NULL DEFAULT '',
+                    country TEXT NOT NULL DEFAULT '',
+                    hs_code TEXT NOT NULL DEFAULT '',
+                    quantity REAL,
+                    value REAL,
+                    PRIMARY KEY (company_key, row_key)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_shipments_date ON shipments(company_key, shipment_date);
+                CREATE TABLE IF NOT EXISTS capture_blobs (
+                    digest TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    stored_size INTEGER NOT NULL
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS captures (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    company_key TEXT NOT NULL,
+                    company_name TEXT NOT NULL,
+                    product_key TEXT NOT NULL DEFAULT '',
+                    captured_at TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    digest TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_captures_company ON captures(company_key, captured_at);
+            """)
+    
+    def migrate_json(self, json_path: str):
+        """One-time import of the legacy company_analyses.json"""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+            return
+        
+        history = {}
+        if os.path.exists(json_path):
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    history = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Could not read {json_path} for migration: {e}")
+                return
+        
+        rows = []
+        for key, entry in history.items():
+            company_name = entry.get("company_name") or key
+            product = entry.get("product_searched") or ""
+            rows.append((
+                normalize_company_key(company_name), company_name, product, product.strip().lower(),
+                entry.get("analysis_date") or datetime.datetime.now().isoformat(),
+                entry.get("extracted_data") or "",
+            ))
+        
+        with self._write_lock, conn:
+            conn.executemany("""
+                INSERT INTO analyses (company_key, company_name, product_searched, product_key, analysis_date, extracted_data)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(company_key) DO UPDATE SET
+                    company_name = excluded.company_name,
+                    product_searched = excluded.product_searched,
+                    product_key = excluded.product_key,
+                    analysis_date = excluded.analysis_date,
+                    extracted_data = excluded.extracted_data
+                WHERE excluded.analysis_date > analyses.analysis_date
+            """, rows)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                         (datetime.datetime.now().isoformat(),))
+        
+        if rows:
+            print(f"✅ Migrated {len(rows)} analyses from {json_path} to {self.db_path}")
+    
+    def save(self, company_name: str, product_name: str, extracted_data: str):
+        analysis_date = datetime.datetime.now().isoformat()
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.execute("""
+                INSERT INTO analyses (company_key, company_name, product_searched, product_key, analysis_date, extracted_data)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(company_key) DO UPDATE SET
+                    company_name = excluded.company_name,
+                    product_searched = excluded.product_searched,
+                    product_key = excluded.product_key,
+                    analysis_date = excluded.analysis_date,
+                    extracted_data = excluded.extracted_data
+            """, (
+                normalize_company_key(company_name), company_name, product_name,
+                (product_name or "").strip().lower(), analysis_date, extracted_data,
+            ))
+        with self._names_lock:
+            if self._names is not None:
+                self._names.add(normalize_company_key(company_name), company_name, product_name, analysis_date)
+    
+    def name_index(self) -> CompanyNameIndex:
+        with self._names_lock:
+            if self._names is None:
+                started = time.time()
+                index = CompanyNameIndex()
+                rows = self._conn().execute(
+                    "SELECT company_key, company_name, product_searched, analysis_date FROM analyses"
+                )
+                for row in rows:
+                    index.add(row['company_key'], row['company_name'], row['product_searched'], row['analysis_date'])
+                self._names = index
+                print(f"🔎 Indexed {len(index)} company names in {time.time() - started:.2f}s")
+            return self._names
+    
+    def search_names(self, query: str, limit: int = 10) -> list:
+        return self.name_index().search(query, limit=limit)
+    
+    def find_name(self, company_name: str) -> Optional[str]:
+        """Stored spelling of the same company (identical canonical name), if analysed before"""
+        return self.name_index().exact(company_name)
+    
+    @staticmethod
+    def _entry(row) -> dict:
+        return {
+            "company_name": row["company_name"],
+            "product_searched": row["product_searched"],
+            "analysis_date": row["analysis_date"],
+            "extracted_data": row["extracted_data"],
+        }
+    
+    def load(self, company_name: str) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT * FROM analyses WHERE company_key = ?", (normalize_company_key(company_name),)
+        ).fetchone()
+        return self._entry(row) if row else None
+    
+    def recent(self, limit: int = 5) -> list:
+        rows = self._conn().execute(
+            "SELECT * FROM analyses ORDER BY analysis_date DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [self._entry(row) for row in rows]
+    
+    def by_product(self, product_name: str, limit: int = 50) -> list:
+        rows = self._conn().execute(
+            "SELECT * FROM analyses WHERE product_key = ? ORDER BY analysis_date DESC LIMIT ?",
+            ((product_name or "").strip().lower(), limit)
+        ).fetchall()
+        return [self._entry(row) for row in rows]
+    
+    def merge_shipments(self, company_name: str, records, replace: bool = False) -> int:
+        """
+        Add captured shipments to the company's stored set, skipping rows already stored;
+        replace=True drops the stored set first (full search). Returns the number of new rows.
+        """
+        company_key = normalize_company_key(company_name)
+        conn = self._conn()
+        with self._write_lock, conn:
+            if replace:
+                conn.execute("DELETE FROM shipments WHERE company_key = ?", (company_key,))
+            before = conn.total_changes
+            conn.executemany("""
+                INSERT OR IGNORE INTO shipments
+                    (company_key, row_key, shipment_date, shipper, consignee, country, hs_code, quantity, value)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                (company_key, row_key, r.date, r.shipper, r.consignee, r.country, r.hs_code, r.quantity, r.value)
+                for row_key, r in shipment_row_keys(records)
+            ))
+            return conn.total_changes - before
+    
+    def shipment_count(self, company_name: str) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM shipments WHERE company_key = ?", (normalize_company_key(company_name),)
+        ).fetchone()[0]
+    
+    def iter_shipments(self, company_name: str):
+        cursor = self._conn().execute("""
+            SELECT shipper, consignee, country, shipment_date, hs_code, quantity, value
+            FROM shipments WHERE company_key = ? ORDER BY shipment_date, row_key
+        """, (normalize_company_key(company_name),))
+        for row in cursor:
+            yield ShipmentRecord(row['shipper'], row['consignee'], row['country'], row['shipment_date'],
+                                 row['hs_code'], row['quantity'], row['value'])
+    
+    def add_capture(self, company_name: str, product_name: str, kind: str, digest: str, size: int, stored_size: int):
+        conn = self._conn()
+        with self._write_lock, conn:
+            conn.execute("INSERT OR IGNORE INTO capture_blobs (digest, size, stored_size) VALUES (?, ?, ?)",
+                         (digest, size, stored_size))
+            conn.execute("""
+                INSERT INTO captures (company_key, company_name, product_key, captured_at, kind, digest)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (
+                normalize_company_key(company_name), company_name, (product_name or "").strip().lower(),
+                datetime.datetime.now().isoformat(), kind, digest,
+            ))
+    
+    def captures(self, company_name: str = "", product_name: str = "", limit: int = 50) -> list:
+        """Archived captures, newest first, optionally for one company and/or product"""
+        where, params = [], []
+        if company_name:
+            where.append("c.company_key = ?")
+            params.append(normalize_company_key(company_name))
+        if product_name:
+            where.append("c.product_key = ?")
+            params.append(product_name.strip().lower())
+        rows = self._conn().execute(f"""
+            SELECT c.company_name, c.product_key, c.captured_at, c.kind, c.digest, b.size, b.stored_size
+            FROM captures c JOIN capture_blobs b ON b.digest = c.digest
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY c.captured_at DESC LIMIT ?
+        """, params + [limit]).fetchall()
+        return [dict(row) for row in rows]
+    
+    def archive_stats(self) -> dict:
+        blobs, size, stored_size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM capture_blobs"
+        ).fetchone()
+        captures = self._conn().execute("SELECT COUNT(*) FROM captures").fetchone()[0]
+        return {'captures': captures, 'blobs': blobs, 'bytes': size, 'stored_bytes': stored_size}
+
+
+def shipment_row_keys(records):
+    """
+    (row_key, record) pairs: a hash of the row's fields plus its occurrence number,
+    so overlapping captures dedupe while identical shipments within one capture are kept
+    """
+    seen = Counter()
+    for r in records:
+        digest = hashlib.sha1(json.dumps(r.to_dict(), sort_keys=True).encode()).hexdigest()[:20]
+        yield f"{digest}:{seen[digest]}", r
+        seen[digest] += 1
+
+
+class StoredShipments:
+    """Re-iterable view of a company's stored shipments, streamed from SQLite"""
     
-    save_history(history)
+    def __init__(self, store: HistoryStore, company_name: str):
+        self.store = store
+        self.company_name = company_name
+    
+    def __iter__(self):
+        return self.store.iter_shipments(self.company_name)
+    
+    def __len__(self) -> int:
+        return self.store.shipment_count(self.company_name)
+
+
+history_store = HistoryStore(HISTORY_DB, legacy_json_path=HISTORY_FILE)
+
+
+@traced('history_save')
+def save_company_analysis(company_name: str, product_name: str, extracted_data: str):
+    """Save company analysis to history"""
+    history_store.save(company_name, product_name, extracted_data)
+    capture_archive.add(company_name, product_name, 'report', [extracted_data])
     print(f"✅ Saved analysis for {company_name}")
 
 
 def load_company_analysis(company_name: str) -> dict:
-    """Load previous analysis if exists"""
-    history = load_history()
-    return history.get(company_name.lower())
+    """
+    Load previous analysis if exists - exact key first, then the same canonical name.
+    Merely similar names are only suggested: they may well be different companies.
+    """
+    entry = history_store.load(company_name)
+    if entry is not None or not company_name or company_name.startswith("Company_"):
+        return entry
+    
+    stored_name = history_store.find_name(company_name)
+    if stored_name:
+        print(f"🔎 '{company_name}' is history entry '{stored_name}'")
+        return history_store.load(stored_name)
+    
+    matches = history_store.search_names(company_name, limit=1)
+    if matches and matches[0]['score'] >= HISTORY_MATCH_THRESHOLD:
+        print(f"💡 No history for '{company_name}' - did you mean '{matches[0]['company_name']}' "
+              f"(score {matches[0]['score']})?")
+    return None
+
 
+def known_company_name(company_name: str) -> str:
+    """History spelling of a company analysed before, so re-analyses update one entry"""
+    previous = load_company_analysis(company_name)
+    return previous['company_name'] if previous else company_name
 
-def reset_zoom(driver):
-    """Reset page zoom to 100% safely (used after zooming out for capture)."""
+
+def incremental_start_date(company_name: str) -> Optional[str]:
+    """
+    Search start date (DD/MM/YYYY) for a company analysed before whose shipments are stored:
+    its last analysis date minus INCREMENTAL_OVERLAP_DAYS. None means a full search.
+    """
+    if not INCREMENTAL_SEARCH or not company_name or company_name.startswith("Company_"):
+        return None
+    previous = load_company_analysis(company_name)
+    if not previous or not history_store.shipment_count(previous['company_name']):
+        return None
     try:
-        driver.execute_script("document.body.style.zoom='100%';")
-        driver.execute_script("""
-            if (document.documentElement && document.documentElement.style) {
-                document.documentElement.style.zoom = '100%';
-            }
-        """)
-        time.sleep(0.3)
-    except Exception as e:
-        print(f"⚠️ reset_zoom failed: {e}")
+        last_run = datetime.datetime.fromisoformat(previous['analysis_date']).date()
+    except ValueError:
+        return None
+    start = last_run - datetime.timedelta(days=INCREMENTAL_OVERLAP_DAYS)
+    return start.strftime('%d/%m/%Y')
+
+
+def merge_captured_shipments(company_name: str, records, start_date: Optional[str]):
+    """
+    Store a capture in history. A full search replaces the company's stored shipments;
+    an incremental one is merged in. Returns the company's stored set for analysis.
+    """
+    if start_date is None:
+        if not records:
+            return records
+        history_store.merge_shipments(company_name, records, replace=True)
+        return StoredShipments(history_store, company_name)
+    
+    added = history_store.merge_shipments(company_name, records)
+    merged = StoredShipments(history_store, company_name)
+    print(f"🔁 Incremental search since {start_date}: {added} new of {len(records)} captured, "
+          f"{len(merged)} shipments in total")
+    return merged
 
 
 # ==================== EXPERT ERROR HANDLING WRAPPERS ====================
+@contextmanager
+def no_implicit_wait(driver):
+    """Presence checks and polling loops: a missing element returns at once instead of after IMPLICIT_WAIT"""
+    driver.implicitly_wait(0)
+    try:
+        yield driver
+    finally:
+        driver.implicitly_wait(IMPLICIT_WAIT)
+
+
 def safe_click(driver, by, value, wait_time=30, description="element"):
     """Expert-level safe click with multiple retry strategies"""
     wait = WebDriverWait(driver, wait_time)
@@ -265,8 +1250,7 @@ def safe_click(driver, by, value, wait_time=30, description="element"):
         try:
             print(f"Attempt {attempt + 1}: Finding {description}...")
             element = wait.until(EC.element_to_be_clickable((by, value)))
-            driver.execute_script("arguments[0].scrollIntoView(true);", element)
-            time.sleep(0.3)
+            driver.execute_script("arguments[0].scrollIntoView({block: 'center', behavior: 'instant'});", element)
             
             try:
                 element.click()
@@ -303,7 +1287,6 @@ def safe_find_and_send(driver, by, value, text, wait_time=30, description="input
             print(f"Attempt {attempt + 1}: Finding {description}...")
             element = wait.until(EC.presence_of_element_located((by, value)))
             element.clear()
-            time.sleep(0.2)
             element.send_keys(text)
             print(f"✅ Sent text to {description}")
             return element
@@ -340,102 +1323,186 @@ def wait_for_url_change(driver, old_url, timeout=60, description="URL change"):
     raise TimeoutException(f"Timeout waiting for {description}")
 
 
-# ==================== IMPROVED COMPANY NAME EXTRACTION ====================
-def extract_company_name_from_page(driver):
-    """Extract company name using multiple strategies"""
-    company_name = None
-    
+# ==================== PAGE READINESS ====================
+# Installed once per document: counts in-flight fetch/XHR calls and records the
+# last DOM mutation, then resolves when the page is complete, the network is idle,
+# the DOM has been quiet for quiet_ms and the optional XPath target is visible.
+READINESS_SCRIPT = """
+var xpath = arguments[0], quietMs = arguments[1], timeoutMs = arguments[2];
+var done = arguments[arguments.length - 1];
+var net = window.__volzaNet;
+if (!net) {
+    net = window.__volzaNet = {inflight: 0, lastMutation: Date.now()};
+    var settle = function () { net.inflight = Math.max(0, net.inflight - 1); };
+    if (window.fetch) {
+        var origFetch = window.fetch;
+        window.fetch = function () {
+            net.inflight++;
+            return origFetch.apply(this, arguments).finally(settle);
+        };
+    }
+    var origSend = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        net.inflight++;
+        this.addEventListener('loadend', settle);
+        return origSend.apply(this, arguments);
+    };
+    new MutationObserver(function () { net.lastMutation = Date.now(); }).observe(
+        document.documentElement, {childList: true, subtree: true, attributes: true, characterData: true});
+}
+function targetReady() {
+    if (!xpath) return true;
+    var el = document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    if (!el || el.disabled) return false;
+    var r = el.getBoundingClientRect();
+    return r.width > 0 || r.height > 0;
+}
+var start = Date.now(), targetAt = null;
+(function check() {
+    var now = Date.now();
+    if (targetAt === null && targetReady()) targetAt = now;
+    var ready = targetAt !== null && document.readyState === 'complete'
+        && net.inflight === 0 && now - net.lastMutation >= quietMs;
+    if (ready || now - start >= timeoutMs) {
+        done({ready: ready, elapsed_ms: now - start, settle_ms: targetAt === null ? 0 : now - targetAt});
+        return;
+    }
+    setTimeout(check, 50);
+})();
+"""
+
+_readiness = threading.local()
+
+
+def begin_readiness_report():
+    """Start collecting readiness steps for the job running on this thread"""
+    _readiness.steps = []
+
+
+def wait_until_ready(driver, step: str, fixed_sleep: float = 0.0, xpath: Optional[str] = None,
+                     timeout: float = READINESS_TIMEOUT, quiet_ms: int = READINESS_QUIET_MS,
+                     prior_wait: bool = False) -> bool:
+    """
+    Wait until the page has settled instead of sleeping a fixed time.
+    fixed_sleep is the sleep this step replaces; with prior_wait the old code already
+    polled for the target, so only the settle time after it is compared.
+    """
+    started = time.time()
+    result = {}
     try:
-        company_text_element = driver.find_element(
-            By.XPATH,
-            "//tr[@data-row-key='0']//span[@class='blue-link-color']"
-        )
-        full_text = company_text_element.text.strip()
-        if "All Company Start from" in full_text:
-            company_name = full_text.replace("All Company Start from", "").strip()
-        elif full_text:
-            company_name = full_text
-        if company_name:
-            print(f"✅ Strategy 1: Found company name: {company_name}")
-            return company_name
+        driver.set_script_timeout(timeout + 5)
+        result = driver.execute_async_script(READINESS_SCRIPT, xpath, quiet_ms, int(timeout * 1000)) or {}
     except Exception as e:
-        print(f"⚠️ Strategy 1 failed: {e}")
+        print(f"⚠️ Readiness check failed for {step}: {e}")
     
-    try:
-        search_criteria = driver.find_elements(By.XPATH, "//span[contains(@class, 'ant-tag')]")
-        for tag in search_criteria:
-            text = tag.text.strip()
-            if text and len(text) > 3 and not text.startswith("HS") and not text.isdigit():
-                company_name = text
-                print(f"✅ Strategy 2: Found company name from tag: {company_name}")
-                return company_name
-    except Exception as e:
-        print(f"⚠️ Strategy 2 failed: {e}")
+    waited = time.time() - started
+    ready = bool(result.get('ready'))
+    charged = result.get('settle_ms', 0) / 1000 if prior_wait else waited
+    steps = getattr(_readiness, 'steps', None)
+    if steps is not None:
+        steps.append({
+            'step': step,
+            'ready': ready,
+            'waited_s': round(waited, 3),
+            'fixed_sleep_s': fixed_sleep,
+            'saved_s': round(fixed_sleep - charged, 3),
+        })
+    if not ready:
+        print(f"⚠️ {step}: page not settled after {waited:.1f}s - continuing")
+    return ready
+
+
+def finish_readiness_report(job):
+    """Attach this thread's readiness steps to the job and print the per-step table"""
+    steps = getattr(_readiness, 'steps', None) or []
+    _readiness.steps = None
+    if not steps:
+        return
     
-    try:
-        headers = driver.find_elements(By.XPATH, "//h1 | //h2 | //h3 | //h4")
-        for header in headers:
-            text = header.text.strip()
-            if text and len(text) > 3 and "volza" not in text.lower() and "search" not in text.lower():
-                company_name = text
-                print(f"✅ Strategy 3: Found company name from header: {company_name}")
-                return company_name
-    except Exception as e:
-        print(f"⚠️ Strategy 3 failed: {e}")
+    saved = round(sum(s['saved_s'] for s in steps), 3)
+    job['readiness'] = steps
+    job.set_timing('readiness_saved_s', saved)
     
-    try:
-        table_cells = driver.find_elements(By.XPATH, "//td[contains(@class, 'ant-table-cell')]//a")
-        for cell in table_cells[:5]:
-            text = cell.text.strip()
-            if text and len(text) > 3:
-                company_name = text
-                print(f"✅ Strategy 4: Found company name from table: {company_name}")
-                return company_name
-    except Exception as e:
-        print(f"⚠️ Strategy 4 failed: {e}")
-    
-    try:
-        current_url = driver.current_url
-        if "company=" in current_url or "q=" in current_url:
-            import urllib.parse
-            parsed = urllib.parse.urlparse(current_url)
-            params = urllib.parse.parse_qs(parsed.query)
-            if 'company' in params:
-                company_name = params['company'][0]
-            elif 'q' in params:
-                company_name = params['q'][0]
-            if company_name:
-                print(f"✅ Strategy 5: Found company name from URL: {company_name}")
-                return company_name
-    except Exception as e:
-        print(f"⚠️ Strategy 5 failed: {e}")
-    
-    try:
-        breadcrumbs = driver.find_elements(By.XPATH, "//nav//a | //ol//li//a | //ul[contains(@class, 'breadcrumb')]//a")
-        for crumb in breadcrumbs:
-            text = crumb.text.strip()
-            if text and len(text) > 3 and "home" not in text.lower() and "search" not in text.lower():
-                company_name = text
-                print(f"✅ Strategy 6: Found company name from breadcrumb: {company_name}")
-                return company_name
-    except Exception as e:
-        print(f"⚠️ Strategy 6 failed: {e}")
-    
-    try:
-        prominent_elements = driver.find_elements(By.XPATH, 
-            "//*[contains(@class, 'company') or contains(@class, 'title') or contains(@class, 'name')]"
-        )
-        for elem in prominent_elements[:10]:
-            text = elem.text.strip()
-            if text and len(text) > 3 and len(text) < 100:
-                company_name = text.split('\n')[0]
-                print(f"✅ Strategy 7: Found company name from prominent element: {company_name}")
-                return company_name
-    except Exception as e:
-        print(f"⚠️ Strategy 7 failed: {e}")
-    
-    print("❌ All strategies failed to extract company name")
-    return None
+    print(f"⏱️ Readiness for job {job.id}:")
+    print(f"   {'step':<28}{'waited':>9}{'fixed':>9}{'saved':>9}")
+    for s in steps:
+        flag = "" if s['ready'] else "  (timeout)"
+        print(f"   {s['step']:<28}{s['waited_s']:>8.2f}s{s['fixed_sleep_s']:>8.2f}s{s['saved_s']:>8.2f}s{flag}")
+    print(f"   {'total saved':<28}{'':>18}{saved:>8.2f}s")
+
+
+# ==================== IMPROVED COMPANY NAME EXTRACTION ====================
+# Single injected call: evaluates every company-name locator at once (no
+# find_element misses paying the implicit wait) and returns scored candidates.
+# A name found by several strategies, or carrying a legal suffix, scores higher.
+# Body text is returned only when nothing matched, for the regex fallback.
+COMPANY_NAME_SCRIPT = """
+const visible = (el) => el.getClientRects().length > 0;
+const clean = (el) => (el.innerText || el.textContent || '').trim();
+const found = [];
+const add = (strategy, base, text) => {
+    text = (text || '').split('\\n')[0].replace(/\\s+/g, ' ').trim();
+    if (text.length > 3 && text.length < 100) {
+        found.push({strategy: strategy, base: base, text: text});
+    }
+};
+const each = (selector, limit, fn) => {
+    Array.from(document.querySelectorAll(selector)).filter(visible).slice(0, limit).forEach(el => fn(clean(el)));
+};
+
+each("tr[data-row-key='0'] span.blue-link-color", 1, t => add('row0_link', 100, t.replace('All Company Start from', '')));
+each("span[class*='ant-tag']", 20, t => { if (!/^HS/.test(t) && !/^\\d+$/.test(t)) add('search_tag', 90, t); });
+each("h1, h2, h3, h4", 20, t => { if (!/volza|search/i.test(t)) add('header', 70, t); });
+each("td[class*='ant-table-cell'] a", 5, t => add('table_link', 60, t));
+const params = new URLSearchParams(window.location.search);
+add('url_param', 55, params.get('company') || params.get('q'));
+each("nav a, ol li a, ul[class*='breadcrumb'] a", 20, t => { if (!/home|search/i.test(t)) add('breadcrumb', 40, t); });
+each("[class*='company'], [class*='title'], [class*='name']", 10, t => add('class_name', 30, t));
+each("table tr:nth-of-type(2) td:first-child", 1, t => add('first_cell', 20, t));
+
+const legal = /\\b(LTD|LLC|LLP|INC|CORP|CO|PVT|PRIVATE|LIMITED|CORPORATION|COMPANY|GMBH)\\b/i;
+const byName = {};
+found.forEach(c => {
+    const key = c.text.toUpperCase();
+    const entry = byName[key] || (byName[key] = {text: c.text, score: 0, strategies: []});
+    if (!entry.strategies.includes(c.strategy)) {
+        entry.strategies.push(c.strategy);
+    }
+    entry.score = Math.max(entry.score, c.base);
+});
+const candidates = Object.values(byName).map(e => {
+    e.score += 10 * (e.strategies.length - 1) + (legal.test(e.text) ? 15 : 0);
+    return e;
+}).sort((a, b) => b.score - a.score);
+return {
+    candidates: candidates.slice(0, 10),
+    text: candidates.length || !document.body ? '' : document.body.innerText.slice(0, 3000),
+};
+"""
+
+
+def extract_company_name_from_page(driver):
+    """Extract company name: all locators scored in one script call, page-text regex as fallback"""
+    with span('company_detect') as attrs:
+        try:
+            result = driver.execute_script(COMPANY_NAME_SCRIPT) or {}
+        except Exception as e:
+            print(f"⚠️ Company name detection failed: {e}")
+            attrs['strategy'] = 'error'
+            return None
+        
+        candidates = result.get('candidates') or []
+        if candidates:
+            best = candidates[0]
+            attrs.update(strategy=best['strategies'][0], score=best['score'], candidates=len(candidates))
+            print(f"✅ Found company name: {best['text']} (score {best['score']}, {' + '.join(best['strategies'])})")
+            return best['text']
+        
+        attrs.update(strategy='text', candidates=0)
+        company_name = extract_company_name_from_text(result.get('text') or "")
+        if not company_name:
+            print("❌ All strategies failed to extract company name")
+        return company_name
 
 
 def extract_company_name_from_text(page_text):
@@ -447,24 +1514,1256 @@ def extract_company_name_from_text(page_text):
         r"([A-Z][A-Z\s\.\,\&\-]{5,50}(?:LTD|LLC|INC|CORP|CO|PVT|PRIVATE|LIMITED|CORPORATION|COMPANY))",
     ]
     
-    for pattern in patterns:
-        matches = re.findall(pattern, page_text[:5000], re.IGNORECASE)
-        if matches:
-            company_name = matches[0].strip()
-            if len(company_name) > 3:
-                print(f"✅ Found company name from text: {company_name}")
-                return company_name
+    for pattern in patterns:
+        matches = re.findall(pattern, page_text[:5000], re.IGNORECASE)
+        if matches:
+            company_name = matches[0].strip()
+            if len(company_name) > 3:
+                print(f"✅ Found company name from text: {company_name}")
+                return company_name
+    
+    return None
+
+
+# ==================== RESULT TABLE CAPTURE ====================
+# Single injected call: picks the ant-table with the most data rows and returns
+# its header labels plus every `tr[data-row-key]` row as plain cell text.
+# Falls back to body text only when no result rows are rendered.
+RESULT_TABLE_SCRIPT = """
+const clean = (el) => (el.innerText || el.textContent || '').replace(/\\s+/g, ' ').trim();
+let best = null;
+let bestRows = [];
+document.querySelectorAll('.ant-table').forEach(table => {
+    const rows = table.querySelectorAll('tr[data-row-key]');
+    if (rows.length > bestRows.length) {
+        best = table;
+        bestRows = rows;
+    }
+});
+if (!best) {
+    return {headers: [], rows: [], text: document.body ? document.body.innerText : ''};
+}
+const headers = Array.from(best.querySelectorAll('thead th')).map(clean);
+const rows = Array.from(bestRows).map(tr => Array.from(tr.querySelectorAll('td')).map(clean));
+return {headers: headers, rows: rows, text: ''};
+"""
+
+# Header aliases per record field, most specific first
+SHIPMENT_COLUMN_ALIASES = {
+    'date': ('shipment date', 'date'),
+    'hs_code': ('hs code', 'hsn code', 'hsn', 'hs'),
+    'shipper': ('shipper', 'exporter', 'supplier'),
+    'consignee': ('consignee', 'importer', 'buyer'),
+    'country': ('destination country', 'country of destination', 'consignee country', 'importer country', 'destination', 'country'),
+    'quantity': ('std. quantity', 'std quantity', 'quantity', 'qty'),
+    'value': ('value in usd', 'value (usd)', 'total value', 'usd value', 'value'),
+}
+
+SHIPMENT_DATE_FORMATS = ('%d-%b-%Y', '%d %b %Y', '%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%b %d, %Y', '%d-%b-%y')
+
+
+@dataclass
+class ShipmentRecord:
+    """One result-table row from a Volza search"""
+    shipper: str = ""
+    consignee: str = ""
+    country: str = ""
+    date: Optional[str] = None
+    hs_code: str = ""
+    quantity: Optional[float] = None
+    value: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def parse_shipment_date(text: str) -> Optional[str]:
+    """Normalise a Volza date cell to ISO format (YYYY-MM-DD)"""
+    text = (text or "").strip()
+    for fmt in SHIPMENT_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_number(text: str) -> Optional[float]:
+    """Parse '16,000 KGS' or '$21,440.00' into a float"""
+    match = re.search(r'-?\d[\d,]*(?:\.\d+)?', text or "")
+    if not match:
+        return None
+    try:
+        return float(match.group(0).replace(',', ''))
+    except ValueError:
+        return None
+
+
+def map_shipment_columns(headers: list) -> dict:
+    """Map record fields to column indexes using the table header labels"""
+    labels = [h.strip().lower() for h in headers]
+    mapping = {}
+    used = set()
+    
+    # Exact labels first, so "consignee" is not claimed by "consignee country"
+    for exact in (True, False):
+        for field, aliases in SHIPMENT_COLUMN_ALIASES.items():
+            if field in mapping:
+                continue
+            for alias in aliases:
+                for index, label in enumerate(labels):
+                    if index in used or not label or 'origin' in label:
+                        continue
+                    if label == alias or (not exact and (label.startswith(alias + " ") or (len(alias) > 3 and alias in label))):
+                        mapping[field] = index
+                        used.add(index)
+                        break
+                if field in mapping:
+                    break
+    
+    return mapping
+
+
+def rows_to_shipments(headers: list, rows: list) -> list:
+    """Convert raw table cells into ShipmentRecord objects"""
+    mapping = map_shipment_columns(headers)
+    if not mapping:
+        return []
+    
+    def cell(row, field):
+        index = mapping.get(field)
+        if index is None or index >= len(row):
+            return ""
+        return row[index] or ""
+    
+    records = []
+    for row in rows:
+        if not any(row) or " ".join(row).startswith("All Company Start from"):
+            continue
+        record = ShipmentRecord(
+            shipper=cell(row, 'shipper'),
+            consignee=cell(row, 'consignee'),
+            country=cell(row, 'country'),
+            date=parse_shipment_date(cell(row, 'date')),
+            hs_code=cell(row, 'hs_code'),
+            quantity=parse_number(cell(row, 'quantity')),
+            value=parse_number(cell(row, 'value')),
+        )
+        if record.shipper or record.consignee:
+            records.append(record)
+    
+    return records
+
+
+class _ResultTableParser(HTMLParser):
+    """Offline mirror of RESULT_TABLE_SCRIPT for saved Volza pages"""
+    
+    def __init__(self):
+        super().__init__()
+        self.headers = []
+        self.rows = []
+        self._in_thead = False
+        self._row = None
+        self._cell = None
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'thead':
+            self._in_thead = True
+        elif tag == 'tr' and 'data-row-key' in attrs:
+            self._row = []
+        elif tag == 'th' and self._in_thead:
+            self._cell = []
+        elif tag == 'td' and self._row is not None:
+            self._cell = []
+    
+    def handle_endtag(self, tag):
+        if tag == 'thead':
+            self._in_thead = False
+        elif tag == 'th' and self._in_thead and self._cell is not None:
+            self.headers.append(" ".join("".join(self._cell).split()))
+            self._cell = None
+        elif tag == 'td' and self._row is not None and self._cell is not None:
+            self._row.append(" ".join("".join(self._cell).split()))
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+    
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+
+def parse_result_table_html(html: str) -> list:
+    """Parse shipment records from saved Volza result HTML (offline capture)"""
+    parser = _ResultTableParser()
+    parser.feed(html)
+    return rows_to_shipments(parser.headers, parser.rows)
+
+
+def save_shipments(records):
+    """Save captured shipment records as a JSON array, one record at a time"""
+    with open(SHIPMENTS_FILE, 'w', encoding='utf-8') as f:
+        f.write("[")
+        separator = "\n  "
+        for r in records:
+            f.write(separator + json.dumps(r.to_dict(), ensure_ascii=False))
+            separator = ",\n  "
+        f.write("\n]\n")
+
+
+def iter_shipment_lines(records):
+    """Pipe-delimited table lines (header first) without building one big string"""
+    yield "Date | Shipper | Consignee | Country | HS Code | Quantity | Value (USD)"
+    for r in records:
+        yield " | ".join([
+            r.date or "",
+            r.shipper,
+            r.consignee,
+            r.country,
+            r.hs_code,
+            "" if r.quantity is None else f"{r.quantity:g}",
+            "" if r.value is None else f"{r.value:.2f}",
+        ])
+
+
+def shipments_to_text(records) -> str:
+    """Render records as a pipe-delimited table for files and prompts"""
+    return "\n".join(iter_shipment_lines(records))
+
+
+def save_raw_capture(company_name: str, product_name: str, records, page_text: str):
+    """Write DATA_FILE: the captured rows streamed as a table, or the raw page text"""
+    with open(DATA_FILE, "w", encoding="utf-8") as f:
+        f.write("=== COMPLETE PAGE CONTENT ===\n")
+        f.write(f"Company: {company_name}\n")
+        f.write(f"Product: {product_name}\n")
+        f.write(f"Captured at: {datetime.datetime.now()}\n")
+        f.write("="*80 + "\n\n")
+        if records:
+            f.writelines(line + "\n" for line in iter_shipment_lines(records))
+        else:
+            f.write(page_text)
+
+
+class ShipmentSink:
+    """
+    Append-only JSONL file of ShipmentRecords. Pages are written as they are
+    crawled; iterating streams the records back from disk, so a capture of any
+    size can be aggregated, saved and indexed without holding it in memory.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        open(path, "a", encoding="utf-8").close()
+    
+    @classmethod
+    def create(cls, directory: str = CAPTURE_DIR) -> "ShipmentSink":
+        name = f"{datetime.datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}.jsonl"
+        return cls(os.path.join(directory, name))
+    
+    def write(self, records: list):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps(r.to_dict(), ensure_ascii=False) + "\n")
+        self.count += len(records)
+    
+    def __iter__(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield ShipmentRecord(**json.loads(line))
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def discard(self):
+        """Delete the file once its rows are archived and stored in history"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+# Next-page button of the antd pagination under the results table; False on the last page
+NEXT_PAGE_SCRIPT = """
+const next = document.querySelector('.ant-pagination-next');
+if (!next || next.classList.contains('ant-pagination-disabled') || next.getAttribute('aria-disabled') === 'true') {
+    return false;
+}
+(next.querySelector('button, a') || next).click();
+return true;
+"""
+
+# Identifies the rendered page: row keys may restart at 0 on every page, so include the text
+FIRST_ROW_SCRIPT = """
+const row = document.querySelector('.ant-table tr[data-row-key]');
+return row ? row.getAttribute('data-row-key') + '|' + (row.innerText || row.textContent) : '';
+"""
+
+
+def capture_result_rows(driver, max_pages: int = CRAWL_MAX_PAGES, max_rows: int = CRAWL_MAX_ROWS):
+    """
+    🚀 Capture the result table page by page - one script call per page, no zoom/scroll/sleep.
+    Each page's rows are appended to a ShipmentSink as soon as they are parsed; the crawl
+    stops on the last page or at max_pages / max_rows.
+    Returns (records, page_text): records is the ShipmentSink; page_text is the raw body
+    text when no structured rows were rendered, else "".
+    """
+    start_capture = time.time()
+    sink = ShipmentSink.create()
+    page_text = ""
+    pages = 0
+    stopped = "last page"
+    
+    with span('capture') as attrs:
+        while True:
+            raw = driver.execute_script(RESULT_TABLE_SCRIPT) or {}
+            records = rows_to_shipments(raw.get('headers') or [], raw.get('rows') or [])
+            if not records:
+                if pages == 0:
+                    page_text = raw.get('text') or ""
+                break
+            
+            records = records[:max_rows - len(sink)]
+            sink.write(records)
+            pages += 1
+            if len(sink) >= max_rows:
+                stopped = f"row cap ({max_rows})"
+                break
+            if pages >= max_pages:
+                stopped = f"page cap ({max_pages})"
+                break
+            
+            first_row = driver.execute_script(FIRST_ROW_SCRIPT)
+            if not driver.execute_script(NEXT_PAGE_SCRIPT):
+                break
+            try:
+                WebDriverWait(driver, CRAWL_PAGE_TIMEOUT, poll_frequency=0.1).until(
+                    lambda d: d.execute_script(FIRST_ROW_SCRIPT) not in ("", first_row)
+                )
+            except TimeoutException:
+                stopped = "next page did not load"
+                break
+        attrs.update(pages=pages, rows=len(sink), stopped=stopped)
+    
+    if pages > 1 or stopped != "last page":
+        print(f"📄 Crawled {pages} result pages - stopped: {stopped}")
+    print(f"✅ Captured {len(sink)} shipment rows in {time.time() - start_capture:.2f}s")
+    return sink, page_text
+
+
+def most_common_shipper(records: list) -> Optional[str]:
+    """Company name fallback: the shipper appearing in most rows"""
+    shippers = Counter(r.shipper for r in records if r.shipper)
+    if not shippers:
+        return None
+    return shippers.most_common(1)[0][0]
+
+
+# ==================== CAPTURE ARCHIVE ====================
+CAPTURE_DIGEST_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class CaptureArchive:
+    """
+    Content-addressed archive of raw captures and reports. Each blob is gzip
+    text named by the SHA-256 of its uncompressed content, so an identical
+    capture is stored once; the history DB maps company/product/date to blobs.
+    """
+    
+    def __init__(self, root: str, store: HistoryStore, level: int = 6):
+        self.root = root
+        self.store = store
+        self.level = level
+        self.dedup_hits = 0
+    
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}.gz")
+    
+    def put(self, chunks) -> tuple:
+        """Stream text chunks into a blob; returns (digest, size, stored_size)"""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, f".{uuid.uuid4().hex}.tmp")
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as raw, \
+                    gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=self.level, mtime=0) as gz:
+                for chunk in chunks:
+                    data = chunk.encode('utf-8')
+                    sha.update(data)
+                    gz.write(data)
+                    size += len(data)
+            digest = sha.hexdigest()
+            path = self.path(digest)
+            if os.path.exists(path):
+                self.dedup_hits += 1
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return digest, size, os.path.getsize(path)
+    
+    def add(self, company_name: str, product_name: str, kind: str, chunks) -> Optional[str]:
+        """Archive one capture ('shipments', 'page' or 'report') and index it; returns its digest"""
+        try:
+            digest, size, stored_size = self.put(chunks)
+            self.store.add_capture(company_name, product_name, kind, digest, size, stored_size)
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️ Capture archive write failed: {e}")
+            return None
+        return digest
+    
+    def exists(self, digest: str) -> bool:
+        return bool(CAPTURE_DIGEST_PATTERN.match(digest or "")) and os.path.exists(self.path(digest))
+    
+    def open(self, digest: str):
+        """Decompressing text stream over a blob"""
+        return gzip.open(self.path(digest), 'rt', encoding='utf-8')
+    
+    def iter_text(self, digest: str, chunk_size: int = 64 * 1024):
+        with self.open(digest) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+    
+    def iter_shipments(self, digest: str):
+        """Reload an archived 'shipments' capture as ShipmentRecords"""
+        with self.open(digest) as f:
+            for line in f:
+                if line.strip():
+                    yield ShipmentRecord(**json.loads(line))
+
+
+capture_archive = CaptureArchive(CAPTURE_ARCHIVE_DIR, history_store, CAPTURE_ARCHIVE_LEVEL)
+
+
+def store_capture(company_name: str, product_name: str, records, page_text: str, start_date: Optional[str]):
+    """
+    Archive what a search captured (rows as JSONL, or the page text when there were none),
+    merge the rows into history and drop the temporary JSONL. Returns the records to analyse.
+    """
+    if isinstance(records, ShipmentSink) and not records:
+        records.discard()
+        records = []
+    
+    if records:
+        capture_archive.add(company_name, product_name, 'shipments',
+                            (json.dumps(r.to_dict(), ensure_ascii=False) + "\n" for r in records))
+    elif page_text:
+        capture_archive.add(company_name, product_name, 'page', [page_text])
+    
+    analysed = merge_captured_shipments(company_name, records, start_date)
+    if isinstance(records, ShipmentSink) and analysed is not records:
+        records.discard()
+    return analysed
+
+
+# ==================== LOCAL TRADE METRICS ====================
+def _party_key(name: str) -> str:
+    """Case/whitespace-insensitive key for counting distinct parties"""
+    return " ".join((name or "").upper().split())
+
+
+def aggregate_trade_metrics(records) -> dict:
+    """
+    Compute exact trade metrics from shipment records (no LLM).
+    Accepts any iterable of ShipmentRecord.
+    """
+    by_country = {}
+    by_buyer = {}
+    total_shipments = 0
+    total_quantity = 0.0
+    total_value = 0.0
+    min_date = None
+    max_date = None
+    
+    for r in records:
+        total_shipments += 1
+        total_quantity += r.quantity or 0
+        total_value += r.value or 0
+        
+        if r.date:
+            min_date = r.date if min_date is None or r.date < min_date else min_date
+            max_date = r.date if max_date is None or r.date > max_date else max_date
+        
+        buyer_key = _party_key(r.consignee)
+        country_key = _party_key(r.country)
+        
+        if country_key:
+            country = by_country.setdefault(country_key, {
+                'country': r.country.strip(), 'shipments': 0, 'consignees': set(),
+                'quantity': 0.0, 'value': 0.0,
+            })
+            country['shipments'] += 1
+            country['quantity'] += r.quantity or 0
+            country['value'] += r.value or 0
+            if buyer_key:
+                country['consignees'].add(buyer_key)
+        
+        if buyer_key:
+            buyer = by_buyer.setdefault(buyer_key, {
+                'consignee': r.consignee.strip(), 'countries': [], 'shipments': 0,
+                'quantity': 0.0, 'value': 0.0, 'first_date': None, 'last_date': None,
+            })
+            buyer['shipments'] += 1
+            buyer['quantity'] += r.quantity or 0
+            buyer['value'] += r.value or 0
+            if r.country.strip() and r.country.strip() not in buyer['countries']:
+                buyer['countries'].append(r.country.strip())
+            if r.date:
+                if buyer['first_date'] is None or r.date < buyer['first_date']:
+                    buyer['first_date'] = r.date
+                if buyer['last_date'] is None or r.date > buyer['last_date']:
+                    buyer['last_date'] = r.date
+    
+    countries = sorted(by_country.values(), key=lambda c: (-c['shipments'], c['country']))
+    for country in countries:
+        country['consignees'] = len(country['consignees'])
+    buyers = sorted(by_buyer.values(), key=lambda b: (-b['shipments'], b['consignee']))
+    
+    return {
+        'total_shipments': total_shipments,
+        'distinct_consignees': len(by_buyer),
+        'distinct_countries': len(by_country),
+        'total_quantity': total_quantity,
+        'total_value': total_value,
+        'first_date': min_date,
+        'last_date': max_date,
+        'by_country': countries,
+        'by_buyer': buyers,
+    }
+
+
+def format_trade_metrics(metrics: dict, max_buyers: int = 25) -> str:
+    """Render computed metrics as the EXTRACTED DATA block of the assessment prompt"""
+    lines = [
+        f"Total Shipments: {metrics['total_shipments']}",
+        f"Total Consignees (Buyers): {metrics['distinct_consignees']}",
+        f"Total Countries: {metrics['distinct_countries']}",
+        f"Date Range: {metrics['first_date'] or 'unknown'} to {metrics['last_date'] or 'unknown'}",
+        f"Total Quantity: {metrics['total_quantity']:,.2f}",
+        f"Total Value (USD): {metrics['total_value']:,.2f}",
+        "",
+        "Shipments by Destination Country:",
+    ]
+    for c in metrics['by_country']:
+        lines.append(f"- {c['country']}: {c['shipments']} shipments, {c['consignees']} consignees, USD {c['value']:,.2f}")
+    
+    lines.append("")
+    lines.append("Shipments by Consignee (Buyer):")
+    for b in metrics['by_buyer'][:max_buyers]:
+        lines.append(
+            f"- {b['consignee']} ({', '.join(b['countries']) or 'unknown country'}): "
+            f"{b['shipments']} shipments, USD {b['value']:,.2f}, "
+            f"{b['first_date'] or '?'} to {b['last_date'] or '?'}"
+        )
+    remaining = len(metrics['by_buyer']) - max_buyers
+    if remaining > 0:
+        lines.append(f"- ... and {remaining} more consignees")
+    
+    return "\n".join(lines)
+
+
+# ==================== LLM RESPONSE CACHE ====================
+class LLMCache:
+    """
+    Content-addressed cache for Groq completions.
+    In-memory LRU in front of an on-disk JSON store, with TTL and
+    size-bounded eviction on both tiers.
+    """
+    
+    def __init__(self, cache_dir: str, ttl: int, max_items: int, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def make_key(model: str, messages: list, **params) -> str:
+        """Hash of model, messages and sampling params"""
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params},
+            sort_keys=True, ensure_ascii=False, separators=(',', ':')
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+    
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+    
+    def get(self, key: str) -> Optional[str]:
+        hit = None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, content = entry
+                if not self._expired(created):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    hit = content
+                else:
+                    del self._memory[key]
+        if hit is not None:
+            # Memory hits are uses too, or the hottest entries would be the first evicted from disk
+            self._touch(self._path(key))
+            return hit
+        
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        if self._expired(entry.get('created', 0)):
+            self._remove_file(path)
+            with self._lock:
+                self.misses += 1
+            return None
+        
+        with self._lock:
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, entry['created'], entry['content'])
+        self._touch(path)
+        return entry['content']
+    
+    def set(self, key: str, content: str, model: str = ""):
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, content)
+        
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"created": created, "model": model, "content": content}, f, ensure_ascii=False)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            with self._lock:
+                if self._disk_bytes is not None:
+                    self._disk_bytes += os.path.getsize(path) - replaced
+            self._evict_disk()
+        except OSError as e:
+            print(f"⚠️ LLM cache write failed: {e}")
+    
+    def _remember(self, key: str, created: float, content: str):
+        """Insert into the memory LRU (caller holds the lock)"""
+        self._memory[key] = (created, content)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+    
+    @staticmethod
+    def _touch(path: str):
+        """Mark a disk entry used: atime orders LRU eviction, mtime stays the write time for the TTL"""
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            pass
+    
+    def _remove_file(self, path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    
+    def _evict_disk(self):
+        """Drop expired entries, then least recently used entries until under max_bytes"""
+        with self._lock:
+            if self._disk_bytes is not None and self._disk_bytes <= self.max_bytes:
+                return
+        
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if self.ttl > 0 and time.time() - stat.st_mtime > self.ttl:
+                    self._remove_file(path)
+                    continue
+                entries.append((stat.st_atime, stat.st_size, path))
+                total += stat.st_size
+        
+        entries.sort()
+        evicted = 0
+        while total > self.max_bytes and entries:
+            _, size, path = entries.pop(0)
+            self._remove_file(path)
+            total -= size
+            evicted += 1
+        
+        with self._lock:
+            self._disk_bytes = total
+            self.evictions += evicted
+    
+    def _measure_disk(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    try:
+                        total += os.path.getsize(os.path.join(root, name))
+                    except OSError:
+                        continue
+        return total
+    
+    def stats(self) -> dict:
+        if self._disk_bytes is None:
+            # Unknown until the first write or eviction pass - measure once rather than report nothing
+            measured = self._measure_disk()
+            with self._lock:
+                if self._disk_bytes is None:
+                    self._disk_bytes = measured
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'memory_items': len(self._memory),
+                'disk_bytes': self._disk_bytes,
+            }
+
+
+llm_cache = LLMCache(LLM_CACHE_DIR, LLM_CACHE_TTL, LLM_CACHE_MAX_ITEMS, LLM_CACHE_MAX_BYTES)
+
+
+# ==================== GROQ SCHEDULER ====================
+PRIORITY_CHAT = 0      # a person is waiting on the answer
+PRIORITY_ANALYSIS = 1  # interactive analysis report
+PRIORITY_BATCH = 2     # batch items, map-reduce chunks of batch items
+PRIORITY_NAMES = {PRIORITY_CHAT: 'chat', PRIORITY_ANALYSIS: 'analysis', PRIORITY_BATCH: 'batch'}
+
+_groq_priority = threading.local()
+
+
+@contextmanager
+def groq_priority(level: int):
+    """Default priority for Groq calls made on this thread"""
+    previous = getattr(_groq_priority, 'level', None)
+    _groq_priority.level = level
+    try:
+        yield
+    finally:
+        _groq_priority.level = previous
+
+
+def current_groq_priority() -> int:
+    level = getattr(_groq_priority, 'level', None)
+    return PRIORITY_ANALYSIS if level is None else level
+
+
+def parse_reset_duration(value) -> Optional[float]:
+    """Groq reset headers look like '2m59.56s', '7.66s' or '120ms'"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total, found = 0.0, False
+    for amount, unit in re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', str(value)):
+        total += float(amount) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+        found = True
+    return total if found else None
+
+
+class GroqLease:
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+
+
+class GroqScheduler:
+    """
+    Shared gate in front of every Groq call: requests/minute and tokens/minute
+    token buckets, a concurrency cap, a priority queue (chat before analysis before
+    batch) and jittered retries that honour retry-after / x-ratelimit-* headers.
+    """
+    
+    RETRYABLE = ('RateLimitError', 'APIConnectionError', 'APITimeoutError', 'InternalServerError')
+    
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int, max_retries: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._refilled_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._in_flight = 0
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.wait_seconds = Histogram('volza_groq_queue_wait_seconds', 'Time Groq calls waited for budget.', 'priority', STAGE_BUCKETS)
+        self.retries = LabeledCounter('volza_groq_retries_total', 'Groq calls retried, by error type.', 'error')
+    
+    @staticmethod
+    def estimate_tokens(messages: list, max_completion_tokens: int) -> int:
+        prompt_chars = sum(len(str(m.get('content', ''))) for m in messages)
+        return prompt_chars // CHARS_PER_TOKEN + max_completion_tokens
+    
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+    
+    def _wait_needed(self, tokens: int) -> float:
+        """Seconds until this request fits the budgets (0 = now)"""
+        waits = [self._blocked_until - time.monotonic()]
+        if self._requests < 1:
+            waits.append((1 - self._requests) * 60 / self.rpm)
+        if self._tokens < tokens:
+            waits.append((tokens - self._tokens) * 60 / self.tpm)
+        return max(0.0, *waits)
+    
+    def acquire(self, tokens: int, priority: int) -> GroqLease:
+        # A request larger than the whole budget would never fit, so cap its reservation
+        tokens = min(tokens, self.tpm)
+        started = time.monotonic()
+        entry = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            while True:
+                self._refill()
+                if self._waiting[0] == entry and self._in_flight < self.max_concurrency:
+                    wait = self._wait_needed(tokens)
+                    if wait <= 0:
+                        break
+                else:
+                    wait = 1.0
+                self._cond.wait(timeout=min(wait, 1.0))
+            heapq.heappop(self._waiting)
+            self._requests -= 1
+            self._tokens -= tokens
+            self._in_flight += 1
+            self._cond.notify_all()
+        self.wait_seconds.observe(PRIORITY_NAMES.get(priority, str(priority)), time.monotonic() - started)
+        return GroqLease(tokens)
+    
+    def release(self, lease: GroqLease, used_tokens: Optional[int] = None):
+        """Free the concurrency slot and refund the unused part of the token reservation"""
+        with self._cond:
+            self._in_flight -= 1
+            if used_tokens is not None and used_tokens < lease.tokens:
+                self._tokens = min(self.tpm, self._tokens + lease.tokens - used_tokens)
+            self._cond.notify_all()
+    
+    def sync_headers(self, headers):
+        """Never believe we have more budget than Groq says we have"""
+        if not headers:
+            return
+        with self._cond:
+            try:
+                remaining_requests = headers.get('x-ratelimit-remaining-requests')
+                remaining_tokens = headers.get('x-ratelimit-remaining-tokens')
+                if remaining_requests is not None:
+                    self._requests = min(self._requests, float(remaining_requests))
+                if remaining_tokens is not None:
+                    self._tokens = min(self._tokens, float(remaining_tokens))
+            except (TypeError, ValueError):
+                pass
+    
+    def backoff(self, error, attempt: int) -> float:
+        """retry-after (or the matching reset header) plus jitter, else full-jitter exponential"""
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        delay = parse_reset_duration(headers.get('retry-after'))
+        if delay is None and type(error).__name__ == 'RateLimitError':
+            delay = max(filter(None, [parse_reset_duration(headers.get('x-ratelimit-reset-requests')),
+                                      parse_reset_duration(headers.get('x-ratelimit-reset-tokens'))]), default=None)
+        if delay is not None:
+            delay += random.uniform(0, 0.5 + 0.25 * attempt)
+            if type(error).__name__ == 'RateLimitError':
+                # Everyone else would hit the same limit - hold the whole queue
+                with self._cond:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+            return delay
+        return random.uniform(0, min(30.0, 1.0 * 2 ** attempt))
+    
+    def submit(self, create, tokens: int, priority: int):
+        """Run create() (a raw-response Groq call) under the budgets; returns (raw response, lease)"""
+        for attempt in range(self.max_retries + 1):
+            lease = self.acquire(tokens, priority)
+            try:
+                raw = create()
+            except Exception as e:
+                # A failed request still counted against RPM but used no tokens
+                self.release(lease, used_tokens=0)
+                name = type(e).__name__
+                if name not in self.RETRYABLE or attempt == self.max_retries:
+                    raise
+                delay = self.backoff(e, attempt)
+                self.retries.inc(name)
+                print(f"⚠️ Groq {name} - retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self.sync_headers(getattr(raw, 'headers', None))
+            return raw, lease
+    
+    def stats(self) -> dict:
+        with self._cond:
+            self._refill()
+            return {
+                'queued': len(self._waiting),
+                'in_flight': self._in_flight,
+                'requests_available': round(self._requests, 2),
+                'tokens_available': int(self._tokens),
+                'blocked_for_s': round(max(0.0, self._blocked_until - time.monotonic()), 2),
+            }
+
+
+groq_scheduler = GroqScheduler(GROQ_RPM, GROQ_TPM, GROQ_MAX_CONCURRENCY, GROQ_MAX_RETRIES)
+
+
+def llm_complete(messages: list, temperature: float, max_completion_tokens: int, model: str = LLAMA4_MODEL,
+                 priority: Optional[int] = None) -> str:
+    """Groq chat completion through the response cache and the shared scheduler"""
+    key = LLMCache.make_key(model, messages, temperature=temperature, max_completion_tokens=max_completion_tokens)
+    with span('groq_call', model=model, stream=False) as attrs:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            print("⚡ LLM cache hit")
+            attrs['cache'] = 'hit'
+            return cached
+        
+        attrs['cache'] = 'miss'
+        raw, lease = groq_scheduler.submit(
+            lambda: get_groq_client().chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_completion_tokens=max_completion_tokens,
+                stream=False
+            ),
+            GroqScheduler.estimate_tokens(messages, max_completion_tokens),
+            current_groq_priority() if priority is None else priority,
+        )
+        used_tokens = None
+        try:
+            response = raw.parse()
+            used_tokens = getattr(getattr(response, 'usage', None), 'total_tokens', None)
+            content = response.choices[0].message.content.strip()
+        finally:
+            groq_scheduler.release(lease, used_tokens)
+    llm_cache.set(key, content, model=model)
+    return content
+
+
+def llm_stream(messages: list, temperature: float, max_completion_tokens: int, model: str = LLAMA4_MODEL,
+               priority: Optional[int] = None):
+    """
+    Streaming Groq chat completion - yields tokens as they arrive.
+    Cache hits are yielded as a single chunk; misses are cached once complete.
+    """
+    key = LLMCache.make_key(model, messages, temperature=temperature, max_completion_tokens=max_completion_tokens)
+    cached = llm_cache.get(key)
+    if cached is not None:
+        print("⚡ LLM cache hit")
+        record_span('groq_call', 0.0, model=model, stream=True, cache='hit')
+        yield cached
+        return
+    
+    started = time.time()
+    clock = time.perf_counter()
+    first_token_s = None
+    ok = False
+    lease = None
+    parts = []
+    try:
+        raw, lease = groq_scheduler.submit(
+            lambda: get_groq_client().chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_completion_tokens=max_completion_tokens,
+                stream=True
+            ),
+            GroqScheduler.estimate_tokens(messages, max_completion_tokens),
+            current_groq_priority() if priority is None else priority,
+        )
+        
+        for chunk in raw.parse():
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                if first_token_s is None:
+                    first_token_s = round(time.perf_counter() - clock, 3)
+                parts.append(token)
+                yield token
+        ok = True
+    except GeneratorExit:
+        ok = True  # reader stopped early, not a Groq failure
+        raise
+    finally:
+        if lease is not None:
+            prompt_tokens = sum(len(str(m.get('content', ''))) for m in messages) // CHARS_PER_TOKEN
+            groq_scheduler.release(lease, prompt_tokens + len("".join(parts)) // CHARS_PER_TOKEN)
+        record_span('groq_call', time.perf_counter() - clock, started=started, ok=ok,
+                    model=model, stream=True, cache='miss', first_token_s=first_token_s)
+    
+    llm_cache.set(key, "".join(parts).strip(), model=model)
+
+
+class TokenChannel:
+    """Thread-safe token buffer that any number of SSE readers can follow"""
+    
+    def __init__(self):
+        self._tokens = []
+        self._closed = False
+        self._cond = threading.Condition()
+    
+    @property
+    def closed(self) -> bool:
+        return self._closed
+    
+    def append(self, token: str):
+        with self._cond:
+            self._tokens.append(token)
+            self._cond.notify_all()
+    
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+    
+    def follow(self, heartbeat: float = 15.0):
+        """Yield every token from the start; None on idle heartbeats"""
+        index = 0
+        while True:
+            with self._cond:
+                if index >= len(self._tokens) and not self._closed:
+                    self._cond.wait(timeout=heartbeat)
+                new_tokens = self._tokens[index:]
+                index += len(new_tokens)
+                finished = self._closed and index >= len(self._tokens)
+            
+            if new_tokens:
+                yield "".join(new_tokens)
+            elif not finished:
+                yield None
+            if finished:
+                return
+
+
+def sse_event(data: dict, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """Format one Server-Sent Event frame"""
+    frame = f"id: {event_id}\n" if event_id else ""
+    frame += f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# ==================== MAP-REDUCE EXTRACTION ====================
+CHUNK_EXTRACTION_PROMPT = """Below is part {index} of {total} of a Volza shipment search page for {company_name} ({product_name}).
+
+PAGE TEXT (PART {index}/{total}):
+{chunk}
+
+List EVERY shipment row that appears in this part. Return ONLY JSON in this shape:
+{{"shipments": [{{"date": "YYYY-MM-DD", "shipper": "...", "consignee": "...", "country": "destination country", "hs_code": "...", "quantity": number, "value": number}}]}}
+Use null for unknown fields. Do not summarise, do not skip rows, do not invent rows. If there are none, return {{"shipments": []}}."""
+
+# Shared by every analysis, so parallel batch items cannot multiply the Groq concurrency
+_extraction_slots = threading.BoundedSemaphore(EXTRACTION_MAX_PARALLEL)
+
+
+def chunk_text(text: str, max_tokens: int = EXTRACTION_CHUNK_TOKENS) -> list:
+    """Split on line boundaries into chunks of at most max_tokens (estimated); deterministic"""
+    budget = max(1, max_tokens * CHARS_PER_TOKEN)
+    chunks, current, size = [], [], 0
+    
+    for line in text.splitlines():
+        while len(line) > budget:
+            if current:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            chunks.append(line[:budget])
+            line = line[budget:]
+        if current and size + len(line) + 1 > budget:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    
+    if current:
+        chunks.append("\n".join(current))
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def parse_chunk_shipments(content: str) -> Optional[list]:
+    """JSON from one map call -> ShipmentRecords; None when the reply is not parseable"""
+    match = re.search(r'\{.*\}|\[.*\]', content or "", re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    
+    rows = data.get('shipments', []) if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        return None
+    
+    def text(row, key):
+        value = row.get(key)
+        return "" if value is None else str(value).strip()
+    
+    records = []
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        record = ShipmentRecord(
+            shipper=text(row, 'shipper'),
+            consignee=text(row, 'consignee'),
+            country=text(row, 'country'),
+            date=parse_shipment_date(text(row, 'date')),
+            hs_code=text(row, 'hs_code'),
+            quantity=parse_number(text(row, 'quantity')),
+            value=parse_number(text(row, 'value')),
+        )
+        if record.shipper or record.consignee:
+            records.append(record)
+    return records
+
+
+def extract_chunk_shipments(chunk: str, index: int, total: int, company_name: str, product_name: str) -> Optional[list]:
+    """
+    Rows of one chunk. A dense chunk can need more JSON than EXTRACTION_OUTPUT_TOKENS, which
+    truncates the reply so it no longer parses - such a chunk is retried as two halves until
+    the pieces fit. Lines that still fail are logged as dropped. None if nothing parsed.
+    """
+    prompt = CHUNK_EXTRACTION_PROMPT.format(
+        index=index, total=total, chunk=chunk, company_name=company_name, product_name=product_name
+    )
+    with _extraction_slots:
+        content = llm_complete(
+            messages=[
+                {"role": "system", "content": "You are a data extraction specialist. You output strict JSON only."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0,
+            max_completion_tokens=EXTRACTION_OUTPUT_TOKENS
+        )
+    records = parse_chunk_shipments(content)
+    if records is not None:
+        return records
+    
+    lines = chunk.splitlines()
+    if len(lines) < 2:
+        print(f"⚠️ Chunk {index}/{total}: reply not parseable - dropped {len(chunk):,} chars: {chunk[:120]!r}")
+        return None
+    print(f"✂️ Chunk {index}/{total}: reply truncated or not parseable - retrying {len(lines)} lines as two halves")
+    half = len(lines) // 2
+    parts = [extract_chunk_shipments("\n".join(part), index, total, company_name, product_name)
+             for part in (lines[:half], lines[half:])]
+    if all(part is None for part in parts):
+        return None
+    return [record for part in parts if part for record in part]
+
+
+def map_reduce_extract(full_page_text: str, company_name: str, product_name: str) -> list:
+    """
+    Map: extract shipment rows from every chunk in parallel.
+    Reduce: merge the rows in chunk order. Returns the ShipmentRecords (empty if none were found).
+    """
+    chunks = chunk_text(full_page_text)
+    if not chunks:
+        return []
+    
+    job = getattr(_trace, 'job', None)
+    priority = current_groq_priority()
     
-    return None
+    def run(numbered):
+        index, chunk = numbered
+        with trace_job(job), groq_priority(priority):
+            try:
+                return extract_chunk_shipments(chunk, index, len(chunks), company_name, product_name)
+            except Exception as e:
+                print(f"⚠️ Chunk {index}/{len(chunks)} failed: {e}")
+                return None
+    
+    print(f"🧩 Extracting {len(chunks)} chunks ({len(full_page_text):,} chars, up to {EXTRACTION_MAX_PARALLEL} in parallel)...")
+    with ThreadPoolExecutor(max_workers=min(EXTRACTION_MAX_PARALLEL, len(chunks))) as pool:
+        results = list(pool.map(run, enumerate(chunks, 1)))
+    
+    records = [record for part in results if part for record in part]
+    parsed = sum(1 for part in results if part is not None)
+    print(f"🧩 Extracted {len(records)} shipments from {parsed}/{len(chunks)} text chunks "
+          f"({len(full_page_text):,} characters)")
+    return records
+
 
+def recover_page_shipments(company_name: str, product_name: str, records, page_text: str):
+    """
+    No table rows were captured: extract them from the page text and store them in history
+    like captured rows, so the analysis, batch results and retrieval index all use them.
+    Returns the records to analyse.
+    """
+    if records or not page_text:
+        return records
+    extracted = map_reduce_extract(page_text, company_name, product_name)
+    if not extracted:
+        return records
+    # Only a full search can come back empty: an incremental one returns the stored rows
+    return merge_captured_shipments(company_name, extracted, None)
 
-def extract_detailed_info_with_ai(full_page_text: str, company_name: str, product_name: str) -> str:
+
+def extract_detailed_info_with_ai(full_page_text: str, company_name: str, product_name: str, records: Optional[list] = None, on_token=None) -> str:
     """
     🎯 FOCUSED: Quick assessment of supplier legitimacy
+    Metrics come from local aggregation of the records (captured rows, or rows
+    recovered from the page text by recover_page_shipments), with a single
+    free-text extraction call as the last resort.
+    The report is streamed; on_token(token) receives each chunk as it arrives.
     """
     
-    # Concise extraction prompt
-    extraction_prompt = f"""Analyze trade data for {company_name} trading {product_name}.
+    try:
+        raw_data = None
+        if records:
+            print("📊 Computing trade metrics locally...")
+            raw_data = format_trade_metrics(aggregate_trade_metrics(records))
+            print("✅ Trade metrics computed")
+        
+        if not raw_data:
+            # Concise extraction prompt
+            extraction_prompt = f"""Analyze trade data for {company_name} trading {product_name}.
 
 FULL PAGE TEXT:
 {full_page_text[:15000]}
@@ -475,22 +2774,17 @@ Extract ONLY:
 3. Total shipments count
 4. Date range of shipments"""
 
-    try:
-        print("🔍 Extracting key trade data...")
-        
-        extraction_response = client.chat.completions.create(
-            model=LLAMA4_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a data extraction specialist. Extract only the specific information requested."},
-                {"role": "user", "content": extraction_prompt}
-            ],
-            temperature=0.3,
-            max_completion_tokens=1500,
-            stream=False
-        )
-        
-        raw_data = extraction_response.choices[0].message.content.strip()
-        print("✅ Raw data extracted")
+            print("🔍 Extracting key trade data...")
+            
+            raw_data = llm_complete(
+                messages=[
+                    {"role": "system", "content": "You are a data extraction specialist. Extract only the specific information requested."},
+                    {"role": "user", "content": extraction_prompt}
+                ],
+                temperature=0.3,
+                max_completion_tokens=1500
+            )
+            print("✅ Raw data extracted")
         
         # Focused analysis prompt
         analysis_prompt = f"""You are analyzing supplier {company_name} for {product_name}.
@@ -557,8 +2851,8 @@ CRITICAL INSTRUCTIONS:
 
         print("🤖 Generating focused analysis...")
         
-        analysis_response = client.chat.completions.create(
-            model=LLAMA4_MODEL,
+        report_parts = []
+        for token in llm_stream(
             messages=[
                 {
                     "role": "system", 
@@ -567,11 +2861,13 @@ CRITICAL INSTRUCTIONS:
                 {"role": "user", "content": analysis_prompt}
             ],
             temperature=0.5,
-            max_completion_tokens=1200,
-            stream=False
-        )
+            max_completion_tokens=1200
+        ):
+            report_parts.append(token)
+            if on_token:
+                on_token(token)
         
-        intelligent_analysis = analysis_response.choices[0].message.content.strip()
+        intelligent_analysis = "".join(report_parts).strip()
         print("✅ Focused analysis complete")
         
         return intelligent_analysis
@@ -588,19 +2884,148 @@ Error: {e}
 Please try again."""
 
 
-def query_company_data_direct(query: str, company_name: str, extracted_data: str) -> str:
+# ==================== RAW CAPTURE RETRIEVAL ====================
+class CaptureIndex:
     """
-    🚀 DIRECT AI QUERY - No RAG needed!
-    Much faster and simpler for single company analysis
+    Per-company vector index over the raw capture (one document per shipment row,
+    or small page-text chunks when no rows were captured). Embedded on CPU in
+    batches and persisted with chromadb; unchanged captures are never re-embedded.
     """
-    try:
-        print(f"\n🔍 Direct query for company: '{company_name}'")
+    
+    def __init__(self, path: str, model_name: str, batch_size: int, enabled: bool = True):
+        self.path = path
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.available = enabled
+        self._client = None
+        self._model = None
+        self._lock = threading.Lock()
+        self._builds = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture-index")
+    
+    def _load(self) -> bool:
+        """Import the heavy dependencies on first use only"""
+        if not self.available:
+            return False
+        with self._lock:
+            if self._client is None:
+                try:
+                    import chromadb
+                    from sentence_transformers import SentenceTransformer
+                    self._model = SentenceTransformer(self.model_name, device="cpu")
+                    self._client = chromadb.PersistentClient(path=self.path)
+                    print(f"✅ Capture index ready ({self.model_name})")
+                except Exception as e:
+                    print(f"ℹ️ Capture index disabled ({e}) - chat answers from the report only")
+                    self.available = False
+                    return False
+        return True
+    
+    @staticmethod
+    def collection_name(company_name: str) -> str:
+        # chromadb names allow [a-zA-Z0-9._-] only
+        return "co_" + hashlib.sha1(normalize_company_key(company_name).encode()).hexdigest()[:16]
+    
+    @staticmethod
+    def documents(records: list, page_text: str) -> list:
+        if records:
+            return shipments_to_text(records).splitlines()[1:]
+        return chunk_text(page_text or "", max_tokens=150)
+    
+    def _embed(self, texts: list) -> list:
+        vectors = self._model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                     show_progress_bar=False, convert_to_numpy=True)
+        return vectors.tolist()
+    
+    def build(self, company_name: str, records: list, page_text: str):
+        docs = self.documents(records, page_text)
+        if not docs or not self._load():
+            return
+        
+        name = self.collection_name(company_name)
+        content_hash = hashlib.sha256("\n".join(docs).encode()).hexdigest()
+        try:
+            existing = self._client.get_collection(name)
+            if (existing.metadata or {}).get('content_hash') == content_hash:
+                print(f"⚡ Capture index for {company_name} is up to date")
+                return
+            self._client.delete_collection(name)
+        except Exception:
+            pass  # no index yet
+        
+        with span('capture_index', documents=len(docs)):
+            collection = self._client.create_collection(
+                name, metadata={'company_name': company_name, 'content_hash': content_hash, 'hnsw:space': 'cosine'}
+            )
+            # Embed and add in batches so memory stays bounded for large exporters
+            step = self.batch_size * 16
+            for start in range(0, len(docs), step):
+                batch = docs[start:start + step]
+                collection.add(
+                    ids=[f"{name}-{start + i}" for i in range(len(batch))],
+                    documents=batch,
+                    embeddings=self._embed(batch),
+                )
+        print(f"✅ Indexed {len(docs)} capture documents for {company_name}")
+    
+    def build_async(self, company_name: str, records: list, page_text: str):
+        """Index in the background so the report is not delayed by embedding"""
+        if not self.available:
+            return
+        job = getattr(_trace, 'job', None)
+        
+        def run():
+            with trace_job(job):
+                try:
+                    self.build(company_name, records, page_text)
+                except Exception as e:
+                    print(f"⚠️ Capture indexing failed for {company_name}: {e}")
+        
+        self._builds[self.collection_name(company_name)] = self._executor.submit(run)
+    
+    def retrieve(self, company_name: str, query: str, k: int = RETRIEVAL_TOP_K) -> list:
+        """Top-k raw capture documents for the question ([] when unavailable)"""
+        if not self.available or not company_name:
+            return []
+        name = self.collection_name(company_name)
+        pending = self._builds.get(name)
+        if pending is not None:
+            try:
+                pending.result(timeout=30)  # a question right after the analysis waits for its index
+            except Exception:
+                pass
+        if not self._load():
+            return []
         
-        prompt = f"""You are a Senior International Trade Intelligence Expert analyzing {company_name}.
+        try:
+            with span('retrieval'):
+                collection = self._client.get_collection(name)
+                count = collection.count()
+                if not count:
+                    return []
+                result = collection.query(query_embeddings=self._embed([query]), n_results=min(k, count))
+            return result['documents'][0]
+        except Exception as e:
+            print(f"ℹ️ No capture index for {company_name}: {e}")
+            return []
+
+
+capture_index = CaptureIndex(VECTOR_INDEX_DIR, EMBEDDING_MODEL, EMBED_BATCH_SIZE, enabled=RETRIEVAL_ENABLED)
+
+
+def build_query_messages(query: str, company_name: str, extracted_data: str) -> list:
+    """Chat prompt for a question about the analysed company (plus retrieved raw capture rows)"""
+    retrieved = capture_index.retrieve(company_name, query)
+    context = ""
+    if retrieved:
+        context = "\nRELEVANT RAW CAPTURE RECORDS (Date | Shipper | Consignee | Country | HS Code | Quantity | Value USD, when tabular):\n"
+        context += "\n".join(f"- {doc}" for doc in retrieved) + "\n"
+    
+    prompt = f"""You are a Senior International Trade Intelligence Expert analyzing {company_name}.
 
 COMPLETE EXTRACTED DATA:
 {extracted_data}
-
+{context}
 USER QUESTION: {query}
 
 INSTRUCTIONS:
@@ -612,21 +3037,28 @@ INSTRUCTIONS:
 
 ANSWER:"""
 
-        completion = client.chat.completions.create(
-            model=LLAMA4_MODEL,
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"You are a Senior International Trade Intelligence Expert. You ONLY provide information about {company_name}. Use only the provided data."
-                },
-                {"role": "user", "content": prompt}
-            ],
+    return [
+        {
+            "role": "system",
+            "content": f"You are a Senior International Trade Intelligence Expert. You ONLY provide information about {company_name}. Use only the provided data."
+        },
+        {"role": "user", "content": prompt}
+    ]
+
+
+def query_company_data_direct(query: str, company_name: str, extracted_data: str) -> str:
+    """
+    🚀 DIRECT AI QUERY on the report, plus the top-k raw capture rows for the question
+    """
+    try:
+        print(f"\n🔍 Direct query for company: '{company_name}'")
+        
+        answer = llm_complete(
+            messages=build_query_messages(query, company_name, extracted_data),
             temperature=0.3,
             max_completion_tokens=1500,
-            stream=False
+            priority=PRIORITY_CHAT
         )
-        
-        answer = completion.choices[0].message.content.strip()
         print("✅ Direct query complete")
         return answer
         
@@ -635,6 +3067,35 @@ ANSWER:"""
         return f"❌ Error querying data: {e}"
 
 
+def query_company_data_stream(query: str, company_name: str, extracted_data: str):
+    """⚡ Streaming variant of query_company_data_direct - yields answer tokens"""
+    try:
+        print(f"\n🔍 Streaming query for company: '{company_name}'")
+        
+        yield from llm_stream(
+            messages=build_query_messages(query, company_name, extracted_data),
+            temperature=0.3,
+            max_completion_tokens=1500,
+            priority=PRIORITY_CHAT
+        )
+        print("✅ Streaming query complete")
+        
+    except Exception as e:
+        print(f"❌ Error in query: {e}")
+        yield f"❌ Error querying data: {e}"
+
+
+OTP_PATTERNS = [r'(\d{6})', r'OTP[:\s]+(\d+)', r'code[:\s]+(\d+)']
+
+
+def extract_otp(text: str) -> Optional[str]:
+    for pattern in OTP_PATTERNS:
+        otp_match = re.search(pattern, text, re.IGNORECASE)
+        if otp_match:
+            return otp_match.group(1)
+    return None
+
+
 def fetch_latest_otp(sender_email: str, subject_keyword: str, max_attempts: int = 3, wait_between_attempts: int = 5) -> Optional[str]:
     if not all([APP_PASSWORD, EMAIL, IMAP_SERVER, IMAP_PORT]):
         return None
@@ -679,13 +3140,7 @@ def fetch_latest_otp(sender_email: str, subject_keyword: str, max_attempts: int
             else:
                 email_body = msg.get_payload(decode=True).decode()
             
-            patterns = [r'(\d{6})', r'OTP[:\s]+(\d+)', r'code[:\s]+(\d+)']
-            otp_code = None
-            for pattern in patterns:
-                otp_match = re.search(pattern, email_body, re.IGNORECASE)
-                if otp_match:
-                    otp_code = otp_match.group(1)
-                    break
+            otp_code = extract_otp(email_body)
             
             mail.logout()
             
@@ -702,127 +3157,604 @@ def fetch_latest_otp(sender_email: str, subject_keyword: str, max_attempts: int
             continue
     
     return None
-# ==================== MAIN AUTOMATION FUNCTIONS ====================
-def run_volza_automation(product_name):
-    """Main automation - FIRST TIME WITH LOGIN"""
+
+
+# ==================== OTP WATCHER (IMAP IDLE) ====================
+_IMAP_TOKEN = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+
+
+def parse_imap_list(data: bytes) -> list:
+    """Parse an IMAP parenthesised list (e.g. a BODYSTRUCTURE) into nested Python lists"""
+    stack = [[]]
+    for token in _IMAP_TOKEN.findall(data):
+        if token == b'(':
+            stack.append([])
+        elif token == b')':
+            if len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+        elif token.startswith(b'"'):
+            stack[-1].append(re.sub(rb'\\(.)', rb'\1', token[1:-1]).decode('utf-8', 'replace'))
+        elif token.upper() == b'NIL':
+            stack[-1].append(None)
+        else:
+            stack[-1].append(token.decode('utf-8', 'replace'))
+    return stack[0]
+
+
+def find_text_parts(structure: list, prefix: str = "") -> list:
+    """(section, subtype, encoding, charset) for every text/* leaf of a BODYSTRUCTURE"""
+    if not structure:
+        return []
+    if isinstance(structure[0], list):
+        # Multipart: child parts come first, then the subtype and its parameters
+        parts = []
+        for i, child in enumerate(structure, 1):
+            if not isinstance(child, list):
+                break
+            parts.extend(find_text_parts(child, f"{prefix}{i}."))
+        return parts
+    
+    maintype = str(structure[0]).lower()
+    subtype = str(structure[1]).lower() if len(structure) > 1 else ""
+    if maintype != 'text':
+        return []
+    params = structure[2] if len(structure) > 2 and isinstance(structure[2], list) else []
+    charset = next((str(v) for k, v in zip(params[::2], params[1::2]) if str(k).lower() == 'charset'), 'utf-8')
+    encoding = str(structure[5]).lower() if len(structure) > 5 and structure[5] else '7bit'
+    return [(prefix.rstrip('.') or '1', subtype, encoding, charset)]
+
+
+def decode_part(payload: bytes, encoding: str, charset: str) -> str:
+    if encoding == 'base64':
+        payload = base64.b64decode(payload)
+    elif encoding == 'quoted-printable':
+        payload = quopri.decodestring(payload)
+    try:
+        return payload.decode(charset or 'utf-8', 'replace')
+    except LookupError:
+        return payload.decode('utf-8', 'replace')
+
+
+class _SocketLines:
+    """
+    Line reader straight off the IMAP socket for IDLE. select() cannot see data
+    already sitting in imaplib's buffered file, so IDLE responses never go through it.
+    """
+    
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b""
+    
+    def next(self, timeout: float) -> Optional[bytes]:
+        """The next response line, or None if none is complete within timeout"""
+        deadline = time.time() + timeout
+        while b"\n" not in self.buffer:
+            remaining = deadline - time.time()
+            # TLS records already decrypted are invisible to select() too
+            pending = getattr(self.sock, 'pending', lambda: 0)()
+            if remaining <= 0 or not (pending or select.select([self.sock], [], [], remaining)[0]):
+                return None
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise imaplib.IMAP4.abort("connection closed during IDLE")
+            self.buffer += chunk
+        line, _, self.buffer = self.buffer.partition(b"\n")
+        return line + b"\n"
+
+
+class OtpWatcher:
+    """
+    Long-lived IMAP connection for Volza OTP mails.
+    Armed before "Send OTP" is clicked: remembers UIDNEXT, then waits with IDLE and
+    only looks at newer messages, fetching just their text part.
+    """
+    
+    def __init__(self, host: str, port: int, user: str, password: str, sender: str, subject: str, use_ssl: bool = True):
+        self.host = host
+        self.port = int(port)
+        self.user = user
+        self.password = password
+        self.sender = sender
+        self.subject = subject
+        self.use_ssl = use_ssl
+        self._conn = None
+        self._can_idle = False
+        self._idle_tags = itertools.count(1)
+        # OTP mails are indistinguishable, so only one login may wait for one at a time
+        self._login_lock = threading.Lock()
+    
+    # ---------- connection ----------
+    def _connect(self):
+        conn = imaplib.IMAP4_SSL(self.host, self.port) if self.use_ssl else imaplib.IMAP4(self.host, self.port)
+        conn.login(self.user, self.password)
+        conn.select("inbox")
+        self._can_idle = 'IDLE' in conn.capabilities
+        self._conn = conn
+        print(f"✅ IMAP watcher connected ({'IDLE' if self._can_idle else 'polling'})")
+    
+    def _ensure_connected(self):
+        if self._conn is not None:
+            try:
+                if self._conn.noop()[0] == 'OK':
+                    return
+            except Exception:
+                pass
+            self.close()
+        self._connect()
+    
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.logout()
+            except Exception:
+                pass
+        self._conn = None
+    
+    def _uid_next(self) -> int:
+        status, data = self._conn.status('INBOX', '(UIDNEXT)')
+        match = re.search(rb'UIDNEXT (\d+)', data[0] or b'') if status == 'OK' else None
+        if not match:
+            raise imaplib.IMAP4.error("UIDNEXT not available")
+        return int(match.group(1))
+    
+    # ---------- waiting ----------
+    def _idle(self, timeout: float):
+        """
+        One IDLE round: returns when the server pushes a mailbox change or timeout expires.
+        imaplib has no IDLE before Python 3.14, so the round is driven with the public
+        send()/socket() API; the previous command's tagged reply has been read, so
+        imaplib's buffer is empty and every IDLE response arrives on the socket.
+        """
+        conn = self._conn
+        lines = _SocketLines(conn.socket())
+        tag = b'OTPW%d' % next(self._idle_tags)
+        conn.send(tag + b' IDLE\r\n')
+        continuation = lines.next(30)
+        if not continuation or not continuation.startswith(b'+'):
+            raise imaplib.IMAP4.error("IDLE rejected")
+        try:
+            deadline = time.time() + timeout
+            while True:
+                line = lines.next(deadline - time.time())
+                if line is None:
+                    return
+                if b'EXISTS' in line or b'RECENT' in line:
+                    return
+        finally:
+            conn.send(b'DONE\r\n')
+            while True:
+                line = lines.next(30)
+                if line is None:
+                    raise imaplib.IMAP4.abort("no reply to IDLE DONE")
+                if line.startswith(tag):
+                    break
     
-    driver = None
-    wait = None
+    def _check(self, uid_floor: int) -> Optional[str]:
+        """UID-bounded search for the OTP mail; fetches only the text body part"""
+        status, data = self._conn.uid('SEARCH', f'(UID {uid_floor}:* FROM "{self.sender}" SUBJECT "{self.subject}")')
+        if status != 'OK' or not data or not data[0]:
+            return None
+        # "n:*" always matches the newest message, even when it is older than n
+        uids = [int(u) for u in data[0].split() if int(u) >= uid_floor]
+        for uid in sorted(uids, reverse=True):
+            otp_code = self._fetch_otp(uid)
+            if otp_code:
+                return otp_code
+        return None
+    
+    def _fetch_otp(self, uid: int) -> Optional[str]:
+        status, data = self._conn.uid('FETCH', str(uid), '(BODYSTRUCTURE)')
+        if status != 'OK' or not data or data[0] is None:
+            return None
+        raw = b"".join(part if isinstance(part, bytes) else b"".join(part) for part in data)
+        items = parse_imap_list(raw)
+        response = next((item for item in items if isinstance(item, list)), [])
+        structure = next((response[i + 1] for i, item in enumerate(response[:-1])
+                          if isinstance(item, str) and item.upper() == 'BODYSTRUCTURE'), None)
+        parts = find_text_parts(structure or [])
+        # Plain text first, HTML only as a fallback
+        parts.sort(key=lambda p: p[1] != 'plain')
+        
+        for section, subtype, encoding, charset in parts:
+            # BODY[] (not PEEK) marks the mail read in the same round trip
+            status, data = self._conn.uid('FETCH', str(uid), f'(BODY[{section}])')
+            if status != 'OK':
+                continue
+            payload = next((part[1] for part in data if isinstance(part, tuple)), b"")
+            text = decode_part(payload, encoding, charset)
+            if subtype == 'html':
+                text = re.sub(r'<[^>]+>', ' ', text)
+            otp_code = extract_otp(text)
+            if otp_code:
+                return otp_code
+        return None
+    
+    def wait_for_otp(self, uid_floor: int, timeout: float = OTP_WAIT_TIMEOUT) -> Optional[str]:
+        deadline = time.time() + timeout
+        while True:
+            otp_code = self._check(uid_floor)
+            if otp_code:
+                print("✅ OTP received via IMAP watcher")
+                return otp_code
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                print("⚠️ OTP watcher timed out")
+                return None
+            if self._can_idle:
+                self._idle(min(remaining, OTP_IDLE_SLICE))
+            else:
+                time.sleep(min(remaining, 2))
+                self._conn.noop()
     
+    @contextmanager
+    def armed(self):
+        """
+        Arm before clicking "Send OTP"; yields a callable that returns the code.
+        Falls back to fetch_latest_otp when the watcher cannot connect.
+        """
+        with self._login_lock:
+            uid_floor = None
+            try:
+                self._ensure_connected()
+                uid_floor = self._uid_next()
+                print(f"📧 OTP watcher armed at UID {uid_floor}")
+            except Exception as e:
+                print(f"⚠️ OTP watcher unavailable, falling back to polling: {e}")
+                self.close()
+            
+            @traced('otp_wait')
+            def wait_for_code() -> Optional[str]:
+                if uid_floor is not None:
+                    try:
+                        return self.wait_for_otp(uid_floor)
+                    except Exception as e:
+                        print(f"⚠️ OTP watcher failed: {e}")
+                        self.close()
+                return fetch_latest_otp(self.sender, self.subject)
+            
+            yield wait_for_code
+
+
+otp_watcher = OtpWatcher(IMAP_SERVER, IMAP_PORT, EMAIL, APP_PASSWORD, OTP_SENDER_EMAIL, OTP_SUBJECT_KEYWORD, use_ssl=IMAP_SSL)
+
+
+# ==================== SESSION FAST-PATH ====================
+VOLZA_WORKSPACE_URL = f"{VOLZA_BASE_URL}/workspace/search/0"
+NEW_SEARCH_XPATH = "//span[@class='ml10 main-header-text' and text()='New Search']"
+COMPANY_SELECT_XPATH = "//button[contains(text(), 'Global Kemya India Llp')]"
+EMAIL_FIELD_XPATH = "//input[@name='emailAddress']"
+
+# Checked in priority order: whichever is visible first tells us where the session stands
+LOGIN_STATES = [
+    ('authenticated', NEW_SEARCH_XPATH),
+    ('company_select', COMPANY_SELECT_XPATH),
+    ('login', EMAIL_FIELD_XPATH),
+]
+
+LOGIN_STATE_SCRIPT = """
+var states = arguments[0], timeoutMs = arguments[1];
+var done = arguments[arguments.length - 1];
+var start = Date.now();
+function visible(xpath) {
+    var el = document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    if (!el) return false;
+    var r = el.getBoundingClientRect();
+    return r.width > 0 || r.height > 0;
+}
+(function check() {
+    for (var i = 0; i < states.length; i++) {
+        if (visible(states[i][1])) { done(states[i][0]); return; }
+    }
+    if (Date.now() - start >= timeoutMs) { done(null); return; }
+    setTimeout(check, 100);
+})();
+"""
+
+
+def detect_login_state(driver, timeout: float = 30) -> Optional[str]:
+    """'authenticated', 'company_select', 'login' or None - one in-browser wait instead of per-element polling"""
+    try:
+        driver.set_script_timeout(timeout + 5)
+        return driver.execute_async_script(LOGIN_STATE_SCRIPT, LOGIN_STATES, int(timeout * 1000))
+    except Exception as e:
+        print(f"⚠️ Could not detect login state: {e}")
+        return None
+
+
+def save_browser_session(driver, session):
+    """Persist cookies + localStorage so a fresh Chrome can skip the OTP login"""
+    try:
+        snapshot = {
+            'saved_at': datetime.datetime.now().isoformat(),
+            'url': driver.current_url,
+            'cookies': driver.get_cookies(),
+            'local_storage': driver.execute_script("return Object.assign({}, window.localStorage);") or {},
+        }
+        os.makedirs(os.path.dirname(session.state_file), exist_ok=True)
+        tmp_path = session.state_file + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.chmod(tmp_path, 0o600)
+        os.replace(tmp_path, session.state_file)
+        print(f"💾 Saved Volza session ({len(snapshot['cookies'])} cookies)")
+    except Exception as e:
+        print(f"⚠️ Could not save Volza session: {e}")
+
+
+def restore_browser_session(driver, session) -> bool:
+    """Load saved cookies + localStorage into the current origin and reload; False if nothing usable"""
     try:
-        state['status'] = "🤖 Initializing Chrome browser (AUTO-UPDATE ENABLED)..."
-        state['progress'] = 10
+        with open(session.state_file, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    
+    now = time.time()
+    restored = 0
+    for cookie in snapshot.get('cookies', []):
+        if cookie.get('expiry') and cookie['expiry'] < now:
+            continue
+        if cookie.get('sameSite') not in ('Strict', 'Lax', 'None'):
+            cookie.pop('sameSite', None)
+        try:
+            driver.add_cookie(cookie)
+            restored += 1
+        except Exception:
+            pass  # cookie for another domain
+    
+    local_storage = snapshot.get('local_storage') or {}
+    if local_storage:
+        try:
+            driver.execute_script(
+                "var items = arguments[0]; for (var k in items) { window.localStorage.setItem(k, items[k]); }",
+                local_storage
+            )
+        except Exception as e:
+            print(f"⚠️ Could not restore localStorage: {e}")
+    
+    if not restored and not local_storage:
+        return False
+    print(f"♻️ Restored saved Volza session ({restored} cookies, {len(local_storage)} storage keys)")
+    driver.get(VOLZA_WORKSPACE_URL)
+    return True
+
+
+# ==================== MAIN AUTOMATION FUNCTIONS ====================
+def open_volza_session(job, session, headless: bool = False):
+    """
+    Launch (or reuse) the session's browser and get it to a logged-in workspace.
+    Fast path: an already valid profile session or saved cookies/localStorage;
+    the email OTP login only runs when the session has really expired.
+    headless=True is for unattended (batch/bench) sessions; a headless browser is
+    relaunched with a window when an interactive analysis needs it.
+    """
+    load_selenium()
+    
+    if session.alive() and session.headless and not headless:
+        print(f"🪟 Relaunching browser {session.index} with a window for manual company entry")
+        session.quit()
+    
+    if session.alive():
+        # Browser survived a failed login - reuse it instead of leaking a second Chrome
+        driver = session.driver
+    else:
+        job['status'] = "🤖 Initializing Chrome browser (AUTO-UPDATE ENABLED)..."
+        job['progress'] = 10
         
         import undetected_chromedriver as uc
         
         options = uc.ChromeOptions()
         options.add_argument("--disable-blink-features=AutomationControlled")
         
-        driver = get_uc_driver_with_auto_update(chrome_options=options)
-        
-        driver.implicitly_wait(15)
-        driver.maximize_window()
-        wait = WebDriverWait(driver, 60)
-        
-        state['status'] = "🌐 Navigating to Volza..."
-        state['progress'] = 20
-        driver.get("https://app.volza.com/workspace/search/0")
-        time.sleep(2)
-        
-        # Login
-        state['status'] = "🔐 Logging in..."
-        state['progress'] = 30
-        
-        safe_find_and_send(driver, By.NAME, "emailAddress", LOGIN_EMAIL, wait_time=30, description="Email field")
-        time.sleep(0.5)
-        
-        safe_click(driver, By.XPATH, "//div[@class='child-sign-up-button' and text()='Send OTP']", wait_time=30, description="Send OTP button")
-        time.sleep(1)
-        
-        safe_click(driver, By.CLASS_NAME, "next-btn-swal", wait_time=30, description="OK button")
-        time.sleep(1)
+        with span('driver_init') as attrs:
+            driver = get_uc_driver_with_auto_update(chrome_options=options, user_data_dir=session.profile_dir,
+                                                    info=attrs, headless=headless)
+            session.headless = headless
+            
+            driver.implicitly_wait(IMPLICIT_WAIT)
+            if not headless:
+                driver.maximize_window()  # headless windows are already sized 1920x1080
+    
+    session.driver = driver
+    session.wait = WebDriverWait(driver, 60)
+    session.logged_in = False
+    
+    job['status'] = "🌐 Navigating to Volza..."
+    job['progress'] = 20
+    with span('navigation'):
+        driver.get(VOLZA_WORKSPACE_URL)
+        login_state = detect_login_state(driver)
+    login_path = 'profile'
+    
+    if login_state == 'login':
+        with span('session_restore'):
+            if restore_browser_session(driver, session):
+                login_state = detect_login_state(driver)
+                login_path = 'restored'
+    
+    if login_state not in ('authenticated', 'company_select'):
+        login_path = 'otp'
+        login_state = otp_login(job, driver)
+        if login_state not in ('authenticated', 'company_select'):
+            raise Exception("Volza login did not reach the workspace")
+    
+    if login_state == 'company_select':
+        with span('company_select'):
+            company_select_url = driver.current_url
+            safe_click(driver, By.XPATH, COMPANY_SELECT_XPATH, wait_time=30, description="Company selection")
+            wait_for_url_change(driver, company_select_url, timeout=60, description="Company selection redirect")
+    
+    if login_path != 'otp':
+        print(f"⚡ Volza session reused ({login_path}) - OTP login skipped")
+    job.set_timing('login_path', login_path)
+    session.logged_in = True
+    save_browser_session(driver, session)
+    if session.api is not None:
+        session.api.load_browser_auth(driver)
+
+
+# The dismiss icon of the popup shown after "Send OTP"; SVGElement has no click(), so dispatch one
+CLOSE_SVG_POPUP_SCRIPT = """
+const svg = document.querySelector("svg[stroke='currentColor'][height='20'][width='20']");
+if (!svg) return false;
+svg.dispatchEvent(new MouseEvent('click', {bubbles: true, cancelable: true}));
+return true;
+"""
+
+
+def otp_login(job, driver) -> Optional[str]:
+    """Email → Send OTP → OTP → Sign In; returns the login state after the redirect"""
+    # Login
+    job['status'] = "🔐 Logging in..."
+    job['progress'] = 30
+    
+    send_otp_xpath = "//div[@class='child-sign-up-button' and text()='Send OTP']"
+    sign_in_xpath = "//div[@class='child-sign-up-button' and text()='Sign In']"
+    
+    safe_find_and_send(driver, By.NAME, "emailAddress", LOGIN_EMAIL, wait_time=30, description="Email field")
+    wait_until_ready(driver, "email entered", 0.5, xpath=send_otp_xpath)
+    
+    # Arm the IMAP watcher first so the OTP mail is pushed to us the moment it lands
+    with otp_watcher.armed() as wait_for_code:
+        with span('otp_request'):
+            safe_click(driver, By.XPATH, send_otp_xpath, wait_time=30, description="Send OTP button")
+            wait_until_ready(driver, "OTP sent dialog", 1.0, xpath="//*[contains(@class, 'next-btn-swal')]")
+            
+            safe_click(driver, By.CLASS_NAME, "next-btn-swal", wait_time=30, description="OK button")
+            wait_until_ready(driver, "OTP dialog closed", 1.5)
         
-        # Close SVG popup
+        # Close SVG popup (the page has settled, so no need to wait for it to appear - one
+        # in-page check, not find_elements paying the implicit wait when there is none)
         try:
-            WebDriverWait(driver, 5).until(
-                EC.presence_of_element_located((By.XPATH, "//svg[@stroke='currentColor' and @height='20' and @width='20']"))
-            )
-            popup = driver.find_element(By.XPATH, "//svg[@stroke='currentColor' and @height='20' and @width='20']")
-            driver.execute_script("arguments[0].click();", popup)
-            print("✅ Closed SVG popup")
-        except:
-            print("ℹ️ No SVG popup found")
-        
-        time.sleep(0.5)
+            closed = driver.execute_script(CLOSE_SVG_POPUP_SCRIPT)
+            print("✅ Closed SVG popup" if closed else "ℹ️ No SVG popup found")
+        except Exception:
+            print("⚠️ Could not close SVG popup")
         
         # Get OTP
-        state['status'] = "📧 Retrieving OTP..."
-        otp_code = fetch_latest_otp(OTP_SENDER_EMAIL, OTP_SUBJECT_KEYWORD)
-        
-        if otp_code:
-            safe_find_and_send(driver, By.NAME, "password", otp_code, wait_time=30, description="OTP field")
-            time.sleep(1)
-        else:
-            state['status'] = "⚠️ Could not retrieve OTP. Please enter manually."
-            time.sleep(15)
-        
-        # Sign In
-        login_page_url = driver.current_url
-        safe_click(driver, By.XPATH, "//div[@class='child-sign-up-button' and text()='Sign In']", wait_time=30, description="Sign In button")
-        
+        job['status'] = "📧 Retrieving OTP..."
+        otp_code = wait_for_code()
+    
+    if otp_code:
+        safe_find_and_send(driver, By.NAME, "password", otp_code, wait_time=30, description="OTP field")
+        wait_until_ready(driver, "OTP entered", 1.0, xpath=sign_in_xpath)
+    else:
+        job['status'] = "⚠️ Could not retrieve OTP. Please enter manually."
+        scream_message("PLEASE ENTER THE OTP")
+        with span('otp_manual_entry'):
+            try:
+                # Proceed as soon as a full code has been typed instead of after a fixed 15s
+                with no_implicit_wait(driver):
+                    WebDriverWait(driver, 120, poll_frequency=0.5).until(
+                        lambda d: len((d.find_element(By.NAME, "password").get_attribute("value") or "").strip()) >= 6
+                    )
+            except TimeoutException:
+                print("⚠️ No OTP entered - trying Sign In anyway")
+    
+    # Sign In
+    login_page_url = driver.current_url
+    with span('sign_in'):
+        safe_click(driver, By.XPATH, sign_in_xpath, wait_time=30, description="Sign In button")
         wait_for_url_change(driver, login_page_url, timeout=60, description="Login redirect")
-        time.sleep(1)
-        
-        # Select company
-        company_select_url = driver.current_url
-        safe_click(driver, By.XPATH, "//button[contains(text(), 'Global Kemya India Llp')]", wait_time=30, description="Company selection")
-        
-        wait_for_url_change(driver, company_select_url, timeout=60, description="Company selection redirect")
+        return detect_login_state(driver)
+
+
+@traced('search_setup')
+def setup_global_search(driver, start_date: str = FULL_SEARCH_START_DATE):
+    """New Search → All Country (Global Search) → custom period → GlobalCompany field"""
+    country_xpath = "//span[text()='Select Country']"
+    global_option_xpath = "//span[@class='country-name' and text()='All Country (Global Search)']"
+    
+    safe_click(driver, By.XPATH, NEW_SEARCH_XPATH, wait_time=30, description="New Search button")
+    wait_until_ready(driver, "new search form", 2.0, xpath=country_xpath)
+    
+    safe_click(driver, By.XPATH, country_xpath, wait_time=30, description="Select Country dropdown")
+    wait_until_ready(driver, "country list", 0.5, xpath=global_option_xpath)
+    
+    safe_click(driver, By.XPATH, global_option_xpath, wait_time=30, description="Global Search option")
+    wait_until_ready(driver, "global search", 1.0, xpath="//*[@id='periodList']")
+    
+    # Date range
+    period_dropdown = driver.find_element(By.ID, "periodList")
+    period_dropdown.send_keys("Custom")
+    wait_until_ready(driver, "custom period", 0.5, xpath="//*[@id='globalDataFromDate']")
+    
+    set_search_start_date(driver, start_date)
+    wait_until_ready(driver, "start date", 0.5, xpath="//select[@name='field']")
+    
+    # Search field
+    search_field_dropdown = driver.find_element(By.NAME, "field")
+    Select(search_field_dropdown).select_by_value("GlobalCompany")
+    wait_until_ready(driver, "company field", 1.0)
+
+
+def set_search_start_date(driver, start_date: str):
+    """Overwrite the custom period's From date (DD/MM/YYYY)"""
+    start_date_input = driver.find_element(By.ID, "globalDataFromDate")
+    start_date_input.send_keys(Keys.CONTROL, 'a', Keys.BACK_SPACE)
+    start_date_input.send_keys(start_date)
+
+
+def apply_incremental_start(job, driver) -> Optional[str]:
+    """Narrow the filled-in search to shipments since the company's last analysis, if it has one"""
+    job['company_name'] = known_company_name(job['company_name'])
+    start_date = incremental_start_date(job['company_name'])
+    if start_date:
+        job['status'] = f"🔁 {job['company_name']} analysed before - searching shipments since {start_date}"
+        set_search_start_date(driver, start_date)
+        wait_until_ready(driver, "incremental start date", 0.5)
+    job.set_timing('search_from', start_date or FULL_SEARCH_START_DATE)
+    return start_date
+
+
+@traced('result_wait')
+def wait_for_results(driver, max_smart_wait: float = 15) -> bool:
+    """🚀 SMART WAIT: rows rendered, network idle and the table has stopped changing"""
+    start_smart_wait = time.time()
+    rows_xpath = "//*[contains(@class, 'ant-table-tbody')]//tr[@data-row-key]"  # <tbody> or virtual-list <div>
+    
+    # Replaces the old 300ms row polling plus the fixed 1s rendering buffer
+    if wait_until_ready(driver, "search results", 1.0, xpath=rows_xpath, timeout=max_smart_wait, prior_wait=True):
+        print(f"✅ Results loaded in {time.time() - start_smart_wait:.1f}s")
+        return True
+    
+    print("⚠️ Smart wait timeout - proceeding anyway (data might still be loading)")
+    return False
+
+
+def run_volza_automation(job, session, headless: bool = False):
+    """Main automation - FIRST TIME WITH LOGIN (launches the session's browser if needed)"""
+    
+    product_name = job['product_name']
+    
+    try:
+        open_volza_session(job, session, headless)
+        driver = session.driver
+        wait = session.wait
         
-        state['status'] = "✅ Login successful!"
-        state['progress'] = 50
-        time.sleep(2)
+        job['status'] = "✅ Login successful!"
+        job['progress'] = 50
+        wait_until_ready(driver, "workspace", 2.0, xpath=NEW_SEARCH_XPATH, timeout=30)
         
         # Setup search
-        state['status'] = "🔧 Setting up search..."
-        
-        safe_click(driver, By.XPATH, "//span[@class='ml10 main-header-text' and text()='New Search']", wait_time=30, description="New Search button")
-        time.sleep(2)
-        
-        safe_click(driver, By.XPATH, "//span[text()='Select Country']", wait_time=30, description="Select Country dropdown")
-        time.sleep(0.5)
-        
-        safe_click(driver, By.XPATH, "//span[@class='country-name' and text()='All Country (Global Search)']", wait_time=30, description="Global Search option")
-        time.sleep(1)
-        
-        # Date range
-        period_dropdown = driver.find_element(By.ID, "periodList")
-        period_dropdown.send_keys("Custom")
-        time.sleep(0.5)
-        
-        start_date_input = driver.find_element(By.ID, "globalDataFromDate")
-        start_date_input.send_keys(Keys.CONTROL, 'a', Keys.BACK_SPACE)
-        start_date_input.send_keys("01/01/2019")
-        time.sleep(0.5)
-        
-        # Search field
-        search_field_dropdown = driver.find_element(By.NAME, "field")
-        Select(search_field_dropdown).select_by_value("GlobalCompany")
-        time.sleep(1)
+        job['status'] = "🔧 Setting up search..."
+        setup_global_search(driver)
         
         # WAIT FOR USER INPUT
-        state['status'] = "⏸️ PLEASE ENTER COMPANY NAME IN BROWSER"
+        job['status'] = "⏸️ PLEASE ENTER COMPANY NAME IN BROWSER"
         scream_message("PLEASE ENTER COMPANY NAME")
-        state['progress'] = 60
+        job['progress'] = 60
         
-        state['status'] = "⳿ Waiting for you to click 'Apply' button..."
+        job['status'] = "⳿ Waiting for you to click 'Apply' button..."
         
         max_wait_time = 300
         start_wait = time.time()
         
         while True:
             try:
-                search_button = driver.find_element(By.XPATH, "//button[contains(@class, 'custom-search') and text()='Search']")
+                with no_implicit_wait(driver):
+                    search_button = driver.find_element(By.XPATH, "//button[contains(@class, 'custom-search') and text()='Search']")
                 if search_button.is_displayed() and search_button.is_enabled():
                     print("✅ Apply button clicked")
                     break
@@ -830,344 +3762,792 @@ def run_volza_automation(product_name):
                 pass
             
             if time.time() - start_wait > max_wait_time:
-                state['status'] = "❌ Timeout waiting for Apply button click"
-                return
-            time.sleep(1)
-        
-        # Extract company name
-        state['status'] = "🔍 Extracting company name..."
-        company_name = extract_company_name_from_page(driver)
-        
-        if not company_name:
-            try:
-                visible_text = driver.find_element(By.TAG_NAME, 'body').text[:3000]
-                company_name = extract_company_name_from_text(visible_text)
-            except:
-                pass
+                record_span('manual_entry', time.time() - start_wait, started=start_wait, ok=False)
+                job['status'] = "❌ Timeout waiting for Apply button click"
+                return
+            time.sleep(1)
+        record_span('manual_entry', time.time() - start_wait, started=start_wait)
         
-        if not company_name:
-            state['status'] = "⚠️ Could not auto-detect company name."
-            time.sleep(2)
-            company_name = extract_company_name_from_page(driver)
+        # Extract company name
+        job['status'] = "🔍 Extracting company name..."
+        company_name = extract_company_name_from_page(driver)
         
         if company_name:
-            state['company_name'] = company_name
+            job['company_name'] = company_name
         else:
-            try:
-                first_result = driver.find_element(By.XPATH, "//table//tr[2]//td[1]")
-                company_name = first_result.text.strip()
-                if company_name:
-                    state['company_name'] = company_name
-                else:
-                    state['company_name'] = "Company_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            except:
-                state['company_name'] = "Company_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            job['status'] = "⚠️ Could not auto-detect company name."
+            job['company_name'] = "Company_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         
-        state['status'] = f"✅ Company detected: {state['company_name']}"
-        state['progress'] = 70
+        job['status'] = f"✅ Company detected: {job['company_name']}"
+        job['progress'] = 70
+        start_date = apply_incremental_start(job, driver)
         
         # Click Search
-        state['status'] = "🔍 Clicking Search button..."
+        job['status'] = "🔍 Clicking Search button..."
         search_button_xpath = "//button[contains(@class, 'custom-search') and text()='Search']"
         search_button = wait.until(EC.element_to_be_clickable((By.XPATH, search_button_xpath)))
         driver.execute_script("arguments[0].click();", search_button)
         
-        state['status'] = "⚡ Loading results (smart wait)..."
-        
-        # 🚀 SMART WAIT: Check for results faster with multiple indicators
-        result_loaded = False
-        max_smart_wait = 15  # Reduced from 60s
-        start_smart_wait = time.time()
-        
-        while time.time() - start_smart_wait < max_smart_wait:
-            try:
-                # Check multiple indicators that data is loaded
-                table_present = len(driver.find_elements(By.XPATH, "//div[contains(@class, 'ant-table-tbody')]")) > 0
-                rows_present = len(driver.find_elements(By.XPATH, "//tr[@data-row-key]")) > 0
-                data_visible = len(driver.find_elements(By.XPATH, "//td[contains(@class, 'ant-table-cell')]")) > 5
-                
-                # If ANY indicator shows data is ready, proceed immediately
-                if table_present and (rows_present or data_visible):
-                    print(f"✅ Results loaded in {time.time() - start_smart_wait:.1f}s")
-                    result_loaded = True
-                    break
-                
-                time.sleep(0.3)  # Check every 300ms
-                
-            except:
-                time.sleep(0.3)
-        
-        if not result_loaded:
-            print("⚠️ Smart wait timeout - proceeding anyway (data might still be loading)")
+        job['status'] = "⚡ Loading results (smart wait)..."
         
-        # Small buffer to ensure rendering is complete
-        time.sleep(1)
+        wait_for_results(driver)
         
-        state['progress'] = 75
+        job['progress'] = 75
         
         # Update company name from results
-        if state['company_name'].startswith("Company_"):
+        if job['company_name'].startswith("Company_"):
             try:
                 result_company = extract_company_name_from_page(driver)
                 if result_company and not result_company.startswith("Company_"):
-                    state['company_name'] = result_company
+                    job['company_name'] = result_company
             except:
                 pass
         
-        # Zoom out for capture
-        print("🔍 Zooming out to capture page...")
-        state['status'] = "📸 Capturing page..."
-        driver.execute_script("document.body.style.zoom='25%'")
-        time.sleep(1)
-        
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(0.5)
-        driver.execute_script("window.scrollTo(0, 0);")
-        time.sleep(0.5)
-        
-        # Capture
-        full_page_text = driver.find_element(By.TAG_NAME, "body").text
-        
-        # Reset zoom
-        reset_zoom(driver)
+        # Capture result rows
+        job['status'] = "📸 Capturing result rows..."
+        records, full_page_text = capture_result_rows(driver)
+        job['progress'] = 80
         
-        print(f"✅ Captured {len(full_page_text):,} characters")
-        state['progress'] = 80
-        
-        # Update company name from text
-        if state['company_name'].startswith("Company_"):
-            extracted_name = extract_company_name_from_text(full_page_text)
+        # Update company name from captured rows / text
+        if job['company_name'].startswith("Company_"):
+            extracted_name = most_common_shipper(records) or extract_company_name_from_text(full_page_text)
             if extracted_name:
-                state['company_name'] = extracted_name
+                job['company_name'] = known_company_name(extracted_name)
         
-        # Verify data
-        has_shipments = "Shipments" in full_page_text or "shipments" in full_page_text
-        has_consignee = "Consignee" in full_page_text or "consignee" in full_page_text
+        records = store_capture(job['company_name'], product_name, records, full_page_text, start_date)
+        records = recover_page_shipments(job['company_name'], product_name, records, full_page_text)
+        job['shipments'] = records
         
-        if has_shipments and has_consignee:
-            state['status'] = "✅ High-quality data captured!"
+        # Verify data
+        if records:
+            job['status'] = f"✅ High-quality data captured! ({len(records)} shipments)"
         else:
-            state['status'] = "⚠️ Limited data found"
+            job['status'] = "⚠️ Limited data found"
         
         # Save raw data
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            f.write("=== COMPLETE PAGE CONTENT ===\n")
-            f.write(f"Company: {state['company_name']}\n")
-            f.write(f"Product: {product_name}\n")
-            f.write(f"Captured at: {datetime.datetime.now()}\n")
-            f.write("="*80 + "\n\n")
-            f.write(full_page_text)
+        save_raw_capture(job['company_name'], product_name, records, full_page_text)
+        
+        save_shipments(records)
+        capture_index.build_async(job['company_name'], records, full_page_text)
         
-        state['progress'] = 85
+        job['progress'] = 85
         
         # AI Extraction - CHATGPT-STYLE ANALYSIS
-        state['status'] = "🤖 Generating intelligent analysis..."
-        extracted_data = extract_detailed_info_with_ai(full_page_text, state['company_name'], product_name)
+        job['status'] = "🤖 Generating intelligent analysis..."
+        report_channel = TokenChannel()
+        job['report_channel'] = report_channel
+        try:
+            extracted_data = extract_detailed_info_with_ai(
+                full_page_text, job['company_name'], product_name, records, on_token=report_channel.append
+            )
+        finally:
+            report_channel.close()
+            job['report_channel'] = None
         
         with open(EXTRACTED_DATA_FILE, "w", encoding="utf-8") as f:
             f.write(extracted_data)
         
-        state['extracted_data'] = extracted_data
-        state['progress'] = 90
+        job['extracted_data'] = extracted_data
+        job['progress'] = 90
         
         # Save to history
-        state['status'] = "💾 Saving to history..."
-        save_company_analysis(state['company_name'], product_name, extracted_data)
+        job['status'] = "💾 Saving to history..."
+        save_company_analysis(job['company_name'], product_name, extracted_data)
         
-        state['progress'] = 100
-        state['status'] = f"✅ Analysis complete for {state['company_name']}!"
+        job['progress'] = 100
+        job['status'] = f"✅ Analysis complete for {job['company_name']}!"
         
-        state['analysis_complete'] = True
-        state['product_name'] = product_name
-        
-        # Save browser session
-        state['driver'] = driver
-        state['wait'] = wait
-        state['browser_logged_in'] = True
+        job['analysis_complete'] = True
+        job['product_name'] = product_name
         
     except Exception as e:
-        state['status'] = f"❌ Error: {str(e)}"
+        job['status'] = f"❌ Error: {str(e)}"
         print(f"Error: {e}")
         import traceback
         traceback.print_exc()
-        if driver:
-            state['driver'] = driver
-            state['wait'] = wait
 
 
-def continue_volza_analysis(product_name):
-    """Continue analysis using existing browser - NO new browser"""
+def continue_volza_analysis(job, session):
+    """Continue analysis using the session's logged-in browser - NO new browser"""
     
-    driver = state['driver']
-    wait = state['wait']
+    product_name = job['product_name']
+    driver = session.driver
+    wait = session.wait
     
     if driver is None:
-        state['status'] = "❌ Browser session lost. Please restart."
-        state['browser_logged_in'] = False
+        job['status'] = "❌ Browser session lost. Please restart."
+        session.logged_in = False
         return
     
     try:
         # Check browser
-        try:
-            _ = driver.current_url
-        except:
-            state['status'] = "❌ Browser was closed. Please restart."
-            state['driver'] = None
-            state['browser_logged_in'] = False
+        if not session.alive():
+            job['status'] = "❌ Browser was closed. Please restart."
+            session.driver = None
+            session.logged_in = False
             return
         
-        state['status'] = "🔧 Starting new search..."
-        state['progress'] = 20
-        
-        safe_click(driver, By.XPATH, "//span[@class='ml10 main-header-text' and text()='New Search']", wait_time=30, description="New Search button")
-        time.sleep(2)
-        
-        safe_click(driver, By.XPATH, "//span[text()='Select Country']", wait_time=30, description="Select Country dropdown")
-        time.sleep(0.5)
-        
-        safe_click(driver, By.XPATH, "//span[@class='country-name' and text()='All Country (Global Search)']", wait_time=30, description="Global Search option")
-        time.sleep(1)
+        job['status'] = "🔧 Starting new search..."
+        job['progress'] = 20
         
-        period_dropdown = driver.find_element(By.ID, "periodList")
-        period_dropdown.send_keys("Custom")
-        time.sleep(0.5)
+        setup_global_search(driver)
         
-        start_date_input = driver.find_element(By.ID, "globalDataFromDate")
-        start_date_input.send_keys(Keys.CONTROL, 'a', Keys.BACK_SPACE)
-        start_date_input.send_keys("01/01/2019")
-        time.sleep(0.5)
-        
-        search_field_dropdown = driver.find_element(By.NAME, "field")
-        Select(search_field_dropdown).select_by_value("GlobalCompany")
-        time.sleep(1)
-        
-        state['status'] = "⏸️ PLEASE ENTER COMPANY NAME IN BROWSER"
+        job['status'] = "⏸️ PLEASE ENTER COMPANY NAME IN BROWSER"
         scream_message("PLEASE ENTER COMPANY NAME")
-        state['progress'] = 40
+        job['progress'] = 40
         
-        state['status'] = "⳿ Waiting for 'Apply' button..."
+        job['status'] = "⳿ Waiting for 'Apply' button..."
         
         max_wait_time = 300
         start_wait = time.time()
         
         while True:
             try:
-                search_button = driver.find_element(By.XPATH, "//button[contains(@class, 'custom-search') and text()='Search']")
+                with no_implicit_wait(driver):
+                    search_button = driver.find_element(By.XPATH, "//button[contains(@class, 'custom-search') and text()='Search']")
                 if search_button.is_displayed() and search_button.is_enabled():
                     break
             except:
                 pass
             
             if time.time() - start_wait > max_wait_time:
-                state['status'] = "❌ Timeout"
+                record_span('manual_entry', time.time() - start_wait, started=start_wait, ok=False)
+                job['status'] = "❌ Timeout"
                 return
             time.sleep(1)
+        record_span('manual_entry', time.time() - start_wait, started=start_wait)
         
-        state['status'] = "🔍 Extracting company name..."
+        job['status'] = "🔍 Extracting company name..."
         company_name = extract_company_name_from_page(driver)
         
-        if not company_name:
-            try:
-                visible_text = driver.find_element(By.TAG_NAME, 'body').text[:3000]
-                company_name = extract_company_name_from_text(visible_text)
-            except:
-                pass
-        
         if company_name:
-            state['company_name'] = company_name
+            job['company_name'] = company_name
         else:
-            state['company_name'] = "Company_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            job['company_name'] = "Company_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         
-        state['status'] = f"✅ Company: {state['company_name']}"
-        state['progress'] = 50
+        job['status'] = f"✅ Company: {job['company_name']}"
+        job['progress'] = 50
+        start_date = apply_incremental_start(job, driver)
         
         search_button_xpath = "//button[contains(@class, 'custom-search') and text()='Search']"
         search_button = wait.until(EC.element_to_be_clickable((By.XPATH, search_button_xpath)))
         driver.execute_script("arguments[0].click();", search_button)
         
-        state['status'] = "⚡ Loading results (smart wait)..."
-        
-        # 🚀 SMART WAIT: Check for results faster
-        result_loaded = False
-        max_smart_wait = 15  # Reduced from 60s
-        start_smart_wait = time.time()
-        
-        while time.time() - start_smart_wait < max_smart_wait:
-            try:
-                table_present = len(driver.find_elements(By.XPATH, "//div[contains(@class, 'ant-table-tbody')]")) > 0
-                rows_present = len(driver.find_elements(By.XPATH, "//tr[@data-row-key]")) > 0
-                data_visible = len(driver.find_elements(By.XPATH, "//td[contains(@class, 'ant-table-cell')]")) > 5
-                
-                if table_present and (rows_present or data_visible):
-                    print(f"✅ Results loaded in {time.time() - start_smart_wait:.1f}s")
-                    result_loaded = True
-                    break
-                
-                time.sleep(0.3)
-                
-            except:
-                time.sleep(0.3)
-        
-        if not result_loaded:
-            print("⚠️ Smart wait timeout - proceeding anyway")
+        job['status'] = "⚡ Loading results (smart wait)..."
         
-        time.sleep(1)  # Small buffer
+        wait_for_results(driver)
         
-        state['progress'] = 60
+        job['progress'] = 60
         
-        # Zoom and capture
-        driver.execute_script("document.body.style.zoom='25%'")
-        time.sleep(1)
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(0.5)
-        driver.execute_script("window.scrollTo(0, 0);")
-        time.sleep(0.5)
+        # Capture result rows
+        records, full_page_text = capture_result_rows(driver)
         
-        full_page_text = driver.find_element(By.TAG_NAME, 'body').text
-        reset_zoom(driver)
-        
-        state['progress'] = 70
+        job['progress'] = 70
         
         # Update company name
-        if state['company_name'].startswith("Company_"):
-            extracted_name = extract_company_name_from_text(full_page_text)
+        if job['company_name'].startswith("Company_"):
+            extracted_name = most_common_shipper(records) or extract_company_name_from_text(full_page_text)
             if extracted_name:
-                state['company_name'] = extracted_name
+                job['company_name'] = known_company_name(extracted_name)
+        
+        records = store_capture(job['company_name'], product_name, records, full_page_text, start_date)
+        records = recover_page_shipments(job['company_name'], product_name, records, full_page_text)
+        job['shipments'] = records
         
         # Save raw
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            f.write("=== COMPLETE PAGE CONTENT ===\n")
-            f.write(f"Company: {state['company_name']}\n")
-            f.write(f"Product: {product_name}\n")
-            f.write("="*80 + "\n\n")
-            f.write(full_page_text)
+        save_raw_capture(job['company_name'], product_name, records, full_page_text)
         
-        state['progress'] = 80
+        save_shipments(records)
+        capture_index.build_async(job['company_name'], records, full_page_text)
+        
+        job['progress'] = 80
         
         # Extract - CHATGPT-STYLE ANALYSIS
-        state['status'] = "🤖 Generating intelligent analysis..."
-        extracted_data = extract_detailed_info_with_ai(full_page_text, state['company_name'], product_name)
+        job['status'] = "🤖 Generating intelligent analysis..."
+        report_channel = TokenChannel()
+        job['report_channel'] = report_channel
+        try:
+            extracted_data = extract_detailed_info_with_ai(
+                full_page_text, job['company_name'], product_name, records, on_token=report_channel.append
+            )
+        finally:
+            report_channel.close()
+            job['report_channel'] = None
         
         with open(EXTRACTED_DATA_FILE, "w", encoding="utf-8") as f:
             f.write(extracted_data)
         
-        state['extracted_data'] = extracted_data
-        state['progress'] = 90
+        job['extracted_data'] = extracted_data
+        job['progress'] = 90
         
-        save_company_analysis(state['company_name'], product_name, extracted_data)
+        save_company_analysis(job['company_name'], product_name, extracted_data)
         
-        state['progress'] = 100
-        state['status'] = f"✅ Complete: {state['company_name']}!"
+        job['progress'] = 100
+        job['status'] = f"✅ Complete: {job['company_name']}!"
         
-        state['analysis_complete'] = True
-        state['product_name'] = product_name
+        job['analysis_complete'] = True
+        job['product_name'] = product_name
         
     except Exception as e:
-        state['status'] = f"❌ Error: {str(e)}"
+        job['status'] = f"❌ Error: {str(e)}"
         import traceback
         traceback.print_exc()
 
 
+# ==================== BROWSER POOL & JOB QUEUE ====================
+class BrowserSession:
+    """One Chrome instance with its own persistent profile directory"""
+    
+    def __init__(self, index: int):
+        self.index = index
+        # Slot 0 keeps the original profile so existing logins survive
+        name = "chrome_profile" if index == 0 else f"chrome_profile_{index}"
+        self.profile_dir = os.path.join(os.getcwd(), name)
+        # Saved cookies/localStorage for the login fast-path
+        self.state_file = os.path.join(os.getcwd(), VOLZA_SESSION_DIR, f"{name}.json")
+        self.driver = None
+        self.wait = None
+        self.logged_in = False
+        self.headless = False
+        self.api = None  # VolzaApiClient sharing this browser's login (VOLZA_TRANSPORT=http)
+    
+    def alive(self) -> bool:
+        if self.driver is None:
+            return False
+        try:
+            _ = self.driver.current_url
+            return True
+        except Exception:
+            return False
+    
+    def quit(self):
+        if self.driver:
+            try:
+                self.driver.quit()
+            except:
+                pass
+        if self.api:
+            self.api.close()
+            self.api = None
+        self.driver = None
+        self.wait = None
+        self.logged_in = False
+
+
+class BrowserPool:
+    """
+    N browser sessions plus a bounded job queue.
+    One worker per session: each job leases an idle session and returns it
+    afterwards, so concurrent analyses never share a driver.
+    """
+    
+    def __init__(self, size: int, queue_size: int):
+        self.sessions = [BrowserSession(i) for i in range(size)]
+        self._idle = queue.Queue()
+        for session in self.sessions:
+            self._idle.put(session)
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self._workers = []
+        self._lock = threading.Lock()
+    
+    def _ensure_workers(self):
+        with self._lock:
+            while len(self._workers) < len(self.sessions):
+                worker = threading.Thread(target=self._worker, name=f"browser-worker-{len(self._workers)}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+    
+    def submit(self, func, *args, block: bool = False) -> bool:
+        """Queue func(session, *args); False when the queue is full (non-blocking)"""
+        self._ensure_workers()
+        try:
+            self.jobs.put((func, args), block=block)
+            return True
+        except queue.Full:
+            return False
+    
+    def lease(self, timeout: Optional[float] = None) -> BrowserSession:
+        return self._idle.get(timeout=timeout)
+    
+    def release(self, session: BrowserSession):
+        self._idle.put(session)
+    
+    def _worker(self):
+        while True:
+            func, args = self.jobs.get()
+            session = self.lease()
+            try:
+                func(session, *args)
+            except Exception as e:
+                print(f"❌ Job failed on browser {session.index}: {e}")
+            finally:
+                self.release(session)
+                self.jobs.task_done()
+    
+    def idle_count(self) -> int:
+        return self._idle.qsize()
+    
+    def any_logged_in(self) -> bool:
+        return any(s.logged_in and s.driver is not None for s in self.sessions)
+    
+    def close_all(self):
+        for session in self.sessions:
+            session.quit()
+    
+    def stats(self) -> dict:
+        return {
+            'size': len(self.sessions),
+            'idle': self.idle_count(),
+            'queued': self.jobs.qsize(),
+            'logged_in': sum(1 for s in self.sessions if s.logged_in),
+        }
+
+
+browser_pool = BrowserPool(BROWSER_POOL_SIZE, JOB_QUEUE_SIZE)
+
+
+def analysis_job(session: BrowserSession, job: Job, headless: bool = False):
+    """
+    Pool job: reuse the session's login when possible, else log in first.
+    Interactive analyses are headed; only bench/e2e.py passes headless=True.
+    """
+    print(f"🧭 Browser {session.index} leased for job {job.id} ('{job['product_name']}')")
+    started = time.time()
+    job.set_timing('started_at', datetime.datetime.now().isoformat())
+    job.set_timing('queue_wait_s', round(started - datetime.datetime.fromisoformat(job['created_at']).timestamp(), 3))
+    begin_readiness_report()
+    try:
+        with trace_job(job):
+            if session.logged_in and session.alive() and (headless or not session.headless):
+                continue_volza_analysis(job, session)
+            else:
+                run_volza_automation(job, session, headless)
+    finally:
+        finish_readiness_report(job)
+        job.set_timing('finished_at', datetime.datetime.now().isoformat())
+        job.set_timing('duration_s', round(time.time() - started, 3))
+        state['browser_logged_in'] = browser_pool.any_logged_in()
+
+
+# ==================== DIRECT HTTP TRANSPORT ====================
+class VolzaAuthError(Exception):
+    """The search API rejected the browser session's credentials"""
+
+
+API_ROW_KEYS = ('rows', 'data', 'results', 'records', 'items', 'shipments', 'content')
+API_TOTAL_KEYS = ('totalCount', 'total', 'totalRecords', 'totalElements', 'count')
+
+
+def find_api_rows(payload) -> Optional[list]:
+    """Locate the list of row objects in a search response, however deeply it is wrapped"""
+    if isinstance(payload, list):
+        if all(isinstance(row, dict) for row in payload):
+            return payload
+        return None
+    if isinstance(payload, dict):
+        for key in API_ROW_KEYS:
+            if key in payload:
+                rows = find_api_rows(payload[key])
+                if rows is not None:
+                    return rows
+        for value in payload.values():
+            if isinstance(value, (dict, list)):
+                rows = find_api_rows(value)
+                if rows is not None:
+                    return rows
+    return None
+
+
+def find_api_total(payload) -> Optional[int]:
+    if isinstance(payload, dict):
+        for key in API_TOTAL_KEYS:
+            if isinstance(payload.get(key), int):
+                return payload[key]
+        for value in payload.values():
+            if isinstance(value, dict):
+                total = find_api_total(value)
+                if total is not None:
+                    return total
+    return None
+
+
+def api_key_label(key: str) -> str:
+    """'consigneeName' / 'consignee_name' -> 'consignee', 'valueInUsd' -> 'value in usd'"""
+    label = re.sub(r'(?<=[a-z0-9])(?=[A-Z])', ' ', str(key)).replace('_', ' ').lower()
+    label = re.sub(r'\s+', ' ', label).strip()
+    return re.sub(r' name$', '', label)
+
+
+def api_cell(value) -> str:
+    if value is None:
+        return ""
+    text = str(value)
+    # ISO timestamps -> date part, which parse_shipment_date understands
+    if re.match(r'^\d{4}-\d{2}-\d{2}T', text):
+        return text[:10]
+    return text
+
+
+def parse_search_response(payload) -> tuple:
+    """JSON search response -> (records, raw row count, total reported by the API)"""
+    rows = find_api_rows(payload) or []
+    keys = []
+    for row in rows:
+        for key in row:
+            if key not in keys:
+                keys.append(key)
+    
+    headers = [api_key_label(key) for key in keys]
+    cells = [[api_cell(row.get(key)) for key in keys] for row in rows]
+    return rows_to_shipments(headers, cells), len(rows), find_api_total(payload)
+
+
+def build_search_payload(company_name: str, start_date: str, page: int, page_size: int) -> dict:
+    """Mirrors the New Search form: global search, custom period, GlobalCompany field"""
+    return {
+        'country': 'All Country (Global Search)',
+        'period': 'Custom',
+        'fromDate': start_date,
+        'toDate': datetime.date.today().strftime('%d/%m/%Y'),
+        'field': 'GlobalCompany',
+        'value': company_name,
+        'page': page,
+        'pageSize': page_size,
+    }
+
+
+class VolzaApiClient:
+    """Pooled HTTP client for Volza's search API, authenticated with a logged-in browser's cookies"""
+    
+    def __init__(self, base_url: str = "", search_path: str = VOLZA_SEARCH_PATH,
+                 pool_size: int = VOLZA_API_POOL_SIZE, page_size: int = VOLZA_API_PAGE_SIZE,
+                 max_pages: int = VOLZA_API_MAX_PAGES):
+        self.base_url = (base_url or VOLZA_API_BASE).rstrip('/')
+        self.search_url = self.base_url + search_path
+        self.page_size = page_size
+        self.max_pages = max_pages
+        
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        
+        self.http = requests.Session()
+        retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+        self.http.headers.update({
+            'Accept': 'application/json, text/plain, */*',
+            'Origin': self.base_url,
+            'Referer': VOLZA_WORKSPACE_URL,
+        })
+    
+    def load_browser_auth(self, driver):
+        """Copy cookies, user agent and (optionally) a bearer token from the browser"""
+        self.http.cookies.clear()
+        for cookie in driver.get_cookies():
+            self.http.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+        
+        user_agent = driver.execute_script("return navigator.userAgent;")
+        if user_agent:
+            self.http.headers['User-Agent'] = user_agent
+        if VOLZA_AUTH_STORAGE_KEY:
+            token = driver.execute_script("return window.localStorage.getItem(arguments[0]);", VOLZA_AUTH_STORAGE_KEY)
+            if token:
+                # localStorage values are often JSON-encoded strings
+                self.http.headers['Authorization'] = "Bearer " + token.strip('"')
+    
+    def search(self, company_name: str, start_date: str = FULL_SEARCH_START_DATE) -> list:
+        records = []
+        for page in range(1, self.max_pages + 1):
+            payload = build_search_payload(company_name, start_date, page, self.page_size)
+            response = self.http.post(self.search_url, json=payload, timeout=30)
+            if response.status_code in (401, 403):
+                raise VolzaAuthError(f"Search API returned {response.status_code}")
+            response.raise_for_status()
+            
+            page_records, row_count, total = parse_search_response(response.json())
+            records.extend(page_records)
+            if row_count < self.page_size or (total is not None and page * self.page_size >= total):
+                break
+        return records
+    
+    def close(self):
+        self.http.close()
+
+
+def api_search(session, company_name: str, start_date: str = FULL_SEARCH_START_DATE) -> Optional[list]:
+    """Search over HTTP with the session's cookies; None means use the browser instead"""
+    try:
+        with span('api_search'):
+            if session.api is None:
+                session.api = VolzaApiClient()
+                session.api.load_browser_auth(session.driver)
+            records = session.api.search(company_name, start_date)
+    except VolzaAuthError as e:
+        print(f"⚠️ {e} - reloading cookies next time, using the browser for now")
+        session.api.close()
+        session.api = None
+        return None
+    except Exception as e:
+        print(f"⚠️ HTTP search failed ({e}) - using the browser")
+        return None
+    
+    if not records:
+        # Cannot tell "no shipments" from an unexpected response shape, so let the page decide
+        print("⚠️ HTTP search returned no rows - using the browser")
+        return None
+    print(f"⚡ HTTP search: {len(records)} shipments for {company_name}")
+    return records
+
+
+# ==================== BATCH ANALYSIS PIPELINE ====================
+# Company search field that appears once the GlobalCompany field is selected
+COMPANY_INPUT_XPATH = "//select[@name='field']/following::input[not(@type) or @type='text' or @type='search'][1]"
+COMPANY_OPTION_XPATH = "//div[contains(@class, 'ant-select-item-option') or @role='option' or contains(@class, 'autocomplete')]"
+SEARCH_BUTTON_XPATH = "//button[contains(@class, 'custom-search') and text()='Search']"
+
+
+def enter_company_name(driver, company_name: str):
+    """Type the company into the search field and pick the matching suggestion"""
+    company_input = safe_find_and_send(driver, By.XPATH, COMPANY_INPUT_XPATH, company_name, wait_time=30, description="Company field")
+    # Longer quiet window so a debounced suggestion request has time to start
+    wait_until_ready(driver, "company suggestions", 1.0, timeout=5, quiet_ms=400)
+    
+    target = company_name.strip().lower()
+    with no_implicit_wait(driver):
+        options = driver.find_elements(By.XPATH, COMPANY_OPTION_XPATH)
+    for option in options:
+        try:
+            if option.is_displayed() and target in option.text.strip().lower():
+                driver.execute_script("arguments[0].click();", option)
+                print(f"✅ Selected suggestion: {option.text.strip()}")
+                return
+        except StaleElementReferenceException:
+            continue
+    
+    company_input.send_keys(Keys.ENTER)
+
+
+def search_and_capture(session, company_name: str, start_date: str = FULL_SEARCH_START_DATE):
+    """Run one Volza company search without manual input; returns (records, page_text)"""
+    if VOLZA_TRANSPORT == 'http':
+        records = api_search(session, company_name, start_date)
+        if records is not None:
+            return records, shipments_to_text(records)
+    
+    driver = session.driver
+    setup_global_search(driver, start_date)
+    enter_company_name(driver, company_name)
+    
+    search_button = session.wait.until(EC.element_to_be_clickable((By.XPATH, SEARCH_BUTTON_XPATH)))
+    driver.execute_script("arguments[0].click();", search_button)
+    
+    wait_for_results(driver)
+    return capture_result_rows(driver)
+
+
+def parse_batch_items(raw: str, filename: str = "") -> list:
+    """
+    Parse (company, product) pairs from CSV or JSON.
+    CSV: header with company/product columns, or two unnamed columns.
+    JSON: [{"company": ..., "product": ...}] or [[company, product], ...].
+    """
+    raw = raw.strip().lstrip('\ufeff')
+    items = []
+    
+    if filename.lower().endswith('.json') or raw.startswith(('[', '{')):
+        data = json.loads(raw)
+        if isinstance(data, dict):
+            data = data.get('items', [])
+        for entry in data:
+            if isinstance(entry, dict):
+                company = entry.get('company') or entry.get('company_name') or entry.get('supplier')
+                product = entry.get('product') or entry.get('product_name')
+            else:
+                company, product = (list(entry) + [None, None])[:2]
+            items.append((company, product))
+    else:
+        rows = [row for row in csv.reader(io.StringIO(raw)) if any(cell.strip() for cell in row)]
+        if rows:
+            header = [cell.strip().lower() for cell in rows[0]]
+            company_col = next((i for i, h in enumerate(header) if h in ('company', 'company_name', 'supplier')), None)
+            product_col = next((i for i, h in enumerate(header) if h in ('product', 'product_name')), None)
+            if company_col is not None and product_col is not None:
+                rows = rows[1:]
+            else:
+                company_col, product_col = 0, 1
+            for row in rows:
+                cells = row + [""] * 2
+                items.append((cells[company_col], cells[product_col]))
+    
+    return [(str(c).strip(), str(p).strip()) for c, p in items if c and p and str(c).strip() and str(p).strip()]
+
+
+def report_field(report: str, label: str) -> str:
+    """Pull '**Answer:** YES' style values out of the assessment report"""
+    match = re.search(rf"\*\*{label}:\*\*\s*\[?([A-Z][A-Z ]+)", report or "")
+    return match.group(1).strip() if match else ""
+
+
+class BatchRun:
+    """
+    Two-stage pipeline over many (company, product) pairs:
+    browser search/capture on the pool → bounded queue → concurrent Groq
+    assessment, so scraping company N+1 overlaps the LLM work for company N.
+    Every item is a Job, so per-item status comes from the job registry.
+    """
+    
+    def __init__(self, batch_id: str, items: list):
+        self.id = batch_id
+        self.jobs = []
+        for company_name, product_name in items:
+            job = job_registry.create(product_name)
+            job['company_name'] = company_name
+            job['status'] = "⏳ Queued"
+            self.jobs.append(job)
+        self.results = {}
+        self.llm_queue = queue.Queue(maxsize=BATCH_LLM_QUEUE_SIZE)
+        self.created_at = datetime.datetime.now().isoformat()
+        self.finished_at = None
+        self.results_path = None
+        self._pending = len(self.jobs)
+        self._lock = threading.Lock()
+    
+    def start(self):
+        threading.Thread(target=self._feed, name=f"batch-{self.id}-feed", daemon=True).start()
+        for i in range(BATCH_LLM_WORKERS):
+            threading.Thread(target=self._llm_worker, name=f"batch-{self.id}-llm-{i}", daemon=True).start()
+        if not self.jobs:
+            self._finish()
+    
+    def _feed(self):
+        # Blocking put: the pool's bounded job queue throttles the browser stage
+        for job in self.jobs:
+            browser_pool.submit(self._capture, job, block=True)
+    
+    def _capture(self, session, job):
+        """Stage 1 (browser): log in if needed, search, capture rows"""
+        started = time.time()
+        begin_readiness_report()
+        try:
+            with trace_job(job):
+                if not (session.logged_in and session.alive()):
+                    open_volza_session(job, session, headless=CHROME_HEADLESS)
+                job['status'] = "🔍 Searching Volza..."
+                job['progress'] = 40
+                job['company_name'] = known_company_name(job['company_name'])
+                start_date = incremental_start_date(job['company_name'])
+                job.set_timing('search_from', start_date or FULL_SEARCH_START_DATE)
+                records, page_text = search_and_capture(session, job['company_name'],
+                                                        start_date or FULL_SEARCH_START_DATE)
+                records = store_capture(job['company_name'], job['product_name'], records, page_text, start_date)
+            job['shipments'] = records
+            job['progress'] = 60
+            job.set_timing('capture_s', round(time.time() - started, 3))
+            job['status'] = f"🧾 Captured {len(records)} shipments - waiting for AI..."
+            # Blocks while the LLM stage is behind, holding back further scraping
+            self.llm_queue.put((job, records, page_text))
+        except Exception as e:
+            job['status'] = f"❌ Error: {e}"
+            self._item_done(job, error=str(e))
+        finally:
+            finish_readiness_report(job)
+            state['browser_logged_in'] = browser_pool.any_logged_in()
+    
+    def _llm_worker(self):
+        """Stage 2 (Groq): assessment + history save"""
+        while True:
+            item = self.llm_queue.get()
+            if item is None:
+                return
+            job, records, page_text = item
+            started = time.time()
+            try:
+                job['status'] = "🤖 Generating intelligent analysis..."
+                job['progress'] = 80
+                with trace_job(job), groq_priority(PRIORITY_BATCH):
+                    # Text-only captures are extracted here, not in the browser stage
+                    records = recover_page_shipments(job['company_name'], job['product_name'], records, page_text)
+                    job['shipments'] = records
+                    extracted_data = extract_detailed_info_with_ai(page_text, job['company_name'], job['product_name'], records)
+                    job['extracted_data'] = extracted_data
+                    save_company_analysis(job['company_name'], job['product_name'], extracted_data)
+                    capture_index.build_async(job['company_name'], records, page_text)
+                job.set_timing('analysis_s', round(time.time() - started, 3))
+                job['progress'] = 100
+                job['status'] = f"✅ Analysis complete for {job['company_name']}!"
+                job['analysis_complete'] = True
+                self._item_done(job, records=records)
+            except Exception as e:
+                job['status'] = f"❌ Error: {e}"
+                self._item_done(job, error=str(e))
+    
+    def _item_done(self, job, records=None, error: str = ""):
+        metrics = aggregate_trade_metrics(records or [])
+        with self._lock:
+            self.results[job.id] = {
+                'company_name': job['company_name'],
+                'product_name': job['product_name'],
+                'job_id': job.id,
+                'result': 'failed' if error else 'done',
+                'shipments': metrics['total_shipments'],
+                'consignees': metrics['distinct_consignees'],
+                'countries': metrics['distinct_countries'],
+                'first_date': metrics['first_date'] or "",
+                'last_date': metrics['last_date'] or "",
+                'answer': report_field(job['extracted_data'], 'Answer'),
+                'legitimacy': report_field(job['extracted_data'], 'Status'),
+                'error': error,
+            }
+            self._pending -= 1
+            finished = self._pending == 0
+        if finished:
+            self._finish()
+    
+    def _finish(self):
+        for _ in range(BATCH_LLM_WORKERS):
+            self.llm_queue.put(None)
+        self.finished_at = datetime.datetime.now().isoformat()
+        self.results_path = self.write_results()
+        print(f"✅ Batch {self.id} complete: {self.results_path}")
+    
+    def ordered_results(self) -> list:
+        with self._lock:
+            return [self.results[job.id] for job in self.jobs if job.id in self.results]
+    
+    def write_results(self) -> str:
+        os.makedirs(BATCH_RESULTS_DIR, exist_ok=True)
+        path = os.path.join(BATCH_RESULTS_DIR, f"batch_{self.id}.csv")
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=BATCH_RESULT_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.ordered_results())
+        return path
+    
+    def summary(self) -> dict:
+        with self._lock:
+            done = len(self.results)
+            failed = sum(1 for r in self.results.values() if r['result'] == 'failed')
+        return {
+            'batch_id': self.id,
+            'total': len(self.jobs),
+            'done': done - failed,
+            'failed': failed,
+            'complete': self.finished_at is not None,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+            'llm_queue': self.llm_queue.qsize(),
+            'items': [job.summary() for job in self.jobs],
+        }
+
+
+BATCH_RESULT_FIELDS = ['company_name', 'product_name', 'job_id', 'result', 'shipments', 'consignees',
+                       'countries', 'first_date', 'last_date', 'answer', 'legitimacy', 'error']
+
+batch_runs = {}
+
+
 # ==================== FLASK ROUTES ====================
 @app.route('/')
 def index():
@@ -1194,28 +4574,11 @@ def login():
 
 @app.route('/logout', methods=['POST'])
 def logout():
-    global state
-    
-    if state['driver']:
-        try:
-            state['driver'].quit()
-        except:
-            pass
+    browser_pool.close_all()
     
-    state = {
-        'logged_in': False,
-        'username': "",
-        'analysis_complete': False,
-        'chat_history': [],
-        'company_name': "",
-        'product_name': "",
-        'extracted_data': "",
-        'driver': None,
-        'browser_logged_in': False,
-        'wait': None,
-        'status': "",
-        'progress': 0
-    }
+    # Reset in place so running threads and open status streams keep the same object
+    state.update(initial_state())
+    job_registry.clear()
     return jsonify({'success': True})
 
 @app.route('/start_analysis', methods=['POST'])
@@ -1224,69 +4587,371 @@ def start_analysis():
     product_name = data.get('product_name')
     if not product_name:
         return jsonify({'success': False, 'message': 'Please enter product name'})
-    state['product_name'] = product_name
-    state['status'] = 'Starting...'
-    state['progress'] = 0
-    if state['browser_logged_in'] and state['driver']:
-        thread = threading.Thread(target=continue_volza_analysis, args=(product_name,))
-    else:
-        thread = threading.Thread(target=run_volza_automation, args=(product_name,))
-    thread.start()
-    return jsonify({'success': True})
+    waiting = browser_pool.jobs.qsize()
+    job = job_registry.create(product_name)
+    job['status'] = 'Starting...' if waiting < browser_pool.idle_count() else '⏳ Queued - waiting for a free browser...'
+    state['current_job'] = job.id
+    if not browser_pool.submit(analysis_job, job):
+        job['status'] = '❌ Analysis queue is full, please try again shortly'
+        return jsonify({'success': False, 'message': 'Analysis queue is full, please try again shortly'})
+    return jsonify({'success': True, 'job_id': job.id, 'queued': waiting})
+
+def answer_query(job: Optional[Job], question: str) -> str:
+    if job is None or not job['analysis_complete']:
+        return 'Analysis not complete'
+    response = query_company_data_direct(question, job['company_name'], job['extracted_data'])
+    job['chat_history'].append({"role": "user", "content": question})
+    job['chat_history'].append({"role": "bot", "content": response})
+    return response
 
 @app.route('/query', methods=['POST'])
 def query():
     data = request.json
-    question = data.get('question')
-    if not state['analysis_complete']:
-        return jsonify({'response': 'Analysis not complete'})
-    response = query_company_data_direct(question, state['company_name'], state['extracted_data'])
-    state['chat_history'].append({"role": "user", "content": question})
-    state['chat_history'].append({"role": "bot", "content": response})
-    return jsonify({'response': response})
+    return jsonify({'response': answer_query(current_job(), data.get('question'))})
+
+@app.route('/query_stream')
+def query_stream():
+    """⚡ SSE: stream chat answer tokens as they arrive"""
+    question = request.args.get('question', '')
+    job = job_registry.get(request.args.get('job_id')) or current_job()
+    
+    if job is None or not job['analysis_complete']:
+        def not_ready():
+            yield sse_event({'token': 'Analysis not complete'})
+            yield sse_event({'done': True}, event='done')
+        return Response(not_ready(), mimetype='text/event-stream', headers=SSE_HEADERS)
+    
+    company_name = job['company_name']
+    extracted_data = job['extracted_data']
+    chat_history = job['chat_history']
+    
+    def generate():
+        parts = []
+        for token in query_company_data_stream(question, company_name, extracted_data):
+            parts.append(token)
+            yield sse_event({'token': token})
+        chat_history.append({"role": "user", "content": question})
+        chat_history.append({"role": "bot", "content": "".join(parts).strip()})
+        yield sse_event({'done': True}, event='done')
+    
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/report_stream')
+def report_stream():
+    """⚡ SSE: stream the assessment report while it is being generated"""
+    job = job_registry.get(request.args.get('job_id')) or current_job()
+    channel = job['report_channel'] if job else None
+    
+    def generate():
+        if channel is not None:
+            for chunk in channel.follow():
+                if chunk is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield sse_event({'token': chunk})
+        yield sse_event({'done': True}, event='done')
+    
+    return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
 
 @app.route('/get_chat_history')
 def get_chat_history():
-    return jsonify({'chat_history': state['chat_history']})
+    job = current_job()
+    return jsonify({'chat_history': job['chat_history'] if job else []})
+
+# Dashboard view when no analysis is selected
+IDLE_JOB_FIELDS = new_job_fields(None, "")
+
+def status_payload(job: Optional[Job], job_keys=JOB_STATUS_FIELDS, app_keys=APP_STATUS_FIELDS) -> dict:
+    """Dashboard view of the given job and app-state keys"""
+    source = job if job is not None else IDLE_JOB_FIELDS
+    payload = {}
+    for key in job_keys:
+        if key == 'report_channel':
+            channel = source['report_channel']
+            payload['report_streaming'] = channel is not None and not channel.closed
+        else:
+            payload[key] = source[key]
+    for key in app_keys:
+        payload[key] = state[key]
+    return payload
+
+def status_changes(since: int, follow_current: bool, job: Optional[Job]) -> Optional[dict]:
+    """Fields changed after version `since`; the full job view if the dashboard switched jobs"""
+    app_keys = state.changed_keys(since, APP_STATUS_FIELDS)
+    if follow_current and state.changed_keys(since, ('current_job',)):
+        job_keys = JOB_STATUS_FIELDS
+    elif job is not None:
+        job_keys = job.changed_keys(since, JOB_STATUS_FIELDS)
+    else:
+        job_keys = []
+    if not app_keys and not job_keys:
+        return None
+    return status_payload(job, job_keys, app_keys)
+
+def status_event_stream(since: Optional[int], job_id: Optional[str] = None):
+    """
+    SSE generator: a full snapshot first, then only changed fields.
+    Follows the dashboard's current job unless job_id is given.
+    """
+    follow_current = job_id is None
+    cursor = since or 0
+    
+    def resolve():
+        return current_job() if follow_current else job_registry.get(job_id)
+    
+    # Read the version before building each snapshot/delta: a write landing in between
+    # is then sent again next round instead of being skipped
+    version = status_clock.version
+    changes = status_payload(resolve()) if since is None else status_changes(cursor, follow_current, resolve())
+    while True:
+        if changes:
+            yield sse_event(changes, event_id=f"{STATUS_BOOT_ID}-{version}")
+        cursor = version
+        
+        if status_clock.wait_for_change(cursor, timeout=15) == cursor:
+            yield ": keep-alive\n\n"
+        version = status_clock.version
+        changes = status_changes(cursor, follow_current, resolve())
+
+def stream_cursor() -> Optional[int]:
+    """?since= or the EventSource Last-Event-ID from this server run"""
+    since = request.args.get('since', type=int)
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if since is None and last_event_id.startswith(STATUS_BOOT_ID + "-"):
+        since = int(last_event_id.split("-", 1)[1])
+    return since
+
+def conditional_status(job: Optional[Job], follow_current: bool):
+    """
+    Full status (with ETag for conditional polling), or a long-poll delta
+    when called with ?since=<version>.
+    """
+    since = request.args.get('since', type=int)
+    
+    if since is not None:
+        version = status_clock.wait_for_change(since, timeout=min(request.args.get('wait', 25, type=float), 60))
+        if follow_current:
+            job = current_job()
+        changes = status_changes(since, follow_current, job) or {}
+        return jsonify({'version': version, 'boot_id': STATUS_BOOT_ID, 'changes': changes})
+    
+    version = status_clock.version
+    etag = f"{STATUS_BOOT_ID}-{version}"
+    if etag in request.if_none_match:
+        return Response(status=304, headers={'ETag': f'"{etag}"'})
+    
+    payload = status_payload(job)
+    if job is not None and not follow_current:
+        payload['timings'] = job['timings']
+    response = jsonify(dict(payload, version=version, boot_id=STATUS_BOOT_ID))
+    response.set_etag(etag)
+    return response
 
 @app.route('/get_status')
 def get_status():
-    return jsonify({
-        'status': state['status'],
-        'progress': state['progress'],
-        'analysis_complete': state['analysis_complete'],
-        'company_name': state['company_name'],
-        'product_name': state['product_name'],
-        'extracted_data': state['extracted_data'],
-        'browser_logged_in': state['browser_logged_in'],
-        'username': state['username']
-    })
+    return conditional_status(current_job(), follow_current=True)
+
+@app.route('/status_stream')
+def status_stream():
+    """⚡ SSE: push status/progress deltas for the dashboard's current job"""
+    return Response(status_event_stream(stream_cursor()), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+# ==================== BATCH API ====================
+@app.route('/batch', methods=['POST'])
+def start_batch():
+    """Start a batch from an uploaded CSV/JSON file or a JSON body {"items": [...]}"""
+    try:
+        upload = request.files.get('file')
+        if upload is not None:
+            items = parse_batch_items(upload.read().decode('utf-8'), upload.filename or "")
+        else:
+            items = parse_batch_items(request.get_data(as_text=True), "body.json")
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'success': False, 'message': f'Could not parse batch: {e}'}), 400
+    
+    if not items:
+        return jsonify({'success': False, 'message': 'No (company, product) pairs found'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'success': False, 'message': f'Batch limited to {BATCH_MAX_ITEMS} items'}), 400
+    
+    batch = BatchRun(uuid.uuid4().hex[:12], items)
+    batch_runs[batch.id] = batch
+    batch.start()
+    return jsonify({'success': True, 'batch_id': batch.id, 'items': len(items)})
+
+@app.route('/batch/<batch_id>')
+def batch_status(batch_id):
+    batch = batch_runs.get(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Unknown batch'}), 404
+    return jsonify(batch.summary())
+
+@app.route('/batch/<batch_id>/results')
+def batch_results(batch_id):
+    """Download results (?format=csv|json) once the batch has finished"""
+    batch = batch_runs.get(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Unknown batch'}), 404
+    if batch.results_path is None:
+        return jsonify({'error': 'Batch still running', 'summary': batch.summary()}), 409
+    
+    if request.args.get('format') == 'json':
+        response = jsonify({'batch_id': batch.id, 'results': batch.ordered_results()})
+        response.headers['Content-Disposition'] = f'attachment; filename=batch_{batch.id}.json'
+        return response
+    return send_file(os.path.abspath(batch.results_path), mimetype='text/csv', as_attachment=True,
+                     download_name=f"batch_{batch.id}.csv")
+
+# ==================== PER-JOB API ====================
+@app.route('/jobs')
+def list_jobs():
+    return jsonify({'jobs': job_registry.list(), 'current_job': state['current_job']})
+
+@app.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    job = job_registry.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return conditional_status(job, follow_current=False)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    if job_registry.get(job_id) is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return Response(status_event_stream(stream_cursor(), job_id), mimetype='text/event-stream', headers=SSE_HEADERS)
+
+@app.route('/jobs/<job_id>/query', methods=['POST'])
+def job_query(job_id):
+    job = job_registry.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    data = request.json
+    return jsonify({'response': answer_query(job, data.get('question'))})
+
+@app.route('/jobs/<job_id>/chat_history')
+def job_chat_history(job_id):
+    job = job_registry.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify({'chat_history': job['chat_history']})
+
+@app.route('/jobs/<job_id>/trace')
+def job_trace(job_id):
+    """Per-stage spans for one job (driver, navigation, OTP, search, capture, Groq, history)"""
+    job = job_registry.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job.trace_report())
 
 @app.route('/get_history')
 def get_history():
-    history = load_history()
-    recent = list(history.values())[-5:]
+    # Oldest-first, as the dashboard reverses the list for display
+    recent = history_store.recent(5)[::-1]
     return jsonify({'recent': recent})
 
+@app.route('/captures')
+def list_captures():
+    """Archived captures and reports, newest first (?company=, ?product=, ?limit=)"""
+    captures = history_store.captures(
+        request.args.get('company', ""), request.args.get('product', ""),
+        limit=max(1, min(request.args.get('limit', 50, type=int), 1000)),
+    )
+    return jsonify({'captures': captures, 'archive': history_store.archive_stats()})
+
+@app.route('/captures/<digest>')
+def get_capture(digest):
+    """One archived blob - sent still compressed when the client accepts gzip"""
+    if not capture_archive.exists(digest):
+        return jsonify({'error': 'Unknown capture'}), 404
+    headers = {'Cache-Control': 'private, max-age=31536000, immutable', 'ETag': f'"{digest}"'}
+    if request.headers.get('If-None-Match') == headers['ETag']:
+        return Response(status=304, headers=headers)
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = send_file(os.path.abspath(capture_archive.path(digest)), mimetype='text/plain; charset=utf-8',
+                             etag=False, conditional=False)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers.update(headers)
+        return response
+    return Response(capture_archive.iter_text(digest), mimetype='text/plain; charset=utf-8', headers=headers)
+
+@app.route('/history/search')
+def history_search():
+    """Ranked fuzzy matches over analysed company names (?q=, ?limit=)"""
+    query = request.args.get('q', "").strip()
+    if not query:
+        return jsonify({'error': 'Missing q'}), 400
+    started = time.perf_counter()
+    matches = history_store.search_names(query, limit=max(1, min(request.args.get('limit', 10, type=int), 100)))
+    return jsonify({
+        'query': query,
+        'canonical': canonical_company_name(query),
+        'matches': matches,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+
+@app.route('/get_cache_stats')
+def get_cache_stats():
+    return jsonify(llm_cache.stats())
+
+@app.route('/get_pool_status')
+def get_pool_status():
+    return jsonify(browser_pool.stats())
+
+def gauge_lines(name: str, help_text: str, value, metric_type: str = "gauge") -> list:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}", f"{name} {value}"]
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition: stage histograms, Groq scheduler, LLM cache and browser pool"""
+    cache = llm_cache.stats()
+    pool = browser_pool.stats()
+    groq = groq_scheduler.stats()
+    lines = stage_seconds.render() + stage_errors.render()
+    lines += groq_scheduler.wait_seconds.render() + groq_scheduler.retries.render()
+    lines += gauge_lines('volza_groq_queue_depth', 'Groq calls waiting for budget.', groq['queued'])
+    lines += gauge_lines('volza_groq_in_flight', 'Groq calls in progress.', groq['in_flight'])
+    lines += gauge_lines('volza_groq_tokens_available', 'Tokens left in the per-minute budget.', groq['tokens_available'])
+    lines += gauge_lines('volza_llm_cache_hits_total', 'LLM cache hits (memory or disk).', cache['hits'], "counter")
+    lines += gauge_lines('volza_llm_cache_misses_total', 'LLM cache misses.', cache['misses'], "counter")
+    lines += gauge_lines('volza_llm_cache_evictions_total', 'LLM cache evictions.', cache['evictions'], "counter")
+    lines += gauge_lines('volza_llm_cache_disk_bytes', 'Bytes stored in the on-disk LLM cache.', cache['disk_bytes'])
+    lines += gauge_lines('volza_browser_pool_size', 'Browser sessions in the pool.', pool['size'])
+    lines += gauge_lines('volza_browser_pool_idle', 'Idle browser sessions.', pool['idle'])
+    lines += gauge_lines('volza_browser_pool_logged_in', 'Browser sessions logged in to Volza.', pool['logged_in'])
+    lines += gauge_lines('volza_job_queue_depth', 'Analyses waiting for a browser session.', pool['queued'])
+    return Response("\n".join(lines) + "\n", mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz')
+def healthz():
+    """Readiness probe - answers without loading selenium or the Groq SDK"""
+    checks = {}
+    try:
+        history_store._conn().execute("SELECT 1").fetchone()
+        checks['history_db'] = 'ok'
+    except sqlite3.Error as e:
+        checks['history_db'] = f'error: {e}'
+    pool = browser_pool.stats()
+    ready = all(v == 'ok' for v in checks.values())
+    return jsonify({
+        'status': 'ok' if ready else 'unavailable',
+        'uptime_s': round(time.time() - PROCESS_STARTED, 1),
+        'checks': checks,
+        'loaded': {
+            'groq': client is not None,
+            'selenium': 'By' in globals(),
+        },
+        'browsers': {'size': pool['size'], 'idle': pool['idle'], 'logged_in': pool['logged_in']},
+        'job_queue': pool['queued'],
+    }), 200 if ready else 503
+
 @app.route('/new_analysis', methods=['POST'])
 def new_analysis():
-    state['analysis_complete'] = False
-    state['chat_history'] = []
-    state['company_name'] = ""
-    state['product_name'] = ""
-    state['extracted_data'] = ""
-    state['status'] = ""
-    state['progress'] = 0
+    state['current_job'] = None
     return jsonify({'success': True})
 
 @app.route('/close_browser', methods=['POST'])
 def close_browser():
-    if state['driver']:
-        try:
-            state['driver'].quit()
-        except:
-            pass
-    state['driver'] = None
+    browser_pool.close_all()
     state['browser_logged_in'] = False
     return jsonify({'success': True})
 
@@ -0,0 +1,337 @@
+"""
+Offline end-to-end benchmark of the Volza analysis pipeline.
+
+Runs run_volza_automation / continue_volza_analysis (through analysis_job, as the
+web app does) in a real Chrome against bench/fakes.py: a local Volza look-alike
+serving the recorded pages, a fake IMAP server delivering the OTP and a fake Groq
+client with configurable latency. No Volza account, Gmail inbox or Groq key needed.
+
+Reports per-stage timings (cold login run vs warm runs), throughput for N
+sequential analyses on one browser and N analyses across the browser pool, and
+peak memory; fails on regressions against a stored baseline. A final text phase
+serves results pages without table row markup, so those analyses extract their
+rows from the page text (map-reduce over FakeGroq, which reads the rows back out
+of each chunk) and fail the run if any row is lost.
+
+    python bench/e2e.py                          # compare with bench/baseline.json if present
+    python bench/e2e.py --update-baseline        # record a new baseline
+    python bench/e2e.py --analyses 6 --browsers 3 --rows 500 --groq-first-token 1.0
+
+Timings depend on the machine, so no baseline is committed. Record one on the host
+that runs the comparison (with Chrome installed and the default options, or the
+same options every time), check that the run reported no failures, and commit
+bench/baseline.json from there:
+
+    python bench/e2e.py --update-baseline && git add bench/baseline.json
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+try:
+    import resource  # peak RSS; not available on Windows
+except ImportError:
+    resource = None
+
+from fakes import FakeGroq, FakeVolzaServer, Mailbox, start_imap_server
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+OTP_SENDER = "noreply@volza.com"
+OTP_SUBJECT = "Your OTP for Secure Login"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the Volza analysis pipeline")
+    parser.add_argument("--analyses", type=int, default=4, help="analyses per phase (default: %(default)s)")
+    parser.add_argument("--browsers", type=int, default=2, help="browser pool size for the concurrent phase (default: %(default)s)")
+    parser.add_argument("--text-analyses", type=int, default=1,
+                        help="analyses whose rows come from page text extraction, 0 to skip (default: %(default)s)")
+    parser.add_argument("--rows", type=int, default=0, help="result rows served per search (default: the recorded 12)")
+    parser.add_argument("--page-size", type=int, default=0, help="rows per result page; smaller than --rows exercises the crawler")
+    parser.add_argument("--product", default="vinyl acetate monomer", help="product name entered for every analysis")
+    parser.add_argument("--results-delay", type=float, default=0.5, help="fake Volza search latency in seconds")
+    parser.add_argument("--otp-delay", type=float, default=1.0, help="seconds until the OTP mail lands in the inbox")
+    parser.add_argument("--typing-ms", type=int, default=200, help="simulated time for the user to type the company name")
+    parser.add_argument("--groq-first-token", type=float, default=0.4, help="fake Groq time to first token in seconds")
+    parser.add_argument("--groq-tokens-per-s", type=float, default=250.0, help="fake Groq output speed")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="write this run's metrics as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression (default: %(default)s)")
+    parser.add_argument("--min-delta-s", type=float, default=0.25, help="ignore timing regressions smaller than this")
+    parser.add_argument("--output", help="also write the full results JSON here")
+    parser.add_argument("--headed", action="store_true", help="show the Chrome windows instead of running headless")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary work directory")
+    return parser.parse_args()
+
+
+def peak_rss_mb(who) -> float:
+    if resource is None:
+        return None
+    kb = resource.getrusage(who).ru_maxrss
+    return round(kb / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KiB on Linux
+
+
+def stage_summary(reports: list) -> dict:
+    """{stage: mean seconds per analysis} over the given trace reports"""
+    totals = {}
+    for report in reports:
+        for stage, seconds in report['stage_totals_s'].items():
+            totals.setdefault(stage, []).append(seconds)
+    return {stage: round(sum(values) / len(reports), 3) for stage, values in sorted(totals.items())}
+
+
+def run_phase(count: int, run) -> dict:
+    """Run count analyses with run(count) and collect their outcome and timings"""
+    started = time.perf_counter()
+    jobs = run(count)
+    wall_s = time.perf_counter() - started
+    failed = [job for job in jobs if not job['analysis_complete']]
+    for job in failed:
+        print(f"❌ {job['company_name'] or job.id}: {job['status']}")
+    durations = [job['timings'].get('duration_s', 0.0) for job in jobs]
+    return {
+        'jobs': jobs,
+        'failed': len(failed),
+        'wall_s': round(wall_s, 3),
+        'per_min': round(len(jobs) / wall_s * 60, 2) if wall_s else 0.0,
+        'durations_s': durations,
+        'login_paths': [job['timings'].get('login_path') for job in jobs],
+    }
+
+
+def flatten_metrics(results: dict) -> dict:
+    """Metrics compared against the baseline; suffix gives the direction (_s/_mb lower, _per_min higher)"""
+    metrics = {
+        'sequential.cold_s': results['sequential']['cold_s'],
+        'sequential.warm_mean_s': results['sequential']['warm_mean_s'],
+        'sequential.analyses_per_min': results['sequential']['per_min'],
+        'concurrent.wall_s': results['concurrent']['wall_s'],
+        'concurrent.analyses_per_min': results['concurrent']['per_min'],
+        'memory.python_peak_mb': results['memory']['python_peak_mb'],
+        'memory.browser_peak_mb': results['memory']['browser_peak_mb'],
+    }
+    if results['text']['count']:
+        metrics['text.mean_s'] = results['text']['mean_s']
+    for phase in ('cold', 'warm', 'text'):
+        for stage, seconds in results['stages'][phase].items():
+            metrics[f'stage.{phase}.{stage}_s'] = seconds
+    return {name: value for name, value in metrics.items() if value is not None}
+
+
+def compare(metrics: dict, baseline: dict, tolerance: float, min_delta_s: float) -> list:
+    regressions = []
+    for name, value in metrics.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if name.endswith('_per_min'):
+            worse = value < base * (1 - tolerance)
+        else:
+            worse = value > base * (1 + tolerance)
+            if name.endswith('_s'):
+                worse = worse and value - base >= min_delta_s
+        if worse:
+            regressions.append((name, base, value))
+    return regressions
+
+
+def print_report(results: dict):
+    seq, conc, stages = results['sequential'], results['concurrent'], results['stages']
+    print("\n" + "=" * 72)
+    print("📊 VOLZA PIPELINE BENCHMARK (offline)")
+    print("=" * 72)
+    print(f"{'Stage':<22}{'cold (1st run)':>16}{'warm (mean)':>16}{'concurrent':>16}{'page text':>16}")
+    for stage in sorted(set(stages['cold']) | set(stages['warm']) | set(stages['concurrent']) | set(stages['text'])):
+        row = [stages[phase].get(stage) for phase in ('cold', 'warm', 'concurrent', 'text')]
+        print(f"{stage:<22}" + "".join(f"{v:>15.2f}s" if v is not None else f"{'-':>16}" for v in row))
+    print("-" * 72)
+    print(f"Sequential: {seq['count']} analyses in {seq['wall_s']:.1f}s → {seq['per_min']:.1f}/min "
+          f"(cold {seq['cold_s']:.1f}s, warm mean {seq['warm_mean_s'] or 0:.1f}s)")
+    print(f"Concurrent: {conc['count']} analyses on {conc['browsers']} browsers in {conc['wall_s']:.1f}s → {conc['per_min']:.1f}/min")
+    text = results['text']
+    if text['count']:
+        print(f"Page text:  {text['count']} analyses, mean {text['mean_s']:.1f}s, "
+              f"{text['rows_extracted']}/{text['rows_expected']} rows extracted")
+    memory = results['memory']
+    print(f"Peak RSS: python {memory['python_peak_mb']} MB, largest browser process {memory['browser_peak_mb']} MB")
+    print(f"Fake services: {results['fakes']}")
+
+
+def main() -> int:
+    args = parse_args()
+    analyses = max(1, args.analyses)
+    browsers = max(1, args.browsers)
+
+    workdir = tempfile.mkdtemp(prefix="volza-bench-")
+    mailbox = Mailbox()
+    imap = start_imap_server(mailbox)
+    volza = FakeVolzaServer(mailbox, OTP_SENDER, OTP_SUBJECT, otp_delay=args.otp_delay,
+                            results_delay=args.results_delay, rows=args.rows, page_size=args.page_size,
+                            typing_ms=args.typing_ms)
+
+    # The app reads its configuration at import time
+    for name in ("VALID_USERNAME", "VALID_PASSWORD", "GROQ_API_KEY"):
+        os.environ.setdefault(name, "bench")
+    os.environ.update({
+        'VOLZA_BASE_URL': volza.base_url,
+        'IMAP_SERVER': "127.0.0.1",
+        'IMAP_PORT': str(imap.server_address[1]),
+        'IMAP_SSL': "0",
+        'EMAIL': "bench@example.com",
+        'APP_PASSWORD': "bench",
+        'OTP_SENDER_EMAIL': OTP_SENDER,
+        'OTP_SUBJECT_KEYWORD': OTP_SUBJECT,
+        'BROWSER_POOL_SIZE': str(browsers),
+        'RETRIEVAL_ENABLED': "0",
+    })
+    os.chdir(workdir)  # history DB, LLM cache, browser profiles and captures stay out of the repo
+    sys.path.insert(0, REPO_ROOT)
+    import app
+
+    fake_groq = FakeGroq(args.groq_first_token, args.groq_tokens_per_s)
+    app.client = fake_groq
+    app.scream_message = lambda message: None
+
+    stamp = datetime.datetime.now().strftime("%H%M%S")
+    text_analyses = max(0, args.text_analyses)
+    company_names = iter(f"Bench Chemicals {stamp} {i:02d} Llp" for i in range(1, 2 * analyses + text_analyses + 1))
+
+    def new_job(text_only=False):
+        # Distinct companies, so every analysis misses the LLM cache like a real new search
+        volza.queue_company(next(company_names), text_only=text_only)
+        return app.job_registry.create(args.product)
+
+    def run_sequential(count, text_only=False):
+        session = app.browser_pool.lease()
+        try:
+            jobs = []
+            for _ in range(count):
+                job = new_job(text_only)
+                app.analysis_job(session, job, not args.headed)
+                jobs.append(job)
+            return jobs
+        finally:
+            app.browser_pool.release(session)
+
+    def run_concurrent(count):
+        jobs = []
+        for _ in range(count):
+            job = new_job()
+            app.browser_pool.submit(app.analysis_job, job, not args.headed, block=True)
+            jobs.append(job)
+        app.browser_pool.jobs.join()
+        return jobs
+
+    try:
+        print(f"🏁 Sequential phase: {analyses} analyses on one browser")
+        sequential = run_phase(analyses, run_sequential)
+        print(f"🏁 Concurrent phase: {analyses} analyses on {browsers} browsers")
+        concurrent = run_phase(analyses, run_concurrent)
+        text = {'jobs': [], 'failed': 0, 'durations_s': []}
+        if text_analyses:
+            print(f"🏁 Page text phase: {text_analyses} analyses without table row markup")
+            text = run_phase(text_analyses, lambda count: run_sequential(count, text_only=True))
+    finally:
+        app.browser_pool.close_all()
+        volza.shutdown()
+        imap.shutdown()
+
+    seq_reports = [job.trace_report() for job in sequential['jobs']]
+    warm = sequential['durations_s'][1:]
+    rows_expected = volza.page_size * text_analyses  # text-only results are never crawled past page 1
+    rows_extracted = sum(len(job['shipments'] or []) for job in text['jobs'])
+    results = {
+        'recorded_at': datetime.datetime.now().isoformat(),
+        'config': vars(args),
+        'sequential': {
+            'count': analyses,
+            'wall_s': sequential['wall_s'],
+            'per_min': sequential['per_min'],
+            'cold_s': sequential['durations_s'][0],
+            'warm_mean_s': round(statistics.mean(warm), 3) if warm else None,
+            'login_paths': sequential['login_paths'],
+            'failed': sequential['failed'],
+        },
+        'concurrent': {
+            'count': analyses,
+            'browsers': browsers,
+            'wall_s': concurrent['wall_s'],
+            'per_min': concurrent['per_min'],
+            'login_paths': concurrent['login_paths'],
+            'failed': concurrent['failed'],
+        },
+        'text': {
+            'count': text_analyses,
+            'mean_s': round(statistics.mean(text['durations_s']), 3) if text_analyses else None,
+            'rows_expected': rows_expected,
+            'rows_extracted': rows_extracted,
+            'failed': text['failed'],
+        },
+        'stages': {
+            'cold': stage_summary(seq_reports[:1]),
+            'warm': stage_summary(seq_reports[1:]) if len(seq_reports) > 1 else {},
+            'concurrent': stage_summary([job.trace_report() for job in concurrent['jobs']]),
+            'text': stage_summary([job.trace_report() for job in text['jobs']]) if text_analyses else {},
+        },
+        'memory': {
+            'python_peak_mb': peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+            'browser_peak_mb': peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+        },
+        'fakes': dict(volza.counters, groq_calls=fake_groq.calls),
+    }
+    print_report(results)
+
+    metrics = flatten_metrics(results)
+    results['metrics'] = metrics
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    failed = sequential['failed'] + concurrent['failed'] + text['failed']
+    status = 0
+    if failed:
+        print(f"❌ {failed} analyses did not complete")
+        status = 1
+    if rows_extracted < rows_expected:
+        print(f"❌ Page text extraction lost rows: {rows_extracted} of {rows_expected}")
+        failed += 1
+        status = 1
+
+    if args.update_baseline:
+        if failed:
+            print("⚠️ Not updating the baseline from a run with failures")
+        else:
+            with open(args.baseline, "w", encoding="utf-8") as f:
+                json.dump(metrics, f, indent=2, sort_keys=True)
+            print(f"💾 Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(metrics, baseline, args.tolerance, args.min_delta_s)
+        for name, base, value in regressions:
+            print(f"❌ Regression {name}: {base} → {value}")
+        if regressions:
+            status = 1
+        else:
+            print(f"✅ No regressions against {os.path.relpath(args.baseline, REPO_ROOT)} (tolerance {args.tolerance:.0%})")
+    else:
+        print("ℹ️ No baseline yet - run with --update-baseline to record one")
+
+    if args.keep:
+        print(f"📁 Work directory kept: {workdir}")
+    else:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
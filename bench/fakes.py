@@ -0,0 +1,520 @@
+"""
+Offline stand-ins for Volza, Gmail (IMAP) and Groq used by bench/e2e.py.
+
+- FakeVolzaServer: local HTTP server serving the recorded Volza pages in
+  bench/fake_volza/ plus the result table from fixtures/volza/search_results.html,
+  and the search API (VOLZA_TRANSPORT=http) from fixtures/volza/search_api_response.json
+- Mailbox / start_imap_server: minimal IMAP4rev1 server (LOGIN, SELECT, STATUS,
+  IDLE, UID SEARCH/FETCH) that delivers the OTP mails
+- FakeGroq: drop-in for groq.Groq's with_raw_response chat API with configurable latency
+"""
+import email
+import http.server
+import json
+import os
+import queue
+import random
+import re
+import select
+import socketserver
+import threading
+import time
+from email.message import EmailMessage
+from http.cookies import SimpleCookie
+from types import SimpleNamespace
+from urllib.parse import urlparse, parse_qs
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGES_DIR = os.path.join(BENCH_DIR, "fake_volza")
+RESULTS_FIXTURE = os.path.join(os.path.dirname(BENCH_DIR), "fixtures", "volza", "search_results.html")
+API_FIXTURE = os.path.join(os.path.dirname(BENCH_DIR), "fixtures", "volza", "search_api_response.json")
+API_SEARCH_PATH = "/api/search/global"  # app.py's default VOLZA_SEARCH_PATH
+FIXTURE_COMPANY = "GLOBAL KEMYA INDIA LLP"
+
+
+# ==================== FAKE IMAP ====================
+class Mailbox:
+    """Messages as (uid, email.message.Message); IDLE sessions wait on cond"""
+
+    def __init__(self):
+        self.messages = []
+        self.next_uid = 1
+        self.cond = threading.Condition()
+
+    def deliver(self, sender: str, subject: str, body: str):
+        msg = EmailMessage()
+        msg['From'] = sender
+        msg['To'] = "bench@example.com"
+        msg['Subject'] = subject
+        msg.set_content(body, cte='quoted-printable')
+        msg.add_alternative(f"<p>{body}</p>", subtype='html')
+        with self.cond:
+            self.messages.append((self.next_uid, email.message_from_bytes(msg.as_bytes())))
+            self.next_uid += 1
+            self.cond.notify_all()
+
+
+def _bodystructure(part) -> str:
+    if part.is_multipart():
+        children = "".join(_bodystructure(p) for p in part.get_payload())
+        return f'({children} "{part.get_content_subtype()}" ("boundary" "{part.get_boundary()}") NIL NIL)'
+    payload = part.get_payload()
+    encoding = part.get('Content-Transfer-Encoding', '7bit')
+    charset = part.get_content_charset() or 'us-ascii'
+    return (f'("{part.get_content_maintype()}" "{part.get_content_subtype()}" ("charset" "{charset}") '
+            f'NIL NIL "{encoding}" {len(payload)} {payload.count(chr(10))})')
+
+
+def _section(msg, section: str) -> bytes:
+    part = msg
+    for number in section.split('.'):
+        if part.is_multipart():
+            part = part.get_payload()[int(number) - 1]
+    return part.get_payload().encode()
+
+
+class _ImapHandler(socketserver.StreamRequestHandler):
+    mailbox = None  # set per server by start_imap_server
+    reported = 0  # message count last announced to this client
+
+    def send(self, line: str):
+        self.wfile.write(line.encode() + b"\r\n")
+        self.wfile.flush()
+
+    def handle(self):
+        box = self.mailbox
+        self.send("* OK fake IMAP ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode().rstrip("\r\n").partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+            if command == "CAPABILITY":
+                self.send("* CAPABILITY IMAP4rev1 IDLE")
+                self.send(f"{tag} OK CAPABILITY completed")
+            elif command == "LOGIN":
+                self.send(f"{tag} OK LOGIN completed")
+            elif command in ("SELECT", "EXAMINE"):
+                self.reported = len(box.messages)
+                self.send(f"* {self.reported} EXISTS")
+                self.send(f"* OK [UIDNEXT {box.next_uid}] Predicted next UID")
+                self.send(f"{tag} OK [READ-WRITE] SELECT completed")
+            elif command == "NOOP":
+                self.send(f"{tag} OK NOOP completed")
+            elif command == "STATUS":
+                self.send(f"* STATUS INBOX (UIDNEXT {box.next_uid})")
+                self.send(f"{tag} OK STATUS completed")
+            elif command == "LOGOUT":
+                self.send("* BYE logging out")
+                self.send(f"{tag} OK LOGOUT completed")
+                return
+            elif command == "IDLE":
+                if not self._idle(tag):
+                    return
+            elif command == "UID":
+                self._uid(tag, args)
+            else:
+                self.send(f"{tag} BAD unknown command")
+
+    def _idle(self, tag: str) -> bool:
+        box = self.mailbox
+        # Mail that arrived since the last report goes out in the same packet as the
+        # continuation, like real servers do; clients must not miss it
+        with box.cond:
+            greeting = "+ idling\r\n"
+            if len(box.messages) > self.reported:
+                self.reported = len(box.messages)
+                greeting += f"* {self.reported} EXISTS\r\n"
+        self.wfile.write(greeting.encode())
+        self.wfile.flush()
+        while True:
+            with box.cond:
+                box.cond.wait(0.05)
+                if len(box.messages) > self.reported:
+                    self.reported = len(box.messages)
+                    self.send(f"* {self.reported} EXISTS")
+            if select.select([self.connection], [], [], 0)[0]:
+                line = self.rfile.readline()
+                if not line:
+                    return False
+                if line.strip().upper() == b"DONE":
+                    self.send(f"{tag} OK IDLE terminated")
+                    return True
+
+    def _uid(self, tag: str, args: str):
+        box = self.mailbox
+        sub, _, rest = args.partition(" ")
+        sub = sub.upper()
+        if sub == "SEARCH":
+            floor = re.search(r'UID (\d+):\*', rest)
+            sender = re.search(r'FROM "([^"]*)"', rest)
+            subject = re.search(r'SUBJECT "([^"]*)"', rest)
+            hits = [uid for uid, msg in box.messages
+                    if (not sender or sender.group(1) in msg['From'])
+                    and (not subject or subject.group(1) in msg['Subject'])]
+            if floor:
+                # "n:*" always matches the newest message, as on a real server
+                newest = box.messages[-1][0] if box.messages else None
+                hits = [uid for uid in hits if uid >= int(floor.group(1))] or ([newest] if newest in hits else [])
+            self.send("* SEARCH " + " ".join(map(str, hits)))
+            self.send(f"{tag} OK SEARCH completed")
+        elif sub == "FETCH":
+            uid, _, what = rest.partition(" ")
+            uids = [u for u, _ in box.messages]
+            msg = dict(box.messages).get(int(uid))
+            if msg is not None:
+                seq = uids.index(int(uid)) + 1
+                if "BODYSTRUCTURE" in what:
+                    self.send(f"* {seq} FETCH (UID {uid} BODYSTRUCTURE {_bodystructure(msg)})")
+                else:
+                    match = re.search(r'BODY(?:\.PEEK)?\[([\d.]*)\]', what)
+                    section = match.group(1) if match else ""
+                    data = _section(msg, section) if section else msg.as_bytes()
+                    self.wfile.write(f"* {seq} FETCH (UID {uid} BODY[{section}] {{{len(data)}}}\r\n".encode() + data + b")\r\n")
+            self.send(f"{tag} OK FETCH completed")
+        else:
+            self.send(f"{tag} BAD unsupported UID command")
+
+
+def start_imap_server(mailbox: Mailbox, port: int = 0) -> socketserver.ThreadingTCPServer:
+    handler = type("ImapHandler", (_ImapHandler,), {"mailbox": mailbox})
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-imap", daemon=True).start()
+    return server
+
+
+# ==================== FAKE VOLZA ====================
+def load_result_rows(path: str = RESULTS_FIXTURE) -> tuple:
+    """(fragment template, row templates) from the recorded results page"""
+    with open(path, "r", encoding="utf-8") as f:
+        page = f.read()
+    start = page.index('<div class="search-summary">')
+    end = page.index('</body>')
+    fragment = page[start:end]
+    rows = re.findall(r'<tr data-row-key="\d+"[\s\S]*?</tr>', fragment)
+    return fragment, rows
+
+
+class FakeVolzaServer:
+    """
+    Serves login → OTP → company select → workspace → results like app.volza.com.
+    OTP mails go to the fake IMAP mailbox; companies queued with queue_company()
+    are "typed" into the search form in order. Results for companies queued with
+    text_only=True lack the table row markup, so the app falls back to extracting
+    the rows from the page text. POST /api/search/global answers
+    with the recorded JSON rows, paged like the real API, for requests carrying a
+    signed-in session cookie (and the bearer token when api_token is set).
+    """
+
+    def __init__(self, mailbox: Mailbox, otp_sender: str, otp_subject: str, otp_delay: float = 0.5,
+                 results_delay: float = 0.5, rows: int = 0, page_size: int = 0, typing_ms: int = 200,
+                 api_token: str = ""):
+        self.mailbox = mailbox
+        self.otp_sender = otp_sender
+        self.otp_subject = otp_subject
+        self.otp_delay = otp_delay
+        self.results_delay = results_delay
+        self.typing_ms = typing_ms
+        self.companies = queue.Queue()
+        self.text_only = set()  # lower-cased company names served without row markup
+        self.sessions = set()
+        self.otps = set()  # issued, unused codes - concurrent logins share one inbox
+        self.api_token = api_token
+        self.counters = {'otp_sent': 0, 'sign_ins': 0, 'searches': 0, 'pages_served': 0, 'rows_served': 0,
+                         'api_requests': 0, 'api_rejected': 0}
+        self._lock = threading.Lock()
+        self._fragment, self._rows = load_result_rows()
+        self.rows = rows or len(self._rows)
+        self.page_size = page_size or self.rows
+        with open(API_FIXTURE, "r", encoding="utf-8") as f:
+            self._api_payload = json.load(f)
+        self.pages = {}
+        for name in ("login", "company", "workspace"):
+            with open(os.path.join(PAGES_DIR, f"{name}.html"), "rb") as f:
+                self.pages[name] = f.read()
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, name="fake-volza", daemon=True).start()
+
+    def queue_company(self, company: str, text_only: bool = False):
+        if text_only:
+            with self._lock:
+                self.text_only.add(company.lower())
+        self.companies.put(company)
+
+    def create_session(self) -> str:
+        """A signed-in session cookie value, as if the OTP login had completed"""
+        token = f"{random.getrandbits(64):016x}"
+        with self._lock:
+            self.sessions.add(token)
+        return token
+
+    def shutdown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def page_count(self) -> int:
+        return max(1, -(-self.rows // self.page_size))
+
+    def results_html(self, company: str, page: int = 1) -> str:
+        """
+        One page of the recorded table with the shipper swapped for company, repeated
+        up to self.rows rows in total, plus antd-style pagination when there is more than one page
+        """
+        start = (page - 1) * self.page_size
+        rows = []
+        for i in range(start, min(start + self.page_size, self.rows)):
+            template = self._rows[i % len(self._rows)]
+            rows.append(re.sub(r'data-row-key="\d+"', f'data-row-key="{i}"', template, count=1))
+        first, last = self._fragment.index(self._rows[0]), self._fragment.index(self._rows[-1]) + len(self._rows[-1])
+        html = self._fragment[:first] + "\n".join(rows) + self._fragment[last:]
+        html = html.replace("Shipments: 12", f"Shipments: {self.rows}")
+        if self.page_count() > 1:
+            last_page = page >= self.page_count()
+            html += (
+                f'<ul class="ant-pagination"><li class="ant-pagination-item ant-pagination-item-active">{page}</li>'
+                f'<li class="ant-pagination-next{" ant-pagination-disabled" if last_page else ""}" '
+                f'aria-disabled="{"true" if last_page else "false"}" data-page="{page + 1}">'
+                f'<button class="ant-pagination-item-link" type="button">&rsaquo;</button></li></ul>'
+            )
+        if company.lower() in self.text_only:
+            html = re.sub(r' data-row-key="\d+"', '', html)
+        return html.replace(FIXTURE_COMPANY, company.upper())
+
+    def api_response(self, company: str, page: int, page_size: int) -> dict:
+        """Recorded API rows for company, repeated up to self.rows in total, one page of them"""
+        recorded = self._api_payload['data']['rows']
+        start = (page - 1) * page_size
+        rows = []
+        for i in range(start, min(start + page_size, self.rows)):
+            row = dict(recorded[i % len(recorded)])
+            row['shipperName'] = company.upper()
+            rows.append(row)
+        data = dict(self._api_payload['data'], totalCount=self.rows, page=page, pageSize=page_size, rows=rows)
+        return dict(self._api_payload, data=data)
+
+    def _send_otp(self):
+        code = f"{random.randint(0, 999999):06d}"
+        with self._lock:
+            self.otps.add(code)
+            self.counters['otp_sent'] += 1
+        body = f"Dear user, your OTP for secure login is {code}. It is valid for 10 minutes."
+        threading.Timer(self.otp_delay, self.mailbox.deliver, (self.otp_sender, self.otp_subject, body)).start()
+
+    def _sign_in(self, otp: str) -> bool:
+        with self._lock:
+            if otp in self.otps:
+                self.otps.discard(otp)
+                self.counters['sign_ins'] += 1
+                return True
+        return False
+
+    def _handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def cookies(self) -> dict:
+                jar = SimpleCookie(self.headers.get('Cookie', ''))
+                return {k: v.value for k, v in jar.items()}
+
+            def reply(self, status: int, body: bytes = b"", content_type: str = "text/html; charset=utf-8", headers=()):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def redirect(self, location: str, headers=()):
+                self.reply(302, headers=(("Location", location),) + tuple(headers))
+
+            def reply_json(self, payload, headers=()):
+                self.reply(200, json.dumps(payload).encode(), "application/json", headers)
+
+            def read_json(self) -> dict:
+                length = int(self.headers.get('Content-Length') or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                cookies = self.cookies()
+                logged_in = cookies.get('volza_session') in server.sessions
+                if url.path.startswith("/workspace"):
+                    if not logged_in:
+                        self.redirect("/login")
+                    elif cookies.get('volza_company') != "1":
+                        self.redirect("/select-company")
+                    else:
+                        self.reply(200, server.pages['workspace'])
+                elif url.path == "/login":
+                    self.reply(200, server.pages['login'])
+                elif url.path == "/select-company":
+                    if logged_in:
+                        self.reply(200, server.pages['company'])
+                    else:
+                        self.redirect("/login")
+                elif url.path == "/bench/select-company":
+                    self.redirect("/workspace/search/0", headers=(("Set-Cookie", "volza_company=1; Path=/"),))
+                elif url.path == "/bench/next-company":
+                    try:
+                        company = server.companies.get_nowait()
+                    except queue.Empty:
+                        company = f"Bench Company {random.randint(1000, 9999)}"
+                    self.reply_json({'company': company, 'typing_ms': server.typing_ms})
+                elif url.path == "/bench/results":
+                    query = parse_qs(url.query)
+                    company = query.get('company', ["Unknown"])[0]
+                    page = min(max(1, int(query.get('page', ["1"])[0])), server.page_count())
+                    time.sleep(server.results_delay)
+                    html = server.results_html(company, page)
+                    with server._lock:
+                        server.counters['searches'] += page == 1
+                        server.counters['pages_served'] += 1
+                        server.counters['rows_served'] += html.count('ant-table-row-level-0')
+                    self.reply(200, html.encode())
+                elif url.path == "/favicon.ico":
+                    self.reply(204)
+                else:
+                    self.reply(404, b"not found")
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                data = self.read_json()
+                if url.path == API_SEARCH_PATH:
+                    authorized = self.cookies().get('volza_session') in server.sessions and (
+                        not server.api_token or self.headers.get('Authorization') == f"Bearer {server.api_token}")
+                    with server._lock:
+                        server.counters['api_requests' if authorized else 'api_rejected'] += 1
+                    if not authorized:
+                        self.reply(401, b'{"status": "unauthorized"}', "application/json")
+                        return
+                    time.sleep(server.results_delay)
+                    page = max(1, int(data.get('page') or 1))
+                    page_size = max(1, int(data.get('pageSize') or 100))
+                    payload = server.api_response(data.get('value') or "Unknown", page, page_size)
+                    with server._lock:
+                        server.counters['rows_served'] += len(payload['data']['rows'])
+                    self.reply_json(payload)
+                elif url.path == "/bench/send-otp":
+                    server._send_otp()
+                    self.reply_json({'ok': True})
+                elif url.path == "/bench/sign-in":
+                    if server._sign_in((data.get('otp') or "").strip()):
+                        token = server.create_session()
+                        self.reply_json({'ok': True, 'next': "/select-company"},
+                                        headers=(("Set-Cookie", f"volza_session={token}; Path=/; Max-Age=86400"),))
+                    else:
+                        self.reply_json({'ok': False, 'error': "Invalid OTP"})
+                else:
+                    self.reply(404, b"not found")
+
+        return Handler
+
+
+# ==================== FAKE GROQ ====================
+def extract_text_rows(text: str) -> list:
+    """
+    What the model reads out of a chunk of results page text: every run of the recorded
+    table's eight cells starting with a date (innerText separates cells with tabs, and
+    block elements inside a cell may add line breaks)
+    """
+    cells = [cell.strip() for cell in re.split(r'[\t\n]+', text) if cell.strip()]
+    rows = []
+    i = 0
+    while i + 8 <= len(cells):
+        if not re.match(r'\d{1,2}-[A-Za-z]{3}-\d{4}$', cells[i]):
+            i += 1
+            continue
+        date, hs_code, _, shipper, consignee, country, quantity, value = cells[i:i + 8]
+        rows.append({"date": date, "shipper": shipper, "consignee": consignee, "country": country,
+                     "hs_code": hs_code, "quantity": quantity, "value": value})
+        i += 8
+    return rows
+
+
+BENCH_REPORT = """---
+
+## 🎯 CRITICAL QUESTION & ANSWER
+
+**Answer:** YES
+
+**Reason:**
+The captured shipments go to several consignees in several countries over multiple years.
+
+---
+
+## ✅ Legitimacy Assessment
+
+**Status:** LEGITIMATE
+
+**Why:**
+Repeat buyers across different markets with consistent volumes.
+
+---
+
+## 🚨 Red Flags (if any)
+
+None detected
+
+---
+
+## 💡 Quick Recommendation
+
+Proceed with standard verification of documents and samples."""
+
+
+class FakeGroq:
+    """
+    Stands in for groq.Groq: chat.completions.with_raw_response.create(...) after
+    first_token_s, then output tokens at tokens_per_s (streamed or all at once).
+    """
+
+    def __init__(self, first_token_s: float = 0.4, tokens_per_s: float = 250.0, reply: str = BENCH_REPORT):
+        self.first_token_s = first_token_s
+        self.tokens_per_s = tokens_per_s
+        self.reply = reply
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(
+            with_raw_response=SimpleNamespace(create=self.create)
+        ))
+
+    def _answer(self, messages: list) -> str:
+        prompt = str(messages[-1].get('content', '')) if messages else ""
+        if '"shipments"' in prompt:
+            return json.dumps({"shipments": extract_text_rows(prompt)})  # map-reduce chunk extraction
+        return self.reply
+
+    def create(self, model=None, messages=(), stream=False, max_completion_tokens=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        tokens = re.findall(r'\S+\s*', self._answer(list(messages)))
+        tokens = tokens[:max_completion_tokens or len(tokens)]  # cut off like a real length stop
+        prompt_tokens = sum(len(str(m.get('content', ''))) for m in messages) // 4
+        headers = {}  # no rate-limit headers: the scheduler's own RPM/TPM buckets apply
+        time.sleep(self.first_token_s)
+
+        if stream:
+            def chunks():
+                for token in tokens:
+                    yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+                    time.sleep(1.0 / self.tokens_per_s)
+            return SimpleNamespace(headers=headers, parse=chunks)
+
+        time.sleep(len(tokens) / self.tokens_per_s)
+        response = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="".join(tokens)))],
+            usage=SimpleNamespace(total_tokens=prompt_tokens + len(tokens)),
+        )
+        return SimpleNamespace(headers=headers, parse=lambda: response)
@@ -0,0 +1,122 @@
+"""
+Cold-start budget check for app.py.
+
+Imports the app in a fresh interpreter under `python -X importtime`, answers one
+/healthz request and fails (exit code 1) when the import goes over the budget or
+when a heavy dependency that should load lazily shows up at startup.
+
+    python bench/importtime.py                     # default budget
+    python bench/importtime.py --budget-ms 400 --runs 5
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", 500))
+
+# Must only be imported on first browser / LLM / HTTP-transport / retrieval use
+LAZY_MODULES = ("selenium", "undetected_chromedriver", "groq", "httpx", "requests",
+                "chromadb", "sentence_transformers", "torch", "numpy")
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/healthz')
+answered = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_response_ms': (answered - imported) * 1000,
+    'healthz_status': response.status_code,
+    'loaded': sorted(m for m in %r if m in sys.modules),
+}))
+""" % (LAZY_MODULES,)
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)")
+
+
+def parse_importtime(stderr: str) -> list:
+    """(cumulative_us, self_us, depth, module) for every line of -X importtime output"""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((int(cumulative_us), int(self_us), (len(indent) - 1) // 2, module))
+    return rows
+
+
+def run_once(workdir: str) -> dict:
+    env = dict(os.environ)
+    # Dummy credentials - the app refuses to import without them
+    for name in ("VALID_USERNAME", "VALID_PASSWORD", "GROQ_API_KEY"):
+        env.setdefault(name, "bench")
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE],
+                          cwd=workdir, env=env, capture_output=True, text=True, timeout=120)
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        raise SystemExit(f"❌ Importing app failed (exit {proc.returncode})")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    # Children are printed before their parent, so app's direct imports are the
+    # depth-1 rows between the previous top-level line and the "app" line
+    children, app_row = [], None
+    for row in parse_importtime(proc.stderr):
+        if row[2] == 1:
+            children.append(row)
+        elif row[2] == 0:
+            if row[3] == "app":
+                app_row = row
+                break
+            children = []
+    result["importtime_ms"] = app_row[0] / 1000 if app_row else result["import_ms"]
+    result["slowest"] = sorted(children, reverse=True)[:10]
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="maximum median import time of app.py (default: %(default)s, env IMPORT_BUDGET_MS)")
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters to start (default: %(default)s)")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="volza-importtime-") as workdir:
+        for _ in range(max(1, args.runs)):
+            results.append(run_once(workdir))
+
+    import_ms = statistics.median(r["importtime_ms"] for r in results)
+    first_response_ms = statistics.median(r["first_response_ms"] for r in results)
+    loaded = sorted({m for r in results for m in r["loaded"]})
+
+    print(f"⏱️ import app: {import_ms:.0f} ms median over {len(results)} runs (budget {args.budget_ms:.0f} ms)")
+    print(f"⏱️ first /healthz: {first_response_ms:.0f} ms (HTTP {results[-1]['healthz_status']})")
+    print("   Slowest direct imports:")
+    for cumulative_us, _self_us, _depth, module in results[-1]["slowest"]:
+        print(f"   {cumulative_us / 1000:8.1f} ms  {module}")
+
+    failed = False
+    if import_ms > args.budget_ms:
+        print(f"❌ Cold start over budget by {import_ms - args.budget_ms:.0f} ms")
+        failed = True
+    if loaded:
+        print(f"❌ Loaded at startup but should be lazy: {', '.join(loaded)}")
+        failed = True
+    if results[-1]["healthz_status"] != 200:
+        print("❌ /healthz is not ready")
+        failed = True
+    if not failed:
+        print("✅ Startup within budget")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+"""
+Shared setup: app.py refuses to import without credentials and writes its
+history DB, caches and captures to the working directory, so the tests run
+with dummy credentials from a throwaway directory.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(REPO_ROOT, "fixtures", "volza")
+
+for name in ("VALID_USERNAME", "VALID_PASSWORD", "GROQ_API_KEY"):
+    os.environ.setdefault(name, "test")
+os.environ.setdefault("RETRIEVAL_ENABLED", "0")
+os.chdir(tempfile.mkdtemp(prefix="volza-tests-"))
+sys.path[:0] = [REPO_ROOT, os.path.join(REPO_ROOT, "bench")]
+
+
+@pytest.fixture
+def fixture_path():
+    return lambda name: os.path.join(FIXTURES_DIR, name)
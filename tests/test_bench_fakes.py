@@ -0,0 +1,40 @@
+"""FakeGroq answers map-reduce extraction with the rows of a text-only fake results page"""
+import html
+import re
+
+import pytest
+
+import app
+from fakes import FakeGroq, FakeVolzaServer, Mailbox
+
+
+def inner_text(page: str) -> str:
+    """Close enough to Chrome's innerText: tab between cells, line break per row and block"""
+    text = re.sub(r'</td>\s*<td[^>]*>', '\t', page)
+    text = re.sub(r'<div[^>]*>|</tr>', '\n', text)
+    return html.unescape(re.sub(r'<[^>]+>', '', text))
+
+
+@pytest.fixture
+def text_page():
+    server = FakeVolzaServer(Mailbox(), "otp@volza.test", "OTP", results_delay=0)
+    server.queue_company("Text Only Co", text_only=True)
+    page = server.results_html("Text Only Co")
+    server.shutdown()
+    return page
+
+
+def test_text_only_page_goes_through_map_reduce(monkeypatch, text_page):
+    assert "data-row-key" not in text_page
+    monkeypatch.setattr(app, 'client', FakeGroq(first_token_s=0, tokens_per_s=1e9))
+    monkeypatch.setattr(app, 'llm_cache', app.LLMCache("llm_cache_fakes", 0, 10, 1 << 20))
+    records = app.map_reduce_extract(inner_text(text_page), "Text Only Co", "vam")
+    metrics = app.aggregate_trade_metrics(records)
+    assert (metrics['total_shipments'], metrics['distinct_consignees'], metrics['total_value']) == (12, 6, 239608.0)
+    assert {r.shipper for r in records} == {"TEXT ONLY CO"}
+
+
+def test_fake_groq_stops_at_max_completion_tokens():
+    reply = FakeGroq(first_token_s=0, tokens_per_s=1e9).create(
+        messages=[{'role': 'user', 'content': "report"}], max_completion_tokens=3).parse()
+    assert len(reply.choices[0].message.content.split()) == 3
@@ -0,0 +1,31 @@
+"""Captures: store_capture never leaves temporary files behind, /captures validates its query"""
+import os
+
+import pytest
+
+import app
+from app import ShipmentRecord, ShipmentSink
+
+
+def test_empty_full_search_discards_sink(tmp_path):
+    sink = ShipmentSink.create(str(tmp_path))
+    analysed = app.store_capture("Empty Capture Co", "acid", sink, "No records found", None)
+    assert analysed == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_stored_capture_discards_sink(tmp_path):
+    sink = ShipmentSink.create(str(tmp_path))
+    sink.write([ShipmentRecord(shipper="STORED CAPTURE CO", consignee="BUYER", country="Spain", date="2024-01-05")])
+    analysed = app.store_capture("Stored Capture Co", "acid", sink, "", None)
+    assert [r.consignee for r in analysed] == ["BUYER"]
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("limit", ["abc", "-1", "0", "5000"])
+def test_captures_limit_is_validated(monkeypatch, limit):
+    seen = []
+    monkeypatch.setattr(app.history_store, 'captures', lambda company, product, limit: seen.append(limit) or [])
+    response = app.app.test_client().get(f'/captures?limit={limit}')
+    assert response.status_code == 200
+    assert 1 <= seen[0] <= 1000
@@ -0,0 +1,59 @@
+"""Company identity in history: canonical names decide, trigram similarity only suggests"""
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("name, canonical", [
+    ("ABC Chemicals Pvt. Ltd.", "abc chemicals"),
+    ("ABC CHEMICALS PRIVATE LIMITED", "abc chemicals"),
+    ("M/s. Abc Chemicals", "abc chemicals"),
+    ("Shah & Co", "shah"),
+    ("ABC Chemicals International", "abc chemicals international"),
+    ("Norsk Kjemi AS", "norsk kjemi as"),
+])
+def test_canonical_company_name(name, canonical):
+    assert app.canonical_company_name(name) == canonical
+
+
+@pytest.fixture
+def index():
+    index = app.CompanyNameIndex()
+    index.add("abc chemicals pvt ltd", "ABC Chemicals Pvt Ltd", "acid", "2024-01-01T10:00:00")
+    index.add("tata chemicals ltd", "Tata Chemicals Ltd", "soda", "2024-02-01T10:00:00")
+    return index
+
+
+def test_exact_matches_canonical_name_only(index):
+    assert index.exact("ABC CHEMICALS LIMITED") == "ABC Chemicals Pvt Ltd"
+    assert index.exact("ABC Chemicals International") is None
+    assert index.exact("Tata Chemical") is None
+
+
+def test_exact_prefers_latest_analysis(index):
+    index.add("abc chemicals", "Abc Chemicals", "acid", "2024-03-01T10:00:00")
+    assert index.exact("ABC Chemicals Private Limited") == "Abc Chemicals"
+
+
+def test_similar_names_still_rank(index):
+    matches = index.search("Tata Chemical", limit=1)
+    assert matches[0]['company_name'] == "Tata Chemicals Ltd"
+    assert matches[0]['score'] < 1.0
+
+
+def test_similar_name_is_not_adopted(monkeypatch, index):
+    monkeypatch.setattr(app.history_store, 'name_index', lambda: index)
+    monkeypatch.setattr(app.history_store, 'load', lambda name: {'company_name': name} if name in (
+        "ABC Chemicals Pvt Ltd", "Tata Chemicals Ltd") else None)
+    assert app.known_company_name("ABC Chemicals Limited") == "ABC Chemicals Pvt Ltd"
+    assert app.known_company_name("Tata Chemical") == "Tata Chemical"
+    assert app.known_company_name("ABC Chemicals International") == "ABC Chemicals International"
+
+
+@pytest.mark.parametrize("limit", ["x", "-3", "0", "500"])
+def test_history_search_limit_is_validated(monkeypatch, limit):
+    seen = []
+    monkeypatch.setattr(app.history_store, 'search_names', lambda query, limit: seen.append(limit) or [])
+    response = app.app.test_client().get(f'/history/search?q=abc&limit={limit}')
+    assert response.status_code == 200
+    assert 1 <= seen[0] <= 100
@@ -0,0 +1,26 @@
+"""HistoryStore opens its database on first use, not when app is imported"""
+import json
+import threading
+
+import app
+
+
+def test_database_created_on_first_use(tmp_path):
+    legacy = tmp_path / "company_analyses.json"
+    legacy.write_text(json.dumps({"acme chemicals": {
+        "company_name": "Acme Chemicals", "product_searched": "acid",
+        "analysis_date": "2024-01-01T10:00:00", "extracted_data": "report",
+    }}), encoding="utf-8")
+    db_path = tmp_path / "history.db"
+    store = app.HistoryStore(str(db_path), legacy_json_path=str(legacy))
+    assert not db_path.exists()
+    
+    # The first lookups race from several threads: each must find the migrated schema
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(store.load("ACME chemicals"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert db_path.exists()
+    assert [entry['extracted_data'] for entry in results] == ["report"] * 4
@@ -0,0 +1,86 @@
+"""VolzaApiClient / api_search against FakeVolzaServer's recorded search API"""
+import pytest
+
+import app
+from fakes import FakeVolzaServer, Mailbox
+
+COMPANY = "Acme Chemicals Llp"
+
+
+class FakeDriver:
+    """Just what VolzaApiClient.load_browser_auth reads from a logged-in browser"""
+
+    def __init__(self, session_cookie: str, token: str = ""):
+        self.cookies = [{'name': 'volza_session', 'value': session_cookie, 'domain': '127.0.0.1', 'path': '/'}]
+        self.token = token
+
+    def get_cookies(self):
+        return self.cookies
+
+    def execute_script(self, script, *args):
+        if "userAgent" in script:
+            return "FakeChrome/1.0"
+        return f'"{self.token}"' if self.token else None
+
+
+class Session:
+    def __init__(self, driver):
+        self.driver = driver
+        self.api = None
+
+
+@pytest.fixture
+def volza():
+    server = FakeVolzaServer(Mailbox(), "otp@volza.test", "OTP", results_delay=0, rows=25, api_token="secret")
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture
+def bearer(monkeypatch):
+    monkeypatch.setattr(app, "VOLZA_AUTH_STORAGE_KEY", "authToken")
+
+
+def make_client(server, **kwargs):
+    return app.VolzaApiClient(base_url=server.base_url, **kwargs)
+
+
+def test_search_follows_pages_until_total(volza, bearer):
+    client = make_client(volza, page_size=10)
+    client.load_browser_auth(FakeDriver(volza.create_session(), "secret"))
+    records = client.search(COMPANY, "01/01/2019")
+
+    assert len(records) == 25
+    assert volza.counters['api_requests'] == 3
+    assert {r.shipper for r in records} == {COMPANY.upper()}
+    first = records[0]
+    assert (first.date, first.consignee, first.country) == ("2019-01-05", "AL GHURAIR RESOURCES LLC", "United Arab Emirates")
+    assert (first.quantity, first.value, first.hs_code) == (16000.0, 21440.0, "29153100")
+
+
+def test_search_stops_at_max_pages(volza, bearer):
+    client = make_client(volza, page_size=10, max_pages=2)
+    client.load_browser_auth(FakeDriver(volza.create_session(), "secret"))
+    assert len(client.search(COMPANY)) == 20
+
+
+@pytest.mark.parametrize("cookie, token", [("expired", "secret"), (None, "wrong")])
+def test_rejected_credentials_raise_auth_error(volza, bearer, cookie, token):
+    client = make_client(volza)
+    client.load_browser_auth(FakeDriver(cookie or volza.create_session(), token))
+    with pytest.raises(app.VolzaAuthError):
+        client.search(COMPANY)
+    assert volza.counters['api_rejected'] == 1
+
+
+def test_api_search_falls_back_to_browser_on_auth_error(volza, bearer, monkeypatch):
+    monkeypatch.setattr(app, "VOLZA_API_BASE", volza.base_url)
+    session = Session(FakeDriver("expired", "secret"))
+
+    assert app.api_search(session, COMPANY) is None
+    assert session.api is None  # cookies are reloaded from the browser next time
+
+    session.driver = FakeDriver(volza.create_session(), "secret")
+    records = app.api_search(session, COMPANY)
+    assert len(records) == 25
+    assert session.api is not None
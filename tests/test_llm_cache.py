@@ -0,0 +1,37 @@
+"""LLMCache disk tier: least-recently-used eviction and byte accounting"""
+import os
+
+import app
+
+
+def entry_path(cache, key):
+    return cache._path(key)
+
+
+def disk_usage(root) -> int:
+    return sum(os.path.getsize(os.path.join(d, name)) for d, _, files in os.walk(root) for name in files)
+
+
+def test_disk_hit_protects_entry_from_eviction(tmp_path):
+    writer = app.LLMCache(str(tmp_path), ttl=0, max_items=10, max_bytes=1 << 20)
+    for n, key in enumerate(("aa01", "bb02", "cc03")):
+        writer.set(key, "x" * 200)
+        os.utime(entry_path(writer, key), (1000 + n, 1000 + n))  # written oldest first
+    
+    # A fresh process: the oldest entry is read from disk, so it is now the most recently used.
+    # Room for three entries - sizes vary by a few bytes with the timestamp, never by a whole entry
+    cache = app.LLMCache(str(tmp_path), ttl=0, max_items=10, max_bytes=disk_usage(tmp_path) + 50)
+    assert cache.get("aa01") == "x" * 200
+    cache.set("dd04", "x" * 200)
+    
+    assert os.path.exists(entry_path(cache, "aa01"))
+    assert not os.path.exists(entry_path(cache, "bb02"))
+    assert os.path.exists(entry_path(cache, "cc03"))
+
+
+def test_overwrite_counts_replaced_bytes_once(tmp_path):
+    cache = app.LLMCache(str(tmp_path), ttl=0, max_items=10, max_bytes=1 << 20)
+    cache.set("aa01", "x" * 100)
+    for _ in range(3):
+        cache.set("aa01", "y" * 100)
+    assert cache.stats()['disk_bytes'] == disk_usage(tmp_path)
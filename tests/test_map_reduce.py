@@ -0,0 +1,55 @@
+"""Map-reduce extraction when a chunk's JSON reply hits the output token cap"""
+import json
+import re
+
+import pytest
+
+import app
+
+MAX_ROWS_PER_REPLY = 3  # stands in for EXTRACTION_OUTPUT_TOKENS
+
+
+def page_text(rows: int) -> str:
+    return "\n".join(f"05/01/2024 | ACME CHEMICALS | BUYER {n} | Spain | 2915 | 10 | 100" for n in range(rows))
+
+
+def fake_llm_complete(messages, temperature, max_completion_tokens, **kwargs):
+    """Replies with every row of the chunk, cut off mid-JSON past MAX_ROWS_PER_REPLY rows"""
+    chunk = re.search(r'PAGE TEXT \(PART \d+/\d+\):\n(.*?)\n\nList EVERY', messages[-1]['content'], re.DOTALL).group(1)
+    rows = []
+    for line in chunk.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 7:
+            rows.append({"date": "2024-01-05", "shipper": fields[1], "consignee": fields[2], "country": fields[3],
+                         "hs_code": fields[4], "quantity": float(fields[5]), "value": float(fields[6])})
+    reply = json.dumps({"shipments": rows})
+    return reply[:len(reply) // 2] if len(rows) > MAX_ROWS_PER_REPLY else reply
+
+
+@pytest.fixture(autouse=True)
+def fake_llm(monkeypatch):
+    monkeypatch.setattr(app, 'llm_complete', fake_llm_complete)
+
+
+def test_truncated_chunk_is_split_until_every_row_is_extracted():
+    records = app.extract_chunk_shipments(page_text(10), 1, 1, "Acme Chemicals", "acid")
+    assert [r.consignee for r in records] == [f"BUYER {n}" for n in range(10)]
+
+
+def test_unsplittable_unparseable_line_is_logged_as_dropped(monkeypatch, capsys):
+    monkeypatch.setattr(app, 'llm_complete', lambda messages, **kwargs: '{"shipments": [{"shipper": "ACME')
+    assert app.extract_chunk_shipments("one dense line\nanother line", 2, 5, "Acme Chemicals", "acid") is None
+    output = capsys.readouterr().out
+    assert output.count("Chunk 2/5: reply not parseable - dropped") == 2
+
+
+def test_recovered_rows_are_stored_in_history():
+    records = app.recover_page_shipments("Recovered Rows Co", "acid", [], page_text(5))
+    assert app.history_store.shipment_count("Recovered Rows Co") == 5
+    assert sorted(r.consignee for r in records) == [f"BUYER {n}" for n in range(5)]
+
+
+def test_captured_rows_are_not_extracted_again(monkeypatch):
+    monkeypatch.setattr(app, 'llm_complete', lambda *args, **kwargs: pytest.fail("LLM called"))
+    captured = [app.ShipmentRecord(shipper="ACME", consignee="BUYER")]
+    assert app.recover_page_shipments("Acme", "acid", captured, page_text(5)) is captured
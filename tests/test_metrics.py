@@ -0,0 +1,39 @@
+"""/metrics must stay valid Prometheus text exposition on a fresh process"""
+import math
+import re
+
+import pytest
+
+import app
+
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{[^}]*\})? (\S+)$')
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch, tmp_path):
+    (tmp_path / "ab").mkdir()
+    (tmp_path / "ab" / "abcd.json").write_text('{"created": 0, "content": "x"}', encoding="utf-8")
+    cache = app.LLMCache(str(tmp_path), ttl=0, max_items=10, max_bytes=1 << 20)
+    monkeypatch.setattr(app, 'llm_cache', cache)
+    return cache
+
+
+def parse_metrics(text: str) -> dict:
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match, f"not a sample line: {line!r}"
+        value = float(match.group(3))  # raises on "None"
+        assert not math.isnan(value)
+        samples[match.group(1) + (match.group(2) or "")] = value
+    return samples
+
+
+def test_metrics_parse_before_any_cache_write(fresh_cache):
+    response = app.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    samples = parse_metrics(response.get_data(as_text=True))
+    assert samples['volza_llm_cache_disk_bytes'] == len('{"created": 0, "content": "x"}')
+    assert samples['volza_llm_cache_hits_total'] == 0
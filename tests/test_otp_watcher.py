@@ -0,0 +1,74 @@
+"""OtpWatcher (IMAP IDLE) against the fake IMAP server from bench/fakes.py"""
+import socket
+import threading
+import time
+
+import pytest
+
+import app
+from fakes import Mailbox, start_imap_server
+
+SENDER = "otp@volza.test"
+SUBJECT = "OTP"
+
+
+def otp_mail(mailbox: Mailbox, code: str):
+    mailbox.deliver(SENDER, SUBJECT, f"Dear user, your OTP for secure login is {code}. It is valid for 10 minutes.")
+
+
+@pytest.fixture
+def mailbox():
+    return Mailbox()
+
+
+@pytest.fixture
+def watcher(mailbox, monkeypatch):
+    # A missed IDLE push would only be noticed at the next slice: make that visibly slow
+    monkeypatch.setattr(app, 'OTP_IDLE_SLICE', 10)
+    server = start_imap_server(mailbox)
+    watcher = app.OtpWatcher("127.0.0.1", server.server_address[1], "u", "p", SENDER, SUBJECT, use_ssl=False)
+    yield watcher
+    watcher.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_mail_arriving_during_idle(watcher, mailbox):
+    otp_mail(mailbox, "111111")
+    with watcher.armed() as wait_for_code:
+        threading.Timer(0.3, otp_mail, (mailbox, "222222")).start()
+        started = time.time()
+        assert wait_for_code() == "222222"
+    assert time.time() - started < 3
+
+
+def test_mail_older_than_uid_floor_is_ignored(watcher, mailbox):
+    otp_mail(mailbox, "111111")
+    watcher._ensure_connected()
+    uid_floor = watcher._uid_next()
+    assert watcher.wait_for_otp(uid_floor, timeout=0.5) is None
+    otp_mail(mailbox, "333333")
+    assert watcher.wait_for_otp(uid_floor, timeout=5) == "333333"
+
+
+def test_exists_in_same_packet_as_idle_continuation(watcher, mailbox):
+    watcher._ensure_connected()
+    # Arrives after SELECT, so the fake announces it together with "+ idling"
+    otp_mail(mailbox, "444444")
+    started = time.time()
+    watcher._idle(10)
+    assert time.time() - started < 1
+    # The IDLE round was closed cleanly and the connection is still usable
+    assert watcher._conn.noop()[0] == 'OK'
+
+
+def test_failover_records_one_otp_wait_span(monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    watcher = app.OtpWatcher("127.0.0.1", port, "u", "p", SENDER, SUBJECT, use_ssl=False)
+    monkeypatch.setattr(app, 'fetch_latest_otp', lambda sender, subject: "555555")
+    job = app.job_registry.create("otp test")
+    with app.trace_job(job), watcher.armed() as wait_for_code:
+        assert wait_for_code() == "555555"
+    assert [record['stage'] for record in job['trace']].count('otp_wait') == 1
@@ -0,0 +1,57 @@
+"""Offline parsing of recorded Volza result pages"""
+import pytest
+
+import app
+
+
+def read(fixture_path, name):
+    with open(fixture_path(name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_parses_recorded_results(fixture_path):
+    records = app.parse_result_table_html(read(fixture_path, "search_results.html"))
+
+    assert len(records) == 12
+    assert {r.shipper for r in records} == {"GLOBAL KEMYA INDIA LLP"}
+    assert all(r.date and r.consignee and r.country for r in records)
+    first = records[0]
+    assert (first.date, first.consignee, first.country, first.hs_code) == (
+        "2019-01-05", "AL GHURAIR RESOURCES LLC", "United Arab Emirates", "29153100")
+    assert (first.quantity, first.value) == (16000.0, 21440.0)
+
+
+def test_empty_results_page_has_no_records(fixture_path):
+    assert app.parse_result_table_html(read(fixture_path, "search_results_empty.html")) == []
+
+
+def test_columns_mapped_by_header_not_position():
+    headers = ["Value In USD", "Consignee Country", "Consignee", "Shipper", "Std. Quantity", "HS Code", "Date"]
+    mapping = app.map_shipment_columns(headers)
+    assert mapping == {'value': 0, 'country': 1, 'consignee': 2, 'shipper': 3, 'quantity': 4, 'hs_code': 5, 'date': 6}
+
+    [record] = app.rows_to_shipments(headers, [["$1,250.50", "Germany", "BUYER GMBH", "SELLER LLP", "1,000 KGS", "2915", "05-Jan-2019"]])
+    assert record == app.ShipmentRecord("SELLER LLP", "BUYER GMBH", "Germany", "2019-01-05", "2915", 1000.0, 1250.5)
+
+
+def test_country_of_origin_is_not_the_destination():
+    mapping = app.map_shipment_columns(["Shipper", "Country of Origin", "Destination Country"])
+    assert mapping == {'shipper': 0, 'country': 2}
+
+
+@pytest.mark.parametrize("headers, missing", [
+    (["Shipper", "Consignee"], {'date', 'country', 'hs_code', 'quantity', 'value'}),
+    (["Exporter", "Importer", "Qty"], {'date', 'country', 'hs_code', 'value'}),
+])
+def test_missing_columns_are_left_empty(headers, missing):
+    mapping = app.map_shipment_columns(headers)
+    assert missing.isdisjoint(mapping)
+
+    [record] = app.rows_to_shipments(headers, [["SELLER", "BUYER", "5"][:len(headers)]])
+    assert (record.shipper, record.consignee) == ("SELLER", "BUYER")
+    assert record.date is None and record.country == "" and record.value is None
+
+
+def test_unrecognised_headers_give_no_records():
+    assert app.map_shipment_columns(["Foo", "Bar"]) == {}
+    assert app.rows_to_shipments(["Foo", "Bar"], [["a", "b"]]) == []
@@ -0,0 +1,10 @@
+"""Every SSE response carries the no-buffering / no-cache headers"""
+import app
+
+
+def test_query_stream_not_ready_sends_sse_headers():
+    response = app.app.test_client().get('/query_stream?question=hi&job_id=missing')
+    assert response.mimetype == 'text/event-stream'
+    for name, value in app.SSE_HEADERS.items():
+        assert response.headers[name] == value
+    assert "Analysis not complete" in response.get_data(as_text=True)
@@ -0,0 +1,65 @@
+"""Exact trade metrics (aggregate_trade_metrics / format_trade_metrics) on the recorded result table"""
+import pytest
+
+import app
+
+
+@pytest.fixture
+def records(fixture_path):
+    with open(fixture_path("search_results.html"), encoding="utf-8") as f:
+        return app.parse_result_table_html(f.read())
+
+
+def test_totals_and_date_range(records):
+    metrics = app.aggregate_trade_metrics(records)
+    assert metrics['total_shipments'] == 12
+    assert metrics['distinct_consignees'] == 6
+    assert metrics['distinct_countries'] == 6
+    assert metrics['total_quantity'] == 187600.0
+    assert metrics['total_value'] == 239608.0
+    assert (metrics['first_date'], metrics['last_date']) == ("2019-01-05", "2024-04-08")
+
+
+def test_per_country_breakdown(records):
+    by_country = [(c['country'], c['shipments'], c['consignees'], c['quantity'], c['value'])
+                  for c in app.aggregate_trade_metrics(records)['by_country']]
+    assert by_country == [
+        ("Thailand", 3, 1, 64000.0, 82240.0),
+        ("United Arab Emirates", 3, 1, 48000.0, 66080.0),
+        ("Indonesia", 2, 1, 25600.0, 27776.0),
+        ("Kenya", 2, 1, 17600.0, 20672.0),
+        ("Mexico", 1, 1, 18000.0, 25560.0),
+        ("Saudi Arabia", 1, 1, 14400.0, 17280.0),
+    ]
+
+
+def test_per_buyer_breakdown(records):
+    [buyer] = [b for b in app.aggregate_trade_metrics(records)['by_buyer'] if b['consignee'] == "KENPOLY MANUFACTURERS LTD"]
+    assert buyer == {'consignee': "KENPOLY MANUFACTURERS LTD", 'countries': ["Kenya"], 'shipments': 2,
+                     'quantity': 17600.0, 'value': 20672.0, 'first_date': "2020-02-14", 'last_date': "2024-04-08"}
+
+
+def test_parties_are_counted_case_and_space_insensitively():
+    metrics = app.aggregate_trade_metrics([
+        app.ShipmentRecord(consignee="Siam Polymers  Co Ltd", country="thailand"),
+        app.ShipmentRecord(consignee="SIAM POLYMERS CO LTD", country="Thailand"),
+    ])
+    assert (metrics['distinct_consignees'], metrics['distinct_countries']) == (1, 1)
+
+
+def test_formatted_block(records):
+    text = app.format_trade_metrics(app.aggregate_trade_metrics(records))
+    assert "Total Shipments: 12" in text
+    assert "Date Range: 2019-01-05 to 2024-04-08" in text
+    assert "Total Value (USD): 239,608.00" in text
+    assert "- Thailand: 3 shipments, 1 consignees, USD 82,240.00" in text
+
+
+def test_empty_input():
+    metrics = app.aggregate_trade_metrics([])
+    assert metrics == {
+        'total_shipments': 0, 'distinct_consignees': 0, 'distinct_countries': 0,
+        'total_quantity': 0.0, 'total_value': 0.0, 'first_date': None, 'last_date': None,
+        'by_country': [], 'by_buyer': [],
+    }
+    assert "Date Range: unknown to unknown" in app.format_trade_metrics(metrics)